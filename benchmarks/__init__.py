@@ -0,0 +1,3 @@
+"""
+Benchmarks of the client, run against a local stub server (See run.py & stub_server.py)
+"""
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark of the JSON decoding of a large media list (like get_medias() on a big account):
+the previous path json.loads(response.text) against the bytes path of treat_response() with every parser installed.
+
+Usage: python3 benchmarks/bench_json.py [--medias 50000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from requests.models import Response
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from smart_prospective_api.json_backend import BACKEND, BACKENDS, get_loads  # noqa: E402
+from smart_prospective_api.network import treat_response  # noqa: E402
+
+
+def build_body(count):
+    """
+        :param count int: The number of medias
+        :rtype: bytes
+        :return: A JSON body like the one of the "medias" resource
+    """
+    medias = [{
+        "code": f"med_{i:08d}",
+        "name": f"Média n°{i} – campagne été",
+        "category": "file",
+        "enable": bool(i % 2),
+        "duration": 15 + i % 30,
+        "tags": [{"code": f"tag_{i % 20}", "name": f"tag {i % 20}"}],
+        "materials": [f"mat_{j}" for j in range(i % 5)],
+        "hidden_details": {"created_at": "2021-03-04T10:20:30Z", "size": 1024 * i, "url": f"https://cdn.example.com/{i}.mp4"},
+    } for i in range(count)]
+    return json.dumps({"medias": medias}).encode("utf-8")
+
+
+def build_response(body):
+    """
+        :rtype: requests.Response
+        :return: A response with this body and no declared charset (like the server responses)
+    """
+    response = Response()
+    response.status_code = 200
+    response.url = "https://app.smartprospective.com/api/medias"
+    response.headers["Content-Type"] = "application/json"
+    response._content = body
+    return response
+
+
+def measure(function, body, repeat):
+    """
+        :rtype: float
+        :return: The best time of the function on a fresh response (seconds)
+    """
+    timings = []
+    for _ in range(repeat):
+        response = build_response(body)
+        started_at = time.perf_counter()
+        function(response)
+        timings.append(time.perf_counter() - started_at)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--medias", type=int, default=50000, help="The number of medias in the response")
+    parser.add_argument("--repeat", type=int, default=5, help="The number of runs (the best one is kept)")
+    args = parser.parse_args()
+
+    body = build_body(args.medias)
+    print(f"Body: {args.medias} medias, {len(body) / 1024 / 1024:.1f} MB (default backend: {BACKEND})")
+    baseline = measure(lambda response: json.loads(response.text), body, args.repeat)
+    print(f"{'json.loads(response.text)':<36}{baseline * 1000:>10.1f} ms")
+    for backend in BACKENDS:
+        try:
+            loads = get_loads(backend)
+        except ImportError:
+            print(f"{backend + ' (bytes)':<36}{'not installed':>13}")
+            continue
+        seconds = measure(lambda response: loads(response.content), body, args.repeat)
+        print(f"{backend + ' (bytes)':<36}{seconds * 1000:>10.1f} ms  x{baseline / seconds:.2f}")
+    seconds = measure(treat_response, body, args.repeat)
+    print(f"{'treat_response()':<36}{seconds * 1000:>10.1f} ms  x{baseline / seconds:.2f}")
+
+
+if __name__ == "__main__":
+    main()
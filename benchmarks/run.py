@@ -0,0 +1,219 @@
+"""
+Benchmarks of the client against the local stub server (See stub_server.py), started in its own process:
+list fetches (get_medias, iter_medias), bulk edits (batch of edit_media), uploads & downloads.
+Every scenario reports its throughput, its latency percentiles and the peak memory of the client (tracemalloc, measured in a separate run
+so the timings are not slowed down). The results are written as JSON to compare the versions (--baseline).
+
+Usage: python3 benchmarks/run.py [--medias 10000] [--latency 0.01] [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.stub_server import serve, DEFAULT_MEDIAS, DEFAULT_MEDIA_SIZE, DEFAULT_DOWNLOAD_SIZE  # noqa: E402
+from smart_prospective_api import SPApi, __version__  # noqa: E402
+from smart_prospective_api.json_backend import BACKEND  # noqa: E402
+
+SCENARIOS = ("get_medias", "iter_medias", "edit_medias", "upload", "download")
+
+
+def percentile(values, percent):
+    """
+        :param values [float]: The sorted values
+        :param percent float: The percentile (e.g: 95)
+        :rtype: float
+    """
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def summarize(latencies, seconds, items, bytes_count):
+    """
+        :param latencies [float]: The duration of every operation (seconds)
+        :param seconds float: The total duration of the operations
+        :param items int: The number of items processed (e.g: the medias edited)
+        :param bytes_count int: The number of bytes transferred (uploads & downloads)
+        :rtype: {...}
+        :return: The result of a scenario
+    """
+    latencies = sorted(latencies)
+    result = {
+        "operations": len(latencies),
+        "seconds": seconds,
+        "operations_per_second": len(latencies) / seconds,
+        "items_per_second": items / seconds,
+        "latency": {
+            "min": latencies[0],
+            "mean": sum(latencies) / len(latencies),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1],
+        },
+    }
+    if bytes_count:
+        result["megabytes_per_second"] = bytes_count / seconds / 1024 / 1024
+    return result
+
+
+class Benchmark:
+    """
+    The scenarios, run with a client of the stub server: every scenario is an operation returning (items processed, bytes transferred)
+
+    :param argparse.Namespace args: The options of the run
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.directory = tempfile.mkdtemp(prefix="sp-benchmark-")
+        self.upload_file = os.path.join(self.directory, "upload.bin")
+        with open(self.upload_file, "wb") as f:
+            f.write(os.urandom(args.upload_size))
+        self.sp_api = SPApi("pub_benchmark", "sec_benchmark", pool_maxsize=args.workers)
+        self.media_codes = [f"med_{i:08d}" for i in range(args.edits)]
+
+    def get_medias(self):
+        return len(self.sp_api.get_medias()), 0
+
+    def iter_medias(self):
+        return sum(1 for _ in self.sp_api.iter_medias()), 0
+
+    def edit_medias(self):
+        results = self.sp_api.batch("edit_media", ({"code": code, "name": "benchmark"} for code in self.media_codes),
+                                    max_workers=self.args.workers)
+        failures = [result.error for result in results if not result.success]
+        if failures:
+            raise RuntimeError(f"{len(failures)} edit(s) failed: {failures[0]}")
+        return len(self.media_codes), 0
+
+    def upload(self):
+        self.sp_api.upload_media_template_file(self.upload_file)
+        return 1, self.args.upload_size
+
+    def download(self):
+        filename = self.sp_api.download_src_media("med_00000000", filename=os.path.join(self.directory, "download"))
+        size = os.path.getsize(filename)
+        # Removed, otherwise the next download is skipped (identical local file)
+        os.remove(filename)
+        return 1, size
+
+    def run(self, name):
+        """
+            :param name str: The scenario (See SCENARIOS)
+            :rtype: {...}
+            :return: The result of the scenario (See summarize())
+        """
+        operation = getattr(self, name)
+        operation()  # Warm up: login, connections
+        latencies = []
+        items = bytes_count = 0
+        started_at = time.perf_counter()
+        for _ in range(self.args.iterations):
+            operation_started_at = time.perf_counter()
+            operation_items, operation_bytes = operation()
+            latencies.append(time.perf_counter() - operation_started_at)
+            items += operation_items
+            bytes_count += operation_bytes
+        result = summarize(latencies, time.perf_counter() - started_at, items, bytes_count)
+        tracemalloc.start()
+        try:
+            operation()
+            result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result
+
+
+def start_server(args):
+    """
+        Start the stub server in its own process (its memory & CPU are not measured with the client)
+
+        :rtype: (multiprocessing.Process, str)
+        :return: The process & the url of the server
+    """
+    ready = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve, kwargs={
+        "ready": ready,
+        "medias": args.medias,
+        "media_size": args.media_size,
+        "download_size": args.download_size,
+        "latency": args.latency,
+    }, daemon=True)
+    process.start()
+    return process, ready.get(timeout=60)
+
+
+def compare(results, baseline):
+    """
+        Print the change of every scenario against a previous run (throughput, p95 latency & peak memory)
+
+        :param results {...}: The results of this run
+        :param baseline {...}: The results of the previous run
+    """
+    print(f"\nCompared to {baseline['version']} ({baseline['timestamp']}):")
+    for name, result in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if not previous:
+            continue
+        throughput = result["items_per_second"] / previous["items_per_second"] - 1
+        latency = result["latency"]["p95"] / previous["latency"]["p95"] - 1
+        memory = result["peak_memory_bytes"] / max(1, previous["peak_memory_bytes"]) - 1
+        print(f"{name:<14}throughput {throughput:+8.1%}   p95 latency {latency:+8.1%}   peak memory {memory:+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS, help="The scenarios to run")
+    parser.add_argument("--iterations", type=int, default=10, help="The number of runs of every scenario")
+    parser.add_argument("--medias", type=int, default=DEFAULT_MEDIAS, help="The number of medias of the list fetches")
+    parser.add_argument("--media-size", type=int, default=DEFAULT_MEDIA_SIZE, help="The approximate size of a media (bytes)")
+    parser.add_argument("--edits", type=int, default=200, help="The number of medias edited per bulk edit")
+    parser.add_argument("--workers", type=int, default=16, help="The number of threads of the bulk edits")
+    parser.add_argument("--upload-size", type=int, default=DEFAULT_DOWNLOAD_SIZE, help="The size of the uploaded file (bytes)")
+    parser.add_argument("--download-size", type=int, default=DEFAULT_DOWNLOAD_SIZE, help="The size of the downloaded file (bytes)")
+    parser.add_argument("--latency", type=float, default=0.0, help="The latency added by the server to every response (seconds)")
+    parser.add_argument("--output", help="Write the results into this JSON file")
+    parser.add_argument("--baseline", help="Compare the results with a previous JSON file")
+    args = parser.parse_args()
+
+    process, url = start_server(args)
+    os.environ["SMART_PROSPECTIVE_SERVER"] = url
+    try:
+        benchmark = Benchmark(args)
+        results = {
+            "version": __version__,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json_backend": BACKEND,
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+            "scenarios": {},
+        }
+        print(f"{'scenario':<14}{'items/s':>12}{'MB/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'peak MB':>10}")
+        for name in args.scenarios:
+            result = results["scenarios"][name] = benchmark.run(name)
+            print(f"{name:<14}{result['items_per_second']:>12.1f}{result.get('megabytes_per_second', 0):>10.1f}"
+                  f"{result['latency']['p50'] * 1000:>10.1f}{result['latency']['p95'] * 1000:>10.1f}"
+                  f"{result['peak_memory_bytes'] / 1024 / 1024:>10.1f}")
+        benchmark.sp_api.close()
+        shutil.rmtree(benchmark.directory, ignore_errors=True)
+    finally:
+        process.terminate()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Local stand-in of the Smart Prospective server for the benchmarks (no credentials, no network):
+implements the endpoints used by the client (login, logout, the collections, the add/edit calls, medias/upload, medias/download/*,
+materials/reboot...) with configurable payload sizes and an injected latency.
+
+Usage: python3 benchmarks/stub_server.py [--port 8000] [--medias 10000] [--media-size 500] [--latency 0.02]
+       then SMART_PROSPECTIVE_SERVER=http://127.0.0.1:8000 python3 your_script.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_MEDIAS = 10000
+DEFAULT_MEDIA_SIZE = 500
+DEFAULT_DOWNLOAD_SIZE = 8 * 1024 * 1024
+DEFAULT_ENTITIES = 100
+# The size of the chunks read from the uploaded bodies & written into the downloaded files
+CHUNK_SIZE = 1024 * 1024
+# The keys of the entity returned by the add/edit calls
+ADDED_KEYS = {"users": "user", "materials": "material", "material-groups": "materialgroup", "medias": "media",
+              "webviewtemplates": "webviewtemplate"}
+
+
+def build_collections(medias=DEFAULT_MEDIAS, media_size=DEFAULT_MEDIA_SIZE, entities=DEFAULT_ENTITIES):
+    """
+        :param medias int: The number of medias
+        :param media_size int: The approximate size of a media in the JSON response (bytes)
+        :param entities int: The number of users, materials, material groups & buildings
+        :rtype: {str: [{...}]}
+        :return: The collections returned by the GET resources
+    """
+    padding = "x" * max(0, media_size - 250)
+    return {
+        "users": [{"code": f"usr_{i:06d}", "name": f"user {i}", "email": f"user{i}@example.com"} for i in range(entities)],
+        "materials": [{"code": f"mat_{i:06d}", "name": f"screen {i}", "building": f"bld_{i % 10:06d}", "status": "online"}
+                      for i in range(entities)],
+        "materialgroups": [{"code": f"grp_{i:06d}", "name": f"group {i}", "materials": [f"mat_{i:06d}"]} for i in range(entities)],
+        "buildings": [{"code": f"bld_{i:06d}", "name": f"building {i}", "city": "Paris"} for i in range(entities)],
+        "medias": [{
+            "code": f"med_{i:08d}",
+            "name": f"Média n°{i}",
+            "category": "file",
+            "enable": bool(i % 2),
+            "duration": 15 + i % 30,
+            "tags": [f"tag_{i % 20}"],
+            "materials": [f"mat_{j:06d}" for j in range(i % 5)],
+            "comment": padding,
+            "hidden_details": json.dumps({"size": 1024 * i, "url": f"https://cdn.example.com/{i}.mp4"}),
+        } for i in range(medias)],
+        "webviewtemplates": [{"code": f"wvt_{i:06d}", "name": f"template {i}"} for i in range(10)],
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers & the body are written separately: without it, every response waits for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _wait(self):
+        latency = self.server.latency
+        if latency:
+            time.sleep(latency * random.uniform(1 - self.server.jitter, 1 + self.server.jitter))
+
+    def _send(self, body, status=200, headers=None, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, obj, status=200):
+        self._send(json.dumps(obj).encode("utf-8"), status=status)
+
+    def _read_body(self):
+        """
+            :rtype: (bytes, int)
+            :return: The start of the body (the form fields, at most 1 chunk) & its size, the body is read by chunks (uploads)
+        """
+        remaining = int(self.headers.get("Content-Length") or 0)
+        size = remaining
+        head = b""
+        while remaining:
+            chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if not head:
+                head = chunk
+            remaining -= len(chunk)
+        return head, size
+
+    def do_GET(self):
+        self._wait()
+        path = self.path.split("?")[0][len("/api/"):]
+        key = {"material-groups": "materialgroups"}.get(path, path)
+        body = self.server.bodies.get(key)
+        if body is None:
+            return self._json({"error": f"Unknown resource {path}"}, status=404)
+        if self.server.changing:
+            # A new revision on every response, so the client cannot skip the parsing of an unchanged body
+            with self.server.lock:
+                self.server.revision += 1
+                revision = self.server.revision
+            body = body[:-1] + f', "revision": {revision}}}'.encode()
+        self._send(body)
+
+    def do_POST(self):
+        head, size = self._read_body()
+        self._wait()
+        path = self.path[len("/api/"):]
+        if path == "login":
+            return self._json({"token": "benchmark-token"})
+        if path == "logout":
+            return self._json({})
+        if path.startswith("medias/upload"):
+            return self._json({"file": {"code": f"fil_{hashlib.md5(head).hexdigest()[:12]}", "url": "https://cdn.example.com/file",
+                                        "size": size}})
+        if path.startswith("medias/download"):
+            return self._download()
+        resource, _, action = path.partition("/")
+        if action.startswith(("add", "edit")) and resource in ADDED_KEYS:
+            return self._json({ADDED_KEYS[resource]: {"code": f"{resource[:3]}_new", "name": "benchmark"}})
+        return self._json({"status": True})
+
+    def _download(self):
+        data = self.server.download
+        start = 0
+        status = 200
+        headers = {"Content-Disposition": "attachment; filename=media.mp4", "Accept-Ranges": "bytes"}
+        match = re.match(r"bytes=(\d+)-", self.headers.get("Range") or "")
+        if match:
+            start = int(match.group(1))
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+        self.send_response(status)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Content-Length", str(len(data) - start))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        view = memoryview(data)
+        for offset in range(start, len(data), CHUNK_SIZE):
+            self.wfile.write(view[offset:offset + CHUNK_SIZE])
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    The stub server: the responses of the collections are encoded once, the downloads are random bytes.
+
+    :param int port: The port to listen on (0 for a free one, See server_port)
+    :param int medias: The number of medias returned by "medias"
+    :param int media_size: The approximate size of a media (bytes)
+    :param int entities: The number of users, materials, material groups & buildings
+    :param int download_size: The size of the downloaded files (bytes)
+    :param float latency: The latency added to every response (seconds)
+    :param float jitter: The random variation of the latency (0.1 = +/- 10%)
+    :param bool changing: If True, every collection response is different (See do_GET())
+    """
+    daemon_threads = True
+
+    def __init__(self, port=0, medias=DEFAULT_MEDIAS, media_size=DEFAULT_MEDIA_SIZE, entities=DEFAULT_ENTITIES,
+                 download_size=DEFAULT_DOWNLOAD_SIZE, latency=0.0, jitter=0.1, changing=True):
+        super(StubServer, self).__init__(("127.0.0.1", port), StubHandler)
+        self.bodies = {key: json.dumps({key: value}).encode("utf-8")
+                       for key, value in build_collections(medias, media_size, entities).items()}
+        self.download = os.urandom(download_size)
+        self.latency = latency
+        self.jitter = jitter
+        self.changing = changing
+        self.revision = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        """
+            :rtype: str
+            :return: The value of SMART_PROSPECTIVE_SERVER for this server
+        """
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+def serve(ready=None, **kwargs):
+    """
+        Run a stub server until the process is stopped (target of the benchmark process)
+
+        :param ready multiprocessing.Queue/None: Receive the url of the server once it listens
+        :param kwargs: See StubServer
+    """
+    server = StubServer(**kwargs)
+    if ready is not None:
+        ready.put(server.url)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8000, help="The port to listen on")
+    parser.add_argument("--medias", type=int, default=DEFAULT_MEDIAS, help="The number of medias")
+    parser.add_argument("--media-size", type=int, default=DEFAULT_MEDIA_SIZE, help="The approximate size of a media (bytes)")
+    parser.add_argument("--entities", type=int, default=DEFAULT_ENTITIES, help="The number of users, materials, groups & buildings")
+    parser.add_argument("--download-size", type=int, default=DEFAULT_DOWNLOAD_SIZE, help="The size of the downloaded files (bytes)")
+    parser.add_argument("--latency", type=float, default=0.0, help="The latency added to every response (seconds)")
+    args = parser.parse_args()
+
+    server = StubServer(port=args.port, medias=args.medias, media_size=args.media_size, entities=args.entities,
+                        download_size=args.download_size, latency=args.latency)
+    print(f"Stub server listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
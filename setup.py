@@ -15,4 +15,6 @@ setup(name='smart-prospective-api',
       license='MIT',
       packages=['smart_prospective_api'],
       install_requires=['requests'],
+      extras_require={'async': ['aiohttp'], 'speedups': ['orjson']},
+      entry_points={'console_scripts': ['smart-prospective-api=smart_prospective_api.cli:main']},
       zip_safe=False)
@@ -1,4 +1,17 @@
 from .client import SPApi
-from .exceptions import APIError
+from .async_client import AsyncSPApi
+from .batch import BatchResult
+from .cache import TTLCache
+from .downloads import DownloadManager
+from .exceptions import APIError, AuthenticationError
+from .models import Entity
+from .log import set_json_logs
+from .metrics import MetricsCollector, Observer
+from .ratelimit import RateLimiter
+from .retry import RetryPolicy
+from .store import EntityStore
+from .sync import SyncEngine
+from .token_store import TokenStore, FileTokenStore
+from .upload_cache import UploadCache
 
 __version__ = "1.3.0"
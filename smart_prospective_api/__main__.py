@@ -1,3 +1,8 @@
+import sys
+
+from .cli import main
+
+
 def doc():
     print("""This python library is made to connect to Smart Prospective API, in order to manage your:
 - Account
@@ -16,8 +21,13 @@ def doc():
 - Interventions
 
 Documentation & Samples: https://github.com/smart-prospective/smart-prospective-api
+Command line (bulk operations): python3 -m smart_prospective_api --help
 """)
 
 
 if __name__ == "__main__":
-    doc()
+    if len(sys.argv) < 2:
+        # Only the presentation of the library, the usage of the commands is given by --help
+        doc()
+        sys.exit(0)
+    sys.exit(main())
@@ -0,0 +1,616 @@
+import asyncio
+
+from .async_network import *
+from .network import is_rejected
+from .exceptions import APIError, AuthenticationError
+from .log import getLogger
+from .decorators import is_login, supported_parameters, cached, invalidates, updates_store
+from .models import to_models
+from .store import EntityStore
+from .cache import COLLECTIONS
+from .upload_cache import UploadCache
+from .parameters import USER_SCHEMA, MATERIAL_SCHEMA, MATERIALGROUP_SCHEMA, ADD_MEDIA_SCHEMA, EDIT_MEDIA_SCHEMA, convert_media_parameters
+
+
+class AsyncSPApi():
+    """
+    Asyncio client for the Smart Prospective API, same methods as SPApi (as coroutines).
+    Requires aiohttp: python3 -m pip install smart-prospective-api[async]
+
+    Usage:
+        async with AsyncSPApi("pub_...", "sec_...") as sp_api:
+            medias = await sp_api.get_medias()
+    """
+    token = None
+    api_public_key = None
+    api_secret_key = None
+    transport = None
+    upload_cache = None
+    cache = None
+    entity_store = None
+    token_store = None
+    models = False
+
+    def __init__(self, api_public_key, api_secret_key, limit=DEFAULT_LIMIT, limit_per_host=DEFAULT_LIMIT_PER_HOST,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, upload_cache=None, cache=None, retry_policy=None,
+                 rate_limiter=None, token_store=None,
+                 models=False, observers=None, conditional_requests=True):
+        """
+            :param api_public_key str: The API public key (starts by "pub_")
+            :param api_secret_key str: The API secret key (starts by "sec_")
+            :param limit int: The max number of connections of the pool
+            :param limit_per_host int: The max number of connections per host
+            :param max_concurrency int: The max number of requests in flight at once
+            :param upload_cache UploadCache/None: If set, the files already uploaded (same content) are not uploaded again
+            :param cache TTLCache/None: If set, the collections (get_medias(), get_materials()...) are cached until they expire or are modified
+            :param retry_policy RetryPolicy/None: The retry policy of the requests (default: RetryPolicy(), See RetryPolicy.stats for the retry counts)
+            :param rate_limiter RateLimiter/None: If set, the requests are rate limited (can be shared with other instances & processes)
+            :param token_store TokenStore/None: If set, the token is shared with the other instances & processes using this store (e.g: FileTokenStore())
+            :param models bool: If True, the collections (get_medias(), iter_medias()...) are compact models instead of dicts (See models.Entity)
+            :param observers [Observer]/None: The observers of the requests, e.g: [MetricsCollector()] (See metrics.Observer)
+            :param conditional_requests bool: If True, the getters send conditional requests (ETag/Last-Modified), an unchanged collection
+                                              is not downloaded nor parsed again (its last result is kept in memory)
+        """
+        self.api_public_key = api_public_key
+        self.api_secret_key = api_secret_key
+        self.transport = AsyncTransport(limit=limit, limit_per_host=limit_per_host, max_concurrency=max_concurrency,
+                                        retry_policy=retry_policy, rate_limiter=rate_limiter, observers=observers,
+                                        conditional_requests=conditional_requests)
+        self.upload_cache = upload_cache
+        self.cache = cache
+        self.token_store = token_store
+        self.models = models
+        self._login_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """
+            Close the pooled connections of this instance
+        """
+        await self.transport.close()
+
+    def invalidate(self, *collections):
+        """
+            Invalidate the cached collections of this instance (if a cache is set)
+
+            :param collections str: The collections to invalidate (e.g: "medias"), all if none given
+        """
+        if self.cache is not None:
+            for collection in collections or COLLECTIONS:
+                self.cache.invalidate((collection, self.api_public_key))
+
+    def _to_models(self, collection, entities):
+        """
+            :param collection str: The collection of the entities (e.g: "medias")
+            :param entities [{...}]/async iter({...}): The entities returned by the API
+            :return: The entities converted into models if enabled (See models.to_models()), unchanged otherwise
+        """
+        return to_models(collection, entities) if self.models else entities
+
+    async def store(self, refresh=False):
+        """
+            Get the indexed in-memory copy of the collections (loaded on the first call, then kept in sync by the add/edit/delete calls)
+            Note: enable_media/disable_media are not reflected in the stored medias (the indexes are not affected), use refresh=True
+
+            :param refresh bool: If True, load the collections again
+            :raise APIError: On any error
+            :rtype: EntityStore
+        """
+        if self.entity_store is None or refresh:
+            collections = await asyncio.gather(self.get_users(), self.get_materials(), self.get_materialgroups(), self.get_buildings(),
+                                               self.get_medias(), self.get_webviewtemplates())
+            entity_store = EntityStore()
+            entity_store.load(dict(zip(COLLECTIONS, collections)))
+            self.entity_store = entity_store
+        return self.entity_store
+
+    async def login(self):
+        """
+            Login the user, in order to get a token using the api_public_key & api_secret_key.
+            If the token is already present, no login is performed.
+            The concurrent calls wait for the same login.
+            With a token store, its token is used if any, otherwise the new token is saved into it
+            (the store is not locked during the login, the event loop would be blocked)
+
+            :raise APIError: On any error
+            :rtype: str
+            :return: The API token, valid until logout or timeout
+        """
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        async with self._login_lock:
+            if self.token:
+                getLogger().debug("AsyncSPApi: Already connected")
+                return self.token
+            loop = asyncio.get_running_loop()
+            if self.token_store is not None:
+                self.token = await loop.run_in_executor(None, self.token_store.get, self.api_public_key)
+                if self.token:
+                    getLogger().debug("AsyncSPApi: Token found in the token store")
+                    return self.token
+            self.token = (await default_post({
+                "api_public_key": self.api_public_key,
+                "api_secret_key": self.api_secret_key
+            }, "login", self.transport, idempotent=True))["token"]
+            if self.token_store is not None:
+                await loop.run_in_executor(None, self.token_store.set, self.api_public_key, self.token)
+        return self.token
+
+    async def _forget_token(self, token):
+        """
+            Forget a token rejected by the server (or logged out), in this instance & in the token store
+
+            :param token str: The token to forget (ignored if the instance already has another one)
+        """
+        if token and self.token == token:
+            self.token = None
+        if token and self.token_store is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.token_store.delete, self.api_public_key, token)
+
+    async def _stream(self, resource, key, chunk_size):
+        """
+            Stream a collection (See stream_get()): the request is sent on the first iteration, so a rejected token is handled here
+            (login again and replay once, like @is_login)
+
+            :param resource str: The resource of the collection (e.g: "material-groups")
+            :param key str: The key of the array in the response (e.g: "materialgroups")
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :rtype: async iter({...})
+        """
+        for attempt in range(2):
+            if not self.token:
+                await self.login()
+            token = self.token
+            items = stream_get(token, resource, key, self.transport, chunk_size=chunk_size)
+            try:
+                # The token is checked before the first item: no item is yielded twice
+                async for item in items:
+                    yield item
+                return
+            except AuthenticationError:
+                await self._forget_token(token)
+                if attempt:
+                    raise
+                getLogger().warning("AsyncSPApi: Token rejected while streaming %s, login again and replay the call", resource)
+            finally:
+                await items.aclose()
+
+    async def logout(self):
+        """
+            Logout the user, in order to get release the token.
+            The token must be set already present (or in the token store), no login is performed.
+            A token already rejected by the server (expired) is only forgotten.
+
+            :raise APIError: On any error
+        """
+        token = self.token
+        if not token and self.token_store is not None:
+            token = await asyncio.get_running_loop().run_in_executor(None, self.token_store.get, self.api_public_key)
+        if not token:
+            return
+        try:
+            await default_post({"token": token}, "logout", self.transport)
+        except AuthenticationError:
+            getLogger().info("AsyncSPApi.logout: The token is already expired")
+        await self._forget_token(token)
+
+    # Users
+    @cached("users")
+    @is_login
+    async def get_users(self):
+        """
+            Get all the users link to this user.
+
+            :raise APIError: On any error
+            :rtype: [{...}]
+            :return: The list of users
+        """
+        return self._to_models("users", (await default_get(self.token, "users", self.transport))["users"])
+
+    @is_login
+    async def iter_users(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the users: they are parsed one by one while the response is read, in constant memory (not cached).
+            Usage: async for entity in await sp_api.iter_users(): ...
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: async iter({...})
+            :return: The users
+        """
+        return self._to_models("users", self._stream("users", "users", chunk_size))
+
+    @is_login
+    @invalidates("users")
+    @updates_store("users")
+    @supported_parameters(USER_SCHEMA)
+    async def add_user(self, **kwargs):
+        kwargs["token"] = self.token
+        user = (await default_post(kwargs, "users/add", self.transport))["user"]
+        getLogger().info("User %s created!", user["name"])
+        return user
+
+    @is_login
+    @invalidates("users")
+    @updates_store("users", remove=True)
+    async def delete_user(self, code):
+        await default_post({
+            "token": self.token,
+            "user_code": code
+        }, "users/remove", self.transport)
+        getLogger().info("User %s deleted!", code)
+
+    # Materials
+    @cached("materials")
+    @is_login
+    async def get_materials(self):
+        """
+            Get all the materials.
+
+            :raise APIError: On any error
+            :rtype: [{...}]
+            :return: The list of materials
+        """
+        return self._to_models("materials", (await default_get(self.token, "materials", self.transport))["materials"])
+
+    @is_login
+    async def iter_materials(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the materials: they are parsed one by one while the response is read, in constant memory (not cached).
+            Usage: async for entity in await sp_api.iter_materials(): ...
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: async iter({...})
+            :return: The materials
+        """
+        return self._to_models("materials", self._stream("materials", "materials", chunk_size))
+
+    @is_login
+    @invalidates("materials")
+    @updates_store("materials")
+    @supported_parameters(MATERIAL_SCHEMA)
+    async def add_material(self, **kwargs):
+        kwargs["token"] = self.token
+        material = (await default_post(kwargs, "materials/add", self.transport))["material"]
+        getLogger().info("Material %s created!", material["name"])
+        return material
+
+    @is_login
+    async def reboot_material(self, code):
+        status = (await default_post({
+            "token": self.token,
+            "material_code": code
+        }, "materials/reboot", self.transport, idempotent=True))["status"]
+        if status:
+            getLogger().info("Material %s will reboot!", code)
+        else:
+            getLogger().warning("Material %s has already been asked to reboot, need to wait!", code)
+        return status
+
+    @is_login
+    async def refresh_material(self, code):
+        status = (await default_post({
+            "token": self.token,
+            "material_code": code
+        }, "materials/refresh", self.transport, idempotent=True))["status"]
+        if status:
+            getLogger().info("Material %s will be refreshed!", code)
+        else:
+            getLogger().warning("Material %s has already been asked to refresh, need to wait!", code)
+        return status
+
+    # Material Groups
+    @cached("materialgroups")
+    @is_login
+    async def get_materialgroups(self):
+        """
+            Get all the materialgroups.
+
+            :raise APIError: On any error
+            :rtype: [{...}]
+            :return: The list of materialgroups
+        """
+        return self._to_models("materialgroups", (await default_get(self.token, "material-groups", self.transport))["materialgroups"])
+
+    @is_login
+    async def iter_materialgroups(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the materialgroups: they are parsed one by one while the response is read, in constant memory (not cached).
+            Usage: async for entity in await sp_api.iter_materialgroups(): ...
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: async iter({...})
+            :return: The materialgroups
+        """
+        return self._to_models("materialgroups", self._stream("material-groups", "materialgroups", chunk_size))
+
+    @is_login
+    @invalidates("materialgroups")
+    @updates_store("materialgroups")
+    @supported_parameters(MATERIALGROUP_SCHEMA)
+    async def add_materialgroup(self, **kwargs):
+        kwargs["token"] = self.token
+        materialgroup = (await default_post(kwargs, "material-groups/add", self.transport))["materialgroup"]
+        getLogger().info("Material Group %s created!", materialgroup["name"])
+        return materialgroup
+
+    @is_login
+    @invalidates("materialgroups")
+    @updates_store("materialgroups", remove=True)
+    async def delete_materialgroup(self, code):
+        await default_post({
+            "token": self.token,
+            "materialgroup_code": code
+        }, "material-groups/remove", self.transport)
+        getLogger().info("User %s deleted!", code)
+
+    # Buildings
+    @cached("buildings")
+    @is_login
+    async def get_buildings(self):
+        """
+            Get all the buildings.
+
+            :raise APIError: On any error
+            :rtype: [{...}]
+            :return: The list of buildings
+        """
+        return self._to_models("buildings", (await default_get(self.token, "buildings", self.transport))["buildings"])
+
+    @is_login
+    async def iter_buildings(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the buildings: they are parsed one by one while the response is read, in constant memory (not cached).
+            Usage: async for entity in await sp_api.iter_buildings(): ...
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: async iter({...})
+            :return: The buildings
+        """
+        return self._to_models("buildings", self._stream("buildings", "buildings", chunk_size))
+
+    # Media
+
+    @cached("medias")
+    @is_login
+    async def get_medias(self):
+        """
+            Get all the medias.
+
+            :raise APIError: On any error
+            :rtype: [{...}]
+            :return: The list of medias
+        """
+        return self._to_models("medias", (await default_get(self.token, "medias", self.transport))["medias"])
+
+    @is_login
+    async def iter_medias(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the medias: they are parsed one by one while the response is read, in constant memory (not cached).
+            Usage: async for entity in await sp_api.iter_medias(): ...
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: async iter({...})
+            :return: The medias
+        """
+        return self._to_models("medias", self._stream("medias", "medias", chunk_size))
+
+    async def _upload(self, file, resource, progress=None, use_cache=True):
+        """
+            Upload a file, streamed by chunks, or reuse the file already uploaded with the same content (if upload_cache is set)
+            The file is hashed & the upload cache (sqlite) is read & written outside of the event loop (executor).
+
+            :param file str: The path of the file to upload
+            :param resource str: The upload resource (e.g: "medias/upload")
+            :param progress callable/None: Called while sending with (bytes_sent, total_bytes)
+            :param use_cache bool: If False, always upload the file (the cache is updated)
+            :raise APIError: On any error
+            :rtype: ({...}, bool)
+            :return: The file returned by the server & True if it comes from the cache
+        """
+        key = None
+        loop = asyncio.get_running_loop()
+        if self.upload_cache:
+            key = await loop.run_in_executor(None, UploadCache.hash_file, file)
+            uploaded = await loop.run_in_executor(None, self.upload_cache.get, self.api_public_key, resource, key) if use_cache else None
+            if uploaded:
+                getLogger().debug("AsyncSPApi: %s already uploaded, reuse %s", file, uploaded)
+                return uploaded, True
+        uploaded = (await upload_file({
+            "token": self.token
+        }, resource, self.transport, file, progress=progress))["file"]
+        if key and uploaded:
+            await loop.run_in_executor(None, self.upload_cache.set, self.api_public_key, resource, key, uploaded)
+        return uploaded, False
+
+    async def _upload_media_file(self, file, caller, progress=None, use_cache=True):
+        """
+            Upload a media file (1st request of add_media/edit_media with a file)
+
+            :param file str: The path of the file to upload
+            :param caller str: The name of the calling method (for the logs)
+            :param progress callable/None: Called while sending with (bytes_sent, total_bytes)
+            :param use_cache bool: If False, always upload the file
+            :raise APIError: On any error
+            :rtype: (str, bool)
+            :return: The file_input code to use in the media call & True if it comes from the upload cache
+        """
+        uploaded, from_cache = await self._upload(file, "medias/upload", progress=progress, use_cache=use_cache)
+        file_input = uploaded.get("code") if uploaded else None
+        if not file_input:
+            getLogger().error("AsyncSPApi.%s: Error from file upload\nFile after upload:%s", caller, file_input)
+            raise APIError(f"Failure on file upload")
+        return file_input, from_cache
+
+    async def _post_media(self, kwargs, resource, caller):
+        """
+            Perform a media call (add/edit): upload the file if given, convert the fields & post the media
+
+            :param kwargs {...}: The parameters of the call
+            :param resource str: The media resource (e.g: "medias/add/file")
+            :param caller str: The name of the calling method (for the logs)
+            :raise APIError: On any error
+            :rtype: {...}
+            :return: The media
+        """
+        # If file is given -> Double request: 1st Media File Upload -> 2nd add/edit media
+        upload_progress = kwargs.pop("upload_progress", None)
+        file = kwargs.pop("file", None)
+        from_cache = False
+        if file:
+            # Field convertion "file" -> "file_input"
+            kwargs["file_input"], from_cache = await self._upload_media_file(file, caller, progress=upload_progress)
+        convert_media_parameters(kwargs)
+        kwargs["token"] = self.token
+        # An edit can be sent again safely, not an add (it would create the media twice)
+        idempotent = resource.startswith("medias/edit/")
+        try:
+            return (await default_post(kwargs, resource, self.transport, idempotent=idempotent))["media"]
+        except AuthenticationError:
+            raise  # Handled by @is_login
+        except APIError as e:
+            # Only a rejection by the server can come from a stale file_input: after a network error or a 5XX, the call may have been
+            # applied (an add sent again would create the media twice)
+            if not from_cache or not is_rejected(e):
+                raise
+            # The server can reject a stale file_input from the upload cache: upload the file again (once)
+            getLogger().warning("AsyncSPApi.%s: Cached file_input rejected (%s), upload %s again", caller, e, file)
+            loop = asyncio.get_running_loop()
+            key = await loop.run_in_executor(None, UploadCache.hash_file, file)
+            await loop.run_in_executor(None, self.upload_cache.invalidate, self.api_public_key, "medias/upload", key)
+            kwargs["file_input"], _ = await self._upload_media_file(file, caller, progress=upload_progress, use_cache=False)
+            return (await default_post(kwargs, resource, self.transport, idempotent=idempotent))["media"]
+
+    @is_login
+    @invalidates("medias")
+    @updates_store("medias")
+    @supported_parameters(ADD_MEDIA_SCHEMA)
+    async def add_media(self, category, **kwargs):
+        media = await self._post_media(kwargs, f"medias/add/{category}", "add_media")
+        getLogger().info("Media %s created!", media["name"])
+        return media
+
+    @is_login
+    @invalidates("medias")
+    @updates_store("medias")
+    @supported_parameters(EDIT_MEDIA_SCHEMA)
+    async def edit_media(self, code, **kwargs):
+        media = await self._post_media(kwargs, f"medias/edit/{code}", "edit_media")
+        getLogger().info("Media %s edited!", media["name"])
+        return media
+
+    @is_login
+    async def upload_media_file(self, file, progress=None):
+        return (await self._upload_media_file(file, "upload_media_file", progress=progress))[0]
+
+    @is_login
+    async def upload_media_template_file(self, file, progress=None):
+        return (await self._upload(file, "medias/upload/template", progress=progress))[0]
+
+    @is_login
+    async def download_final_media(self, media_code, material_code, filename=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
+        return await post_to_download({
+            "token": self.token,
+            "media_code": media_code,
+            "material_code": material_code,
+        }, "medias/download/final", self.transport, filename=filename,
+                                      chunk_size=chunk_size, progress=progress)
+
+    @is_login
+    async def download_converted_media(self, media_code, filename=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
+        return await post_to_download({
+            "token": self.token,
+            "media_code": media_code
+        }, "medias/download/convert", self.transport, filename=filename,
+                                      chunk_size=chunk_size, progress=progress)
+
+    @is_login
+    async def download_src_media(self, media_code, filename=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
+        return await post_to_download({
+            "token": self.token,
+            "media_code": media_code
+        }, "medias/download/src", self.transport, filename=filename,
+                                      chunk_size=chunk_size, progress=progress)
+
+    @is_login
+    @invalidates("medias")
+    async def disable_media(self, media_code):
+        status = (await default_post({
+            "token": self.token,
+            "media_code": media_code
+        }, "medias/disable", self.transport, idempotent=True))["status"]
+        if status:
+            getLogger().info("Media %s has been disable!", media_code)
+        else:
+            getLogger().warning("Media %s cannot be disable!", media_code)
+        return status
+
+    @is_login
+    @invalidates("medias")
+    async def enable_media(self, media_code):
+        status = (await default_post({
+            "token": self.token,
+            "media_code": media_code
+        }, "medias/enable", self.transport, idempotent=True))["status"]
+        if status:
+            getLogger().info("Media %s has been enable!", media_code)
+        else:
+            getLogger().warning("Media %s cannot be enable!", media_code)
+        return status
+
+    @is_login
+    @invalidates("medias")
+    @updates_store("medias", remove=True)
+    async def delete_media(self, code):
+        await default_post({
+            "token": self.token,
+            "media_code": code
+        }, "medias/remove", self.transport)
+        getLogger().info("Media %s deleted!", code)
+
+    # WebviewTemplate
+
+    @cached("webviewtemplates")
+    @is_login
+    async def get_webviewtemplates(self):
+        """
+            Get all the webviewtemplates.
+
+            :raise APIError: On any error
+            :rtype: [{...}]
+            :return: The list of webviewtemplates
+        """
+        return self._to_models("webviewtemplates", (await default_get(self.token, "webviewtemplates", self.transport))["webviewtemplates"])
+
+    @is_login
+    async def iter_webviewtemplates(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the webviewtemplates: they are parsed one by one while the response is read, in constant memory (not cached).
+            Usage: async for entity in await sp_api.iter_webviewtemplates(): ...
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: async iter({...})
+            :return: The webviewtemplates
+        """
+        return self._to_models("webviewtemplates", self._stream("webviewtemplates", "webviewtemplates", chunk_size))
+
+    @is_login
+    @invalidates("webviewtemplates")
+    @updates_store("webviewtemplates")
+    async def update_requirements_webviewtemplates(self, code, requirements):
+        webviewtemplate = (await default_post({
+            "token": self.token,
+            "requirements": requirements}, f"webviewtemplates/edit/{code}", self.transport,
+            idempotent=True))["webviewtemplate"]
+        getLogger().info("Webviewtemplate %s edited!", webviewtemplate["name"])
+        return webviewtemplate
@@ -0,0 +1,503 @@
+import asyncio
+import itertools
+import os
+import time
+
+from .exceptions import APIError
+from .decorators import network_try_except
+from .log import getLogger
+from .metrics import RequestEvent, notify
+from .ratelimit import get_family
+from .json_backend import JSONArrayParser
+from .network import STREAM_CHUNK_SIZE, get_server, treat_json_body, raise_status_error, Download, DownloadInterrupted, RestartDownload, ValidatorCache, DOWNLOAD_CHUNK_SIZE, \
+    LOG_BODY_LENGTH
+from .retry import RetryPolicy
+from .upload import MultipartEncoder, UPLOAD_CHUNK_SIZE
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency: python3 -m pip install smart-prospective-api[async]
+    aiohttp = None
+
+DEFAULT_LIMIT = 100
+DEFAULT_LIMIT_PER_HOST = 100
+DEFAULT_MAX_CONCURRENCY = 100
+# The network errors retried by the RetryPolicy
+RETRYABLE_EXCEPTIONS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) if aiohttp else ()
+
+
+class AsyncTransport:
+    """
+    Non-blocking pooled HTTP transport (aiohttp), keep the connections alive between the calls.
+    The aiohttp session is created on first use, inside the running event loop.
+
+    :param int limit: The max number of connections of the pool
+    :param int limit_per_host: The max number of connections per host
+    :param int max_concurrency: The max number of requests in flight at once (others wait for a free slot)
+    :param RetryPolicy retry_policy: The retry policy of the requests (default: RetryPolicy())
+    :param RateLimiter rate_limiter: The rate limiter of the requests, optional (no limit if None)
+    :param list observers: The observers of the requests (See metrics.Observer), no overhead if empty
+    :param bool conditional_requests: If True, the GET requests are conditional (See network.ValidatorCache)
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT, limit_per_host=DEFAULT_LIMIT_PER_HOST, max_concurrency=DEFAULT_MAX_CONCURRENCY, retry_policy=None,
+                 rate_limiter=None, observers=None, conditional_requests=True):
+        if aiohttp is None:
+            raise APIError("The async client requires aiohttp: python3 -m pip install smart-prospective-api[async]")
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.max_concurrency = max_concurrency
+        self.validators = ValidatorCache() if conditional_requests else None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.observers = list(observers or ())
+        self._session = None
+        self._semaphore = None
+
+    @property
+    def session(self):
+        """
+            The aiohttp session (created on first use, must be called from a coroutine)
+
+            :rtype: aiohttp.ClientSession
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+            # The connect phase of the observed requests is traced (not traced without observers, tracing has a cost)
+            trace_configs = [connect_trace_config()] if self.observers else None
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=trace_configs)
+        return self._session
+
+    @property
+    def semaphore(self):
+        """
+            The semaphore limiting the number of requests in flight (created on first use, inside the event loop)
+
+            :rtype: asyncio.Semaphore
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def request(self, method, url, resource=None, idempotent=False, hedge=False, retry=True, data=None, **kwargs):
+        """
+            Perform a request through the pool and read its body, retried according to the retry policy
+            (a request slot is only held while the request is in flight, not while waiting for a retry)
+
+            :param method str: The HTTP method
+            :param url str: The url of the request
+            :param resource str/None: The resource of the request (for the retry logs & stats, the url if None)
+            :param idempotent bool: If True, the request is retried on network errors & 5XX (429 is always retried)
+            :param hedge bool: If True, a hedged request can be sent when the response is slow (See RetryPolicy.hedge_async())
+            :param retry bool: If False, the request is sent once (e.g: a streamed body cannot be sent twice)
+            :param data callable/None: Return the data to send (called for every attempt, a form cannot be sent twice)
+            :rtype: (int, {...}, bytes)
+            :return: The (status code, headers, body) of the response
+        """
+        policy = self.retry_policy
+        resource = resource or url
+        family = get_family(method, resource)
+        attempts = itertools.count()
+
+        async def send_once():
+            # Every attempt (retried or hedged) takes a token, before taking a request slot
+            await self.acquire(family)
+            async with self.semaphore:
+                if self.observers:
+                    status, headers, body = await self._observed_request(RequestEvent(method, resource, family, next(attempts)), url,
+                                                                         data() if data else None, kwargs)
+                else:
+                    async with self.session.request(method, url, data=data() if data else None, **kwargs) as response:
+                        status, headers, body = response.status, response.headers, await response.read()
+            await self.feedback(family, status)
+            return status, headers, body
+
+        async def send():
+            result = await send_once()
+            return policy.check(result[0], result[1], result)
+
+        if not retry:
+            return await send_once()
+        if hedge:
+            return await policy.run_async(lambda: policy.hedge_async(send, resource), resource, idempotent=True,
+                                          exceptions=RETRYABLE_EXCEPTIONS)
+        return await policy.run_async(send, resource, idempotent=idempotent, exceptions=RETRYABLE_EXCEPTIONS)
+
+    async def open(self, method, url, resource, attempts, **kwargs):
+        """
+            Send an attempt of a request and return the response before reading its body (e.g: streamed), observed if there are
+            observers (See _observed_request()), the response must be released by the caller (async with response: ...)
+            Note: Not retried & no request slot taken here, the caller holds them while the body is read
+
+            :param method str: The HTTP method
+            :param url str: The url of the request
+            :param resource str: The resource of the request
+            :param attempts itertools.count: The counter of the attempts of the call (given to the observers)
+            :rtype: aiohttp.ClientResponse
+        """
+        if self.observers:
+            event = RequestEvent(method, resource, get_family(method, resource), next(attempts))
+            return await self._observed_request(event, url, kwargs.pop("data", None), kwargs, stream=True)
+        return await self.session.request(method, url, **kwargs)
+
+    async def _observed_request(self, event, url, data, kwargs, stream=False):
+        """
+            Perform an attempt of a request and read its body, measured & given to the observers (See metrics.Observer)
+
+            :param event RequestEvent: The attempt
+            :param url str: The url of the request
+            :param data: The data to send
+            :param kwargs {...}: The arguments of aiohttp.ClientSession.request()
+            :param stream bool: If True, the body is not read: the response is returned (released by the caller)
+            :rtype: (int, {...}, bytes)/aiohttp.ClientResponse
+        """
+        observers = self.observers
+        notify(observers, "on_request_start", event)
+        started_at = time.perf_counter()
+        response = None
+        try:
+            response = await self.session.request(event.method, url, data=data, trace_request_ctx=event, **kwargs)
+            headers_received = time.perf_counter() - started_at
+            if not stream:
+                body = await response.read()
+                response.release()
+        except Exception as e:
+            if response is not None:
+                response.release()
+            event.duration = time.perf_counter() - started_at
+            event.error = e
+            notify(observers, "on_request_end", event)
+            raise
+        event.duration = time.perf_counter() - started_at
+        event.phases["ttfb"] = max(0.0, headers_received - event.phases["connect"])
+        event.status_code = response.status
+        event.bytes_sent = int(response.request_info.headers.get("Content-Length") or 0)
+        if stream:
+            # The body is read later by the caller
+            event.bytes_received = int(response.headers.get("Content-Length") or 0)
+            notify(observers, "on_request_end", event)
+            return response
+        event.phases["transfer"] = event.duration - headers_received
+        event.bytes_received = len(body)
+        notify(observers, "on_request_end", event)
+        return response.status, response.headers, body
+
+    async def acquire(self, family):
+        """
+            Wait until the rate limiter (if any) allows a request of the family (See RateLimiter.acquire_async())
+        """
+        if self.rate_limiter:
+            await self.rate_limiter.acquire_async(family)
+
+    async def feedback(self, family, status_code):
+        """
+            Give the status code of a response to the rate limiter (if any) (See RateLimiter.feedback_async())
+        """
+        if self.rate_limiter:
+            await self.rate_limiter.feedback_async(family, status_code)
+
+    async def close(self):
+        """
+            Close the aiohttp session and its pooled connections
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def connect_trace_config():
+    """
+        :rtype: aiohttp.TraceConfig
+        :return: The trace config adding the connection time to the "connect" phase of the observed requests (trace_request_ctx=RequestEvent)
+    """
+    async def on_connection_create_start(session, context, params):
+        context.connect_started_at = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        if isinstance(context.trace_request_ctx, RequestEvent):
+            context.trace_request_ctx.phases["connect"] += time.perf_counter() - context.connect_started_at
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
+
+
+def build_form(parameters, files=None):
+    """
+        Build the form of a POST request with the same encoding rules as requests (list values are repeated, None values are skipped)
+
+        :param parameters {...}: The data to use in the POST request
+        :param files {...}/None: The files to insert (name -> opened file), the form is multipart if any
+        :rtype: aiohttp.FormData
+        :return: The form to send
+    """
+    form = aiohttp.FormData()
+    for key, value in (parameters or {}).items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for value in values:
+            if value is not None:
+                form.add_field(key, value if isinstance(value, (str, bytes)) else str(value))
+    for key, f in (files or {}).items():
+        form.add_field(key, f, filename=os.path.basename(getattr(f, "name", key)))
+    return form
+
+
+@network_try_except
+async def default_get(token, resource, transport):
+    """
+        Perform a GET request, insert the token as GET parameter and finally treat the response (JSON)
+        The request is conditional (ETag/Last-Modified of the previous response), an unchanged response is not parsed again
+
+        :param token str: The token (set in GET parameters)
+        :param resource str: The resource to build the url (https://server_url/api/{resource})
+        :param transport AsyncTransport: The transport to use
+        :rtype: {...}/None
+        :raise APIError: See network.treat_json_body()
+        :return: See network.treat_json_body()
+    """
+    url = get_server(f"/{resource}") + f"?token={token}"
+    validators = transport.validators
+    headers = validators.request_headers(resource, token) if validators is not None else None
+    status, headers, body = await transport.request("GET", url, resource=resource, idempotent=True, hedge=True, headers=headers)
+    if validators is None:
+        return treat_json_body(status, url, body, transport.observers, resource)
+    not_modified, result = validators.lookup(resource, token, status, headers, body)
+    if not_modified:
+        getLogger().debug("SPApi.async_network: %s not modified", resource)
+        return result
+    if status == 304:
+        # The previous result was dropped meanwhile (e.g: replaced by the one of another token), request the whole response
+        getLogger().debug("SPApi.async_network: %s not modified but unknown, request it again", resource)
+        status, headers, body = await transport.request("GET", url, resource=resource, idempotent=True, hedge=True)
+    result = treat_json_body(status, url, body, transport.observers, resource)
+    if status != 200:
+        return result
+    return validators.store(resource, token, headers, body, result)
+
+
+async def iter_response_items(response, key, chunk_size=STREAM_CHUNK_SIZE):
+    """
+        Parse the array of a key in a JSON response and yield its items one by one (See network.iter_response_items())
+        Note: The response is not released here (See stream_get())
+
+        :param response aiohttp.ClientResponse: The response (status already checked)
+        :param key str: The key of the array (e.g: "medias")
+        :param chunk_size int: The size of the chunks read from the response (bytes)
+        :raise APIError: If the response is invalid or the connection is lost
+        :rtype: async iter(...)
+    """
+    parser = JSONArrayParser(key)
+    try:
+        async for chunk in response.content.iter_chunked(chunk_size):
+            for item in parser.feed(chunk):
+                yield item
+            if parser.done:
+                return
+        for item in parser.feed(b"", final=True):
+            yield item
+    except (ValueError,) + RETRYABLE_EXCEPTIONS as e:
+        getLogger().error("SPApi.async_network: Invalid streamed response for %s: %s", key, e)
+        raise APIError(f"Invalid streamed response for {key}: {e}")
+
+
+async def stream_get(token, resource, key, transport, chunk_size=STREAM_CHUNK_SIZE):
+    """
+        Perform a GET request, insert the token as GET parameter and yield the items of the array of a key of the response,
+        parsed incrementally while the response is read (See network.stream_get())
+        Note: The API has no pagination, the whole collection is streamed in a single response.
+        The request is sent on the first iteration, its request slot & its response are held until the iteration ends
+        (or the iterator is closed), so an iterator never iterated holds nothing.
+
+        :param token str: The token (set in GET parameters)
+        :param resource str: The resource to build the url (https://server_url/api/{resource})
+        :param key str: The key of the array in the response (e.g: "medias")
+        :param transport AsyncTransport: The transport to use
+        :param chunk_size int: The size of the chunks read from the response (bytes)
+        :rtype: async iter(...)
+        :raise AuthenticationError: If the token is rejected (on the first iteration, before any item)
+        :raise APIError: See network.treat_json_body() / The response is invalid or the connection is lost
+        :return: See iter_response_items()
+    """
+    url = get_server(f"/{resource}") + f"?token={token}"
+    policy = transport.retry_policy
+    attempts = itertools.count()
+
+    async def open_response():
+        await transport.acquire("reads")
+        await transport.semaphore.acquire()
+        try:
+            response = await transport.open("GET", url, resource, attempts)
+            await transport.feedback("reads", response.status)
+            if int(response.status / 100) in [4, 5]:
+                body = await response.read()
+                response.release()
+                try:
+                    treat_json_body(response.status, url, body)
+                except APIError as error:
+                    # Retried if the status is retryable, raised otherwise
+                    policy.check(response.status, response.headers, error)
+                    raise
+        except BaseException:
+            transport.semaphore.release()
+            raise
+        return response
+
+    try:
+        response = await policy.run_async(open_response, resource, idempotent=True, exceptions=RETRYABLE_EXCEPTIONS)
+    except APIError as e:
+        getLogger().error("Error from API call: %s", e)
+        raise
+    except Exception as e:
+        getLogger().error("Error from API call: %s", e)
+        raise APIError(f"Error in the call for stream_get: {e}")
+    try:
+        async for item in iter_response_items(response, key, chunk_size=chunk_size):
+            yield item
+    finally:
+        response.release()
+        transport.semaphore.release()
+
+
+@network_try_except
+async def default_post(parameters, resource, transport, files=None, idempotent=False):
+    """
+        Perform a POST request and finally treat the response (JSON)
+
+        :param parameters {...}: The data to use in the POST request
+        :param resource str: The resource to build the url (https://server_url/api/{resource})
+        :param transport AsyncTransport: The transport to use
+        :param files {...}: The files to insert
+        :param idempotent bool: If True, the request can be sent again safely, so it is retried on network errors & 5XX
+        :rtype: {...}/None
+        :raise APIError: See network.treat_json_body()
+        :return: See network.treat_json_body()
+    """
+    url = get_server(f"/{resource}")
+    # The opened files cannot be sent twice, so a request with files is never retried
+    status, _, body = await transport.request("POST", url, resource=resource, idempotent=idempotent, retry=not files,
+                                              data=lambda: build_form(parameters, files))
+    return treat_json_body(status, url, body, transport.observers, resource)
+
+
+@network_try_except
+async def upload_file(parameters, resource, transport, file, field="file", chunk_size=UPLOAD_CHUNK_SIZE, progress=None):
+    """
+        Perform a multipart POST request with a file, streamed by chunks (never fully loaded in memory), and finally treat the response (JSON)
+
+        :param parameters {...}: The data to use in the POST request
+        :param resource str: The resource to build the url (https://server_url/api/{resource})
+        :param transport AsyncTransport: The transport to use
+        :param file str: The path of the file to upload
+        :param field str: The form field of the file
+        :param chunk_size int: The size of the chunks read from the file (bytes)
+        :param progress callable/None: Called while sending with (bytes_sent, total_bytes), from a thread of the default executor
+        :rtype: {...}/None
+        :raise APIError: See network.treat_json_body() / The file cannot be read
+        :return: See network.treat_json_body()
+    """
+    url = get_server(f"/{resource}")
+    encoder = MultipartEncoder(parameters, {field: file}, chunk_size=chunk_size, progress=progress)
+
+    async def body():
+        # The file is read in the default executor, so the event loop is never blocked by the disk
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, encoder.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    headers = {"Content-Type": encoder.content_type, "Content-Length": str(len(encoder))}
+    # Never retried: the encoder cannot be sent twice
+    status, _, content = await transport.request("POST", url, resource=resource, retry=False, data=body, headers=headers)
+    stats = encoder.stats
+    getLogger().info("SPApi.async_network: %d bytes uploaded in %.2fs (%.2f MB/s)", stats["bytes"], stats["seconds"],
+                     stats["bytes_per_second"] / 1024 / 1024)
+    return treat_json_body(status, url, content, transport.observers, resource)
+
+
+async def treat_file_response(response, download):
+    """
+        Treat an aiohttp response with a file by writing its content by chunks (See network.treat_file_response())
+
+        :param response aiohttp.ClientResponse: The response to treat
+        :param download network.Download: The resumable download of the response
+        :rtype: str/None
+        :raise APIError: If status code is 4XX or 5XX / The downloaded file is incomplete or corrupted
+        :raise RestartDownload: If the partial file of the download cannot be resumed with this response
+        :raise DownloadInterrupted: If the transfer is interrupted by a network error
+        :return: The filepath created. None otherwise (invalid response)
+    """
+    if int(response.status / 100) in [4, 5] and not (response.status == 416 and download.offset):
+        # Error
+        getLogger().error("SPApi.async_network: Error from request:\nUrl:%s\nResponse Status:%.*s", response.url, LOG_BODY_LENGTH,
+                          await response.text())
+        raise_status_error(response.status)
+    # The disk writes & the hashes of the files (identical file, checksum) run in threads, never in the event loop
+    loop = asyncio.get_running_loop()
+    try:
+        writer = await loop.run_in_executor(None, download.start, response.status, response.headers)
+        if writer:
+            try:
+                # Write the file from the request content
+                async for chunk in response.content.iter_chunked(download.chunk_size):
+                    if chunk:
+                        await loop.run_in_executor(None, writer.file.write, chunk)
+                        writer.advance(len(chunk))
+            except BaseException:
+                writer.abort()
+                raise
+            await loop.run_in_executor(None, writer.commit)
+            getLogger().info("SPApi.async_network: %d bytes written into %s", writer.bytes_written, download.filename)
+        return download.filename
+    except (APIError, RestartDownload):
+        raise
+    except RETRYABLE_EXCEPTIONS as err:
+        raise DownloadInterrupted(f"Download of {download.filename} interrupted: {err}") from err
+    except Exception as err:
+        getLogger().error("SPApi.async_network: Invalid file response: %s", err)
+        return None
+
+
+@network_try_except
+async def post_to_download(parameters, resource, transport, filename=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
+    """
+        Perform a POST request and finally write the file response by chunks (filepath)
+        A previous failed download of the same file is resumed (Range request), an identical local file is not downloaded again
+        and the downloaded file is verified (Content-Length & checksum headers)
+
+        :param parameters {...}: The data to use in the POST request
+        :param resource str: The resource to build the url (https://server_url/api/{resource})
+        :param transport AsyncTransport: The transport to use
+        :param filename str/None: The filename to create (See network.treat_file_response())
+        :param chunk_size int: The size of the chunks written to the disk (bytes)
+        :param progress callable/None: Called after every chunk with (bytes_written, total_bytes or None)
+        :rtype: str/None
+        :raise APIError: See treat_file_response()
+        :return: See treat_file_response()
+    """
+    url = get_server(f"/{resource}")
+    policy = transport.retry_policy
+    # Shared by all the requests of the download, so the resumed transfers are observed as retries
+    attempts = itertools.count()
+
+    async def post(download, headers=None):
+        async with await transport.open("POST", url, resource, attempts, data=build_form(parameters), headers=headers) as response:
+            await transport.feedback("downloads", response.status)
+            # On a retryable status, the error is raised only if the retries are exhausted
+            error = APIError(f"Invalid status code response: {response.status}", status_code=response.status)
+            policy.check(response.status, response.headers, error)
+            return await treat_file_response(response, download)
+
+    async def download_once():
+        download = Download(parameters, resource, filename=filename, chunk_size=chunk_size, progress=progress)
+        await transport.acquire("downloads")
+        async with transport.semaphore:
+            try:
+                return await post(download, download.headers)
+            except RestartDownload:
+                # The partial file has been removed, download from scratch
+                return await post(download)
+
+    return await policy.run_async(download_once, resource, idempotent=True, exceptions=RETRYABLE_EXCEPTIONS + (DownloadInterrupted,))
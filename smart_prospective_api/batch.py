@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import itertools
+
+from .exceptions import APIError
+from .log import getLogger
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class BatchResult:
+    """
+    The result of one item of a batch
+
+    :param int index: The position of the item in the batch input
+    :param dict kwargs: The parameters of the call
+    :param result: The value returned by the call (None on failure)
+    :param APIError error: The error raised by the call (None on success)
+    """
+
+    def __init__(self, index, kwargs, result=None, error=None):
+        self.index = index
+        self.kwargs = kwargs
+        self.result = result
+        self.error = error
+
+    @property
+    def success(self):
+        """
+            :rtype: bool
+            :return: True if the call succeeded
+        """
+        return self.error is None
+
+    def __repr__(self):
+        if self.success:
+            return f"BatchResult(index={self.index}, result={self.result})"
+        return f"BatchResult(index={self.index}, error={self.error})"
+
+
+def _call(function, index, kwargs):
+    """
+        Call the function and catch its error into a BatchResult (never raise)
+    """
+    try:
+        return BatchResult(index, kwargs, result=function(**kwargs))
+    except APIError as e:
+        return BatchResult(index, kwargs, error=e)
+    except Exception as e:
+        return BatchResult(index, kwargs, error=APIError(f"Error in the call for {getattr(function, '__name__', function)}: {e}"))
+
+
+def run_batch(function, iterable_of_kwargs, max_workers=DEFAULT_MAX_WORKERS, stop_on_error=False):
+    """
+        Run the function once per kwargs of the iterable on a thread pool, and yield the results in completion order.
+        The iterable is consumed lazily (at most 2 * max_workers items in flight), so it can be a generator of any size.
+
+        :param function callable: The function to call (e.g: sp_api.delete_user)
+        :param iterable_of_kwargs iter({...}): The parameters of every call
+        :param max_workers int: The number of threads
+        :param stop_on_error bool: If True, stop the batch on the first error (the failed result is the last one yielded,
+                                   the calls not yet started are cancelled)
+        :rtype: iter(BatchResult)
+        :return: The result of every call (success or APIError)
+    """
+    items = enumerate(iterable_of_kwargs)
+    max_pending = max(1, max_workers) * 2
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = set()
+    try:
+        for index, kwargs in itertools.islice(items, max_pending):
+            pending.add(executor.submit(_call, function, index, kwargs))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch_result = future.result()
+                yield batch_result
+                if not batch_result.success and stop_on_error:
+                    getLogger().warning("SPApi.batch: Stop on error for item %d: %s", batch_result.index, batch_result.error)
+                    return
+            # Refill the pool with the next items
+            for index, kwargs in itertools.islice(items, max_pending - len(pending)):
+                pending.add(executor.submit(_call, function, index, kwargs))
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
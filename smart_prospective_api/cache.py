@@ -0,0 +1,77 @@
+from collections import OrderedDict
+import threading
+import time
+
+from .log import getLogger
+
+DEFAULT_TTL = 60
+DEFAULT_MAXSIZE = 128
+# The collections cached by the getters of the clients
+COLLECTIONS = ("users", "materials", "materialgroups", "buildings", "medias", "webviewtemplates")
+
+
+class TTLCache:
+    """
+    Thread-safe cache of the collections (e.g: "medias", "materials") with a time to live per collection and a LRU eviction.
+
+    Usage: sp_api = SPApi(pub, sec, cache=TTLCache(ttl=60, ttls={"medias": 10}))
+
+    :param int ttl: The default time to live of an entry (seconds)
+    :param dict ttls: The time to live per collection (seconds), e.g: {"medias": 10, "buildings": 3600}
+    :param int maxsize: The max number of entries, the least recently used one is evicted when full
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, ttls=None, maxsize=DEFAULT_MAXSIZE):
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+            :param key str/tuple: The key of the entry (the collection name, or a tuple starting by it)
+            :rtype: (bool, ...)
+            :return: (True, value) if the entry is cached and not expired, (False, None) otherwise
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        """
+            :param key str/tuple: The key of the entry (the collection name, or a tuple starting by it)
+            :param value: The value to cache
+        """
+        collection = key[0] if isinstance(key, tuple) else key
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttls.get(collection, self.ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection=None):
+        """
+            Remove the entries of a collection
+
+            :param collection str/tuple/None: The collection to invalidate (all its keys), or a key (& all the keys starting by it),
+                                              all the entries if None
+        """
+        with self._lock:
+            if collection is None:
+                self._entries.clear()
+                return
+            prefix = collection if isinstance(collection, tuple) else (collection,)
+            for key in [k for k in self._entries if k == collection or (isinstance(k, tuple) and k[:len(prefix)] == prefix)]:
+                del self._entries[key]
+        getLogger().debug("TTLCache: %s invalidated", collection)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,332 @@
+"""
+Command line interface for the bulk operations: python3 -m smart_prospective_api <command> ...
+
+    add-users FILE          Create a user per row (See add_user())
+    add-materials FILE      Create a material per row (See add_material())
+    refresh-materials FILE  Refresh the material of every row ("code" column, or a code per line)
+    reboot-materials FILE   Reboot the material of every row
+    export COLLECTION       Export a collection (users, materials, materialgroups, buildings, medias, webviewtemplates) as JSONL
+
+The credentials are read from SMART_PROSPECTIVE_PUBLIC_KEY & SMART_PROSPECTIVE_SECRET_KEY (or --public-key & --secret-key).
+The input (CSV with a header, JSONL, or a value per line) is streamed, the rows are sent by --workers threads, and the progress is saved
+into a checkpoint file: an interrupted run started again skips the rows already done (the rows in flight at the crash can be sent twice).
+The failed rows are written into an errors file (JSONL), so they can be fixed and sent again.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+from .batch import run_batch
+from .client import SPApi
+from .exceptions import APIError
+from .log import LOGGER_NAME
+from .ratelimit import RateLimiter
+from .token_store import FileTokenStore
+
+DEFAULT_WORKERS = 8
+# The interval between the saves of the checkpoint & the progress reports (seconds)
+CHECKPOINT_INTERVAL = 2
+PROGRESS_INTERVAL = 5
+# The separator of the list values in a CSV cell (e.g: "mat_1|mat_2" for the materials of a user)
+LIST_SEPARATOR = "|"
+LIST_PARAMETERS = ("right_groups", "rights", "buildings", "materialgroups", "materials", "users")
+# command -> (SPApi method, the parameter of a row given as a single value)
+COMMANDS = {
+    "add-users": ("add_user", "email"),
+    "add-materials": ("add_material", "name"),
+    "refresh-materials": ("refresh_material", "code"),
+    "reboot-materials": ("reboot_material", "code"),
+}
+COLLECTIONS = ("users", "materials", "materialgroups", "buildings", "medias", "webviewtemplates")
+
+
+def read_rows(f, input_format, value_parameter):
+    """
+        Read the rows of an input file one by one (never fully loaded)
+
+        :param f file: The opened input file
+        :param input_format str: "csv" (with a header), "jsonl" (an object per line) or "lines" (a value per line)
+        :param value_parameter str: The parameter of the values of the "lines" format (e.g: "code")
+        :rtype: iter({...})
+        :return: The parameters of every row (the empty CSV cells are skipped, the list cells are split on LIST_SEPARATOR)
+    """
+    if input_format == "csv":
+        for row in csv.DictReader(f):
+            yield {key: value.split(LIST_SEPARATOR) if key in LIST_PARAMETERS else value
+                   for key, value in row.items() if key and value not in (None, "")}
+    elif input_format == "jsonl":
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        for line in f:
+            if line.strip():
+                yield {value_parameter: line.strip()}
+
+
+def get_input_format(path, input_format=None):
+    """
+        :param path str: The input file
+        :param input_format str/None: The format given by the user, guessed from the extension if None
+        :rtype: str
+    """
+    if input_format:
+        return input_format
+    extension = os.path.splitext(path)[1].lower()
+    return {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}.get(extension, "lines")
+
+
+class Checkpoint:
+    """
+    The progress of a bulk run, saved into a JSON file: every row below "done_below" is done, and the rows of "done" too
+    (the rows are completed out of order, only the ones above the first row in flight are listed, so the file stays small).
+
+    :param str path: The checkpoint file
+    :param str key: The identity of the run (command & input), a checkpoint of another run is rejected
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self.done_below = 0
+        self.done = set()
+        self.finished = False
+        self.saved_at = 0
+
+    def load(self):
+        """
+            Load the progress of a previous run (if the file exists)
+
+            :raise APIError: If the checkpoint belongs to another run
+        """
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            raise APIError(f"Invalid checkpoint {self.path}: {e}")
+        if state.get("key") != self.key:
+            raise APIError(f"The checkpoint {self.path} belongs to another run ({state.get('key')}), use --restart or --checkpoint")
+        self.done_below = state["done_below"]
+        self.done = set(state["done"])
+        self.finished = state.get("finished", False)
+
+    def is_done(self, index):
+        return index < self.done_below or index in self.done
+
+    def mark(self, index):
+        """
+            Mark a row as done (success or failure)
+
+            :param index int: The position of the row in the input
+        """
+        self.done.add(index)
+        while self.done_below in self.done:
+            self.done.remove(self.done_below)
+            self.done_below += 1
+
+    def save(self, force=False, finished=False):
+        """
+            Save the progress (atomic), at most every CHECKPOINT_INTERVAL seconds unless forced
+
+            :param force bool: If True, save now
+            :param finished bool: If True, the run is complete
+        """
+        if not force and time.monotonic() - self.saved_at < CHECKPOINT_INTERVAL:
+            return
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump({"key": self.key, "done_below": self.done_below, "done": sorted(self.done), "finished": finished}, f)
+        os.replace(temporary_path, self.path)
+        self.saved_at = time.monotonic()
+        self.finished = finished
+
+
+class Progress:
+    """
+    Count the results of a run and report the throughput & the errors on stderr every PROGRESS_INTERVAL seconds
+
+    :param str label: The name of the run (e.g: "add-users")
+    :param int skipped: The number of rows skipped (done by a previous run)
+    """
+
+    def __init__(self, label, skipped=0):
+        self.label = label
+        self.skipped = skipped
+        self.succeeded = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.reported_at = self.started_at
+
+    def add(self, success):
+        if success:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        if time.monotonic() - self.reported_at >= PROGRESS_INTERVAL:
+            self.report()
+
+    def report(self, state="running"):
+        """
+            :param state str: The state of the run ("running", "done" or "stopped")
+        """
+        now = time.monotonic()
+        self.reported_at = now
+        done = self.succeeded + self.failed
+        rate = done / max(now - self.started_at, 1e-9)
+        skipped = f", {self.skipped} skipped (checkpoint)" if self.skipped else ""
+        print(f"{self.label}: {state}, {done} row(s) in {now - self.started_at:.1f}s ({rate:.1f}/s), "
+              f"{self.succeeded} succeeded, {self.failed} failed{skipped}", file=sys.stderr, flush=True)
+
+
+def run_bulk(sp_api, args):
+    """
+        Run a bulk command (See COMMANDS) over the rows of the input file, with a checkpoint, an errors file & progress reports
+
+        :param sp_api SPApi: The client
+        :param args argparse.Namespace: The options of the command
+        :rtype: int
+        :return: The exit code (1 if any row failed)
+    """
+    method, value_parameter = COMMANDS[args.command]
+    function = getattr(sp_api, method)
+    input_format = get_input_format(args.input, args.format)
+    checkpoint = Checkpoint(args.checkpoint or f"{args.input}.checkpoint.json", f"{args.command} {os.path.abspath(args.input)}")
+    if not args.restart:
+        checkpoint.load()
+    if checkpoint.finished:
+        print(f"{args.command}: already completed according to {checkpoint.path} (use --restart to run it again)", file=sys.stderr)
+        return 0
+    progress = Progress(args.command)
+    # The position in the input of the rows sent to the batch (by batch index), removed once done
+    row_indexes = {}
+
+    def pending_rows(rows):
+        batch_index = 0
+        for index, row in enumerate(rows):
+            if checkpoint.is_done(index):
+                progress.skipped += 1
+                continue
+            row_indexes[batch_index] = index
+            batch_index += 1
+            yield row
+
+    with open(args.input, "r", newline="", encoding="utf-8") as f, \
+            open(args.errors or f"{args.input}.errors.jsonl", "a", encoding="utf-8") as errors, \
+            open(args.output, "a", encoding="utf-8") if args.output else open(os.devnull, "w") as output:
+        try:
+            for result in run_batch(function, pending_rows(read_rows(f, input_format, value_parameter)), max_workers=args.workers):
+                index = row_indexes.pop(result.index)
+                if result.success:
+                    output.write(json.dumps({"row": index, "result": result.result}) + "\n")
+                else:
+                    errors.write(json.dumps({"row": index, "parameters": result.kwargs, "error": str(result.error)}) + "\n")
+                # Written before the checkpoint marks the row as done
+                output.flush()
+                errors.flush()
+                checkpoint.mark(index)
+                checkpoint.save()
+                progress.add(result.success)
+            checkpoint.save(force=True, finished=True)
+        finally:
+            # Interrupted: keep the progress (the rows in flight are not marked, they are sent again on resume)
+            if not checkpoint.finished:
+                checkpoint.save(force=True)
+            progress.report("done" if checkpoint.finished else "stopped")
+    return 1 if progress.failed else 0
+
+
+def run_export(sp_api, args):
+    """
+        Export a collection as JSONL (an entity per line), streamed from the response to the output (See SPApi.iter_medias())
+
+        :param sp_api SPApi: The client
+        :param args argparse.Namespace: The options of the command
+        :rtype: int
+        :return: The exit code
+    """
+    progress = Progress(f"export {args.collection}")
+    output = open(args.output, "w", encoding="utf-8") if args.output and args.output != "-" else sys.stdout
+    try:
+        for entity in getattr(sp_api, f"iter_{args.collection}")():
+            output.write(json.dumps(entity, ensure_ascii=False) + "\n")
+            progress.add(True)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        progress.report("done")
+    return 0
+
+
+def build_parser():
+    """
+        :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(prog="python3 -m smart_prospective_api", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--public-key", default=os.environ.get("SMART_PROSPECTIVE_PUBLIC_KEY"), help="The API public key (pub_...)")
+    parser.add_argument("--secret-key", default=os.environ.get("SMART_PROSPECTIVE_SECRET_KEY"), help="The API secret key (sec_...)")
+    parser.add_argument("--token-store", action="store_true", help="Share the token with the other runs (See FileTokenStore)")
+    parser.add_argument("--verbose", action="store_true", help="Print the logs of the library (the failed rows are in the errors file)")
+    commands = parser.add_subparsers(dest="command")
+    for command, (method, value_parameter) in COMMANDS.items():
+        bulk = commands.add_parser(command, help=f"Call {method}() for every row of the input")
+        bulk.add_argument("input", help="The input file: .csv (with a header), .jsonl, or a value per line")
+        bulk.add_argument("--format", choices=("csv", "jsonl", "lines"), help="The format of the input (default: from the extension)")
+        bulk.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="The number of calls in parallel")
+        bulk.add_argument("--rate", type=float, help="The max number of calls per second (default: no limit)")
+        bulk.add_argument("--checkpoint", help="The checkpoint file (default: {input}.checkpoint.json)")
+        bulk.add_argument("--restart", action="store_true", help="Ignore the checkpoint of a previous run")
+        bulk.add_argument("--errors", help="The JSONL file of the failed rows (default: {input}.errors.jsonl)")
+        bulk.add_argument("--output", help="Append the results of the calls into this JSONL file")
+    export = commands.add_parser("export", help="Export a collection as JSONL")
+    export.add_argument("collection", choices=COLLECTIONS)
+    export.add_argument("--output", help="The JSONL file (default: stdout)")
+    return parser
+
+
+def main(argv=None):
+    """
+        Run the command line interface
+
+        :param argv [str]/None: The arguments (default: sys.argv)
+        :rtype: int
+        :return: The exit code
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.command:
+        parser.print_help()
+        return 0
+    if not args.public_key or not args.secret_key:
+        parser.error("The credentials are required: SMART_PROSPECTIVE_PUBLIC_KEY & SMART_PROSPECTIVE_SECRET_KEY (or --public-key & --secret-key)")
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    else:
+        logging.getLogger(LOGGER_NAME).setLevel(logging.CRITICAL)
+    workers = getattr(args, "workers", DEFAULT_WORKERS)
+    rate = getattr(args, "rate", None)
+    sp_api = SPApi(args.public_key, args.secret_key, pool_maxsize=workers, token_store=FileTokenStore() if args.token_store else None,
+                   rate_limiter=RateLimiter(rates={"writes": rate}) if rate else None)
+    try:
+        if args.command == "export":
+            return run_export(sp_api, args)
+        return run_bulk(sp_api, args)
+    except APIError as e:
+        print(f"{args.command}: {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print(f"{args.command}: interrupted", file=sys.stderr)
+        return 130
+    finally:
+        if not args.token_store and sp_api.token:
+            try:
+                sp_api.logout()
+            except APIError:
+                pass
+        sp_api.close()
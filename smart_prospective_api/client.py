@@ -1,47 +1,221 @@
+import threading
+
 from .network import *
+from .exceptions import AuthenticationError
 from .log import getLogger
-from .decorators import is_login, supported_parameters
+from .batch import run_batch, DEFAULT_MAX_WORKERS
+from .pipeline import run_upload_pipeline, DEFAULT_UPLOAD_WORKERS, DEFAULT_CREATE_WORKERS
+from .upload_cache import UploadCache
+from .decorators import is_login, supported_parameters, cached, invalidates, updates_store
+from .models import to_models
+from .store import EntityStore
+from .cache import COLLECTIONS
+from .parameters import USER_SCHEMA, MATERIAL_SCHEMA, MATERIALGROUP_SCHEMA, ADD_MEDIA_SCHEMA, EDIT_MEDIA_SCHEMA, convert_media_parameters
 
 
 class SPApi():
     token = None
     api_public_key = None
     api_secret_key = None
-
-    def __init__(self, api_public_key, api_secret_key):
+    transport = None
+    upload_cache = None
+    cache = None
+    entity_store = None
+    token_store = None
+    models = False
+
+    def __init__(self, api_public_key, api_secret_key, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE,
+                 pool_block=False, upload_cache=None, cache=None, retry_policy=None,
+                 rate_limiter=None, token_store=None,
+                 models=False, observers=None, conditional_requests=True):
+        """
+            :param api_public_key str: The API public key (starts by "pub_")
+            :param api_secret_key str: The API secret key (starts by "sec_")
+            :param pool_connections int: The number of host pools to keep alive
+            :param pool_maxsize int: The max number of connections kept alive per host (set it to the number of threads using this instance)
+            :param pool_block bool: If True, wait for a free connection when the pool is full instead of opening a non pooled one
+            :param upload_cache UploadCache/None: If set, the files already uploaded (same content) are not uploaded again
+            :param cache TTLCache/None: If set, the collections (get_medias(), get_materials()...) are cached until they expire or are modified
+            :param retry_policy RetryPolicy/None: The retry policy of the requests (default: RetryPolicy(), See RetryPolicy.stats for the retry counts)
+            :param rate_limiter RateLimiter/None: If set, the requests are rate limited (can be shared with other instances & processes)
+            :param token_store TokenStore/None: If set, the token is shared with the other instances & processes using this store (e.g: FileTokenStore())
+            :param models bool: If True, the collections (get_medias(), iter_medias()...) are compact models instead of dicts (See models.Entity)
+            :param observers [Observer]/None: The observers of the requests, e.g: [MetricsCollector()] (See metrics.Observer)
+            :param conditional_requests bool: If True, the getters send conditional requests (ETag/Last-Modified), an unchanged collection
+                                              is not downloaded nor parsed again (its last result is kept in memory)
+        """
         self.api_public_key = api_public_key
         self.api_secret_key = api_secret_key
+        # Every call of this instance goes through the same pool of keep-alive connections (thread-safe)
+        self.transport = Transport(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block,
+                                   retry_policy=retry_policy, rate_limiter=rate_limiter, observers=observers,
+                                   conditional_requests=conditional_requests)
+        self.upload_cache = upload_cache
+        self.cache = cache
+        self.token_store = token_store
+        self.models = models
+        self._login_lock = threading.Lock()
+
+    def close(self):
+        """
+            Close the pooled connections of this instance (the instance can still be used, new connections will be opened)
+        """
+        self.transport.close()
+
+    def batch(self, method, iterable_of_kwargs, max_workers=DEFAULT_MAX_WORKERS, stop_on_error=False):
+        """
+            Run a method of this instance once per kwargs on a thread pool, the results are yielded in completion order.
+            The login is performed once before starting the workers (all the workers share the token).
+            Note: Use a pool_maxsize >= max_workers on this instance to keep all the connections alive.
+
+            e.g: for result in sp_api.batch("delete_user", ({"code": code} for code in codes), max_workers=16): ...
+
+            :param method str/callable: The method to call, by name (e.g: "edit_media") or bound method (e.g: sp_api.edit_media)
+            :param iterable_of_kwargs iter({...}): The parameters of every call (consumed lazily)
+            :param max_workers int: The number of threads
+            :param stop_on_error bool: If True, stop the batch on the first error (the failed result is the last one yielded)
+            :raise APIError: If the method doesn't exist or the login fails
+            :rtype: iter(BatchResult)
+            :return: The result of every call (result or APIError, see BatchResult)
+        """
+        function = getattr(self, method, None) if isinstance(method, str) else method
+        if not callable(function):
+            raise APIError(f"Invalid method for batch: {method}")
+        self.login()
+        return run_batch(function, iterable_of_kwargs, max_workers=max_workers, stop_on_error=stop_on_error)
+
+    def add_medias(self, manifest, upload_workers=DEFAULT_UPLOAD_WORKERS, create_workers=DEFAULT_CREATE_WORKERS, queue_size=None):
+        """
+            Create many medias with a pipeline: the files are uploaded on a pool of upload_workers threads while the medias of the
+            files already uploaded are created on a pool of create_workers threads (instead of upload -> create, one media at a time).
+            The results are yielded in completion order. On failure, the kwargs of the result can be given again to add_medias:
+            an item failed on create holds the "file_input" of its uploaded file (not uploaded again).
+            Note: Use a pool_maxsize >= upload_workers + create_workers on this instance to keep all the connections alive.
+
+            e.g: for result in sp_api.add_medias({"category": "file", "name": name, "file": path} for name, path in files): ...
+
+            :param manifest iter({...}): The parameters of add_media for every media (consumed lazily)
+            :param upload_workers int: The number of threads uploading the files
+            :param create_workers int: The number of threads creating the medias
+            :param queue_size int/None: The max number of uploaded files waiting for a create thread (default: 2 * create_workers)
+            :raise APIError: If the login fails
+            :rtype: iter(BatchResult)
+            :return: The result of every media (media or APIError, see BatchResult)
+        """
+        self.login()
+        return run_upload_pipeline(self._upload_media_item, self.add_media, manifest, upload_workers=upload_workers,
+                                   create_workers=create_workers, queue_size=queue_size)
+
+    def invalidate(self, *collections):
+        """
+            Invalidate the cached collections of this instance (if a cache is set)
+
+            :param collections str: The collections to invalidate (e.g: "medias"), all if none given
+        """
+        if self.cache is not None:
+            for collection in collections or COLLECTIONS:
+                self.cache.invalidate((collection, self.api_public_key))
+
+    def _to_models(self, collection, entities):
+        """
+            :param collection str: The collection of the entities (e.g: "medias")
+            :param entities [{...}]/iter({...}): The entities returned by the API
+            :return: The entities converted into models if enabled (See models.to_models()), unchanged otherwise
+        """
+        return to_models(collection, entities) if self.models else entities
+
+    def store(self, refresh=False):
+        """
+            Get the indexed in-memory copy of the collections (loaded on the first call, then kept in sync by the add/edit/delete calls)
+            Note: enable_media/disable_media are not reflected in the stored medias (the indexes are not affected), use refresh=True
+
+            :param refresh bool: If True, load the collections again
+            :raise APIError: On any error
+            :rtype: EntityStore
+        """
+        if self.entity_store is None or refresh:
+            entity_store = EntityStore()
+            entity_store.load({
+                "users": self.get_users(),
+                "materials": self.get_materials(),
+                "materialgroups": self.get_materialgroups(),
+                "buildings": self.get_buildings(),
+                "medias": self.get_medias(),
+                "webviewtemplates": self.get_webviewtemplates()
+            })
+            self.entity_store = entity_store
+        return self.entity_store
 
     def login(self):
         """
             Login the user, in order to get a token using the api_public_key & api_secret_key.
             If the token is already present, no login is performed.
+            The concurrent calls (threads) wait for the same login, only one login request is sent at once.
+            With a token store, its token is used if any, otherwise the new token is saved into it.
 
             :raise APIError: On any error
             :rtype: str
             :return: The API token, valid until logout or timeout
         """
-        if not self.token:
-            self.token = default_post({
-                "api_public_key": self.api_public_key,
-                "api_secret_key": self.api_secret_key
-            }, "login")["token"]
-        else:
-            getLogger().debug("SPApi: Already connected")
-        return self.token
+        with self._login_lock:
+            if self.token:
+                getLogger().debug("SPApi: Already connected")
+            elif self.token_store is None:
+                self.token = self._post_login()
+            else:
+                # Locked, so the other instances & processes using the store wait for this login instead of logging in too
+                with self.token_store.lock(self.api_public_key):
+                    self.token = self.token_store.get(self.api_public_key)
+                    if self.token:
+                        getLogger().debug("SPApi: Token found in the token store")
+                    else:
+                        self.token = self._post_login()
+                        self.token_store.set(self.api_public_key, self.token)
+            return self.token
+
+    def _post_login(self):
+        """
+            :raise APIError: On any error
+            :rtype: str
+            :return: A new token from the login request
+        """
+        return default_post({
+            "api_public_key": self.api_public_key,
+            "api_secret_key": self.api_secret_key
+        }, "login", transport=self.transport, idempotent=True)["token"]
+
+    def _forget_token(self, token):
+        """
+            Forget a token rejected by the server (or logged out), in this instance & in the token store
+
+            :param token str: The token to forget (ignored if the instance already has another one)
+        """
+        if token and self.token == token:
+            self.token = None
+        if token and self.token_store is not None:
+            self.token_store.delete(self.api_public_key, token)
 
-    @is_login
     def logout(self):
         """
             Logout the user, in order to get release the token.
-            The token must be set already present, no login is performed.
+            The token must be set already present (or in the token store), no login is performed.
+            A token already rejected by the server (expired) is only forgotten.
 
             :raise APIError: On any error
         """
-        default_post({"token": self.token}, "logout")
-        self.token = None
+        token = self.token
+        if not token and self.token_store is not None:
+            token = self.token_store.get(self.api_public_key)
+        if not token:
+            return
+        try:
+            default_post({"token": token}, "logout", transport=self.transport)
+        except AuthenticationError:
+            getLogger().info("SPApi.logout: The token is already expired")
+        self._forget_token(token)
 
     # Users
+    @cached("users")
     @is_login
     def get_users(self):
         """
@@ -51,26 +225,43 @@ class SPApi():
             :rtype: [{...}]
             :return: The list of users
         """
-        return default_get(self.token, "users")["users"]
+        return self._to_models("users", default_get(self.token, "users", transport=self.transport)["users"])
+
+    @is_login
+    def iter_users(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the users: they are parsed one by one while the response is read, in constant memory (not cached).
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: iter({...})
+            :return: The users
+        """
+        entities = stream_get(self.token, "users", "users", transport=self.transport, chunk_size=chunk_size)
+        return self._to_models("users", entities)
 
     @is_login
-    @supported_parameters(["first_name", "last_name", "email", "phone", "position", "password", "right_groups", "rights", "picture", "picture_link",
-                           "buildings", "materialgroups", "materials"])
+    @invalidates("users")
+    @updates_store("users")
+    @supported_parameters(USER_SCHEMA)
     def add_user(self, **kwargs):
         kwargs["token"] = self.token
-        user = default_post(kwargs, "users/add")["user"]
-        getLogger().info(f"User {user['name']} created!")
+        user = default_post(kwargs, "users/add", transport=self.transport)["user"]
+        getLogger().info("User %s created!", user["name"])
         return user
 
     @is_login
+    @invalidates("users")
+    @updates_store("users", remove=True)
     def delete_user(self, code):
         default_post({
             "token": self.token,
             "user_code": code
-        }, "users/remove")
-        getLogger().info(f"User {code} deleted!")
+        }, "users/remove", transport=self.transport)
+        getLogger().info("User %s deleted!", code)
 
     # Materials
+    @cached("materials")
     @is_login
     def get_materials(self):
         """
@@ -80,15 +271,29 @@ class SPApi():
             :rtype: [{...}]
             :return: The list of materials
         """
-        return default_get(self.token, "materials")["materials"]
+        return self._to_models("materials", default_get(self.token, "materials", transport=self.transport)["materials"])
+
+    @is_login
+    def iter_materials(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the materials: they are parsed one by one while the response is read, in constant memory (not cached).
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: iter({...})
+            :return: The materials
+        """
+        entities = stream_get(self.token, "materials", "materials", transport=self.transport, chunk_size=chunk_size)
+        return self._to_models("materials", entities)
 
     @is_login
-    @supported_parameters(["name", "building", "link_code", "picture", "picture_link", "default_media", "time_to_invalid",
-                           "users", "division", "rotation", "bg_color", "width", "height", "player_config"])
+    @invalidates("materials")
+    @updates_store("materials")
+    @supported_parameters(MATERIAL_SCHEMA)
     def add_material(self, **kwargs):
         kwargs["token"] = self.token
-        material = default_post(kwargs, "materials/add")["material"]
-        getLogger().info(f"Material {material['name']} created!")
+        material = default_post(kwargs, "materials/add", transport=self.transport)["material"]
+        getLogger().info("Material %s created!", material["name"])
         return material
 
     @is_login
@@ -96,11 +301,11 @@ class SPApi():
         status = default_post({
             "token": self.token,
             "material_code": code
-        }, "materials/reboot")["status"]
+        }, "materials/reboot", transport=self.transport, idempotent=True)["status"]
         if status:
-            getLogger().info(f"Material {code} will reboot!")
+            getLogger().info("Material %s will reboot!", code)
         else:
-            getLogger().warning(f"Material {code} has already been asked to reboot, need to wait!")
+            getLogger().warning("Material %s has already been asked to reboot, need to wait!", code)
         return status
 
     @is_login
@@ -108,14 +313,15 @@ class SPApi():
         status = default_post({
             "token": self.token,
             "material_code": code
-        }, "materials/refresh")["status"]
+        }, "materials/refresh", transport=self.transport, idempotent=True)["status"]
         if status:
-            getLogger().info(f"Material {code} will be refreshed!")
+            getLogger().info("Material %s will be refreshed!", code)
         else:
-            getLogger().warning(f"Material {code} has already been asked to refresh, need to wait!")
+            getLogger().warning("Material %s has already been asked to refresh, need to wait!", code)
         return status
 
     # Material Groups
+    @cached("materialgroups")
     @is_login
     def get_materialgroups(self):
         """
@@ -125,25 +331,43 @@ class SPApi():
             :rtype: [{...}]
             :return: The list of materialgroups
         """
-        return default_get(self.token, "material-groups")["materialgroups"]
+        return self._to_models("materialgroups", default_get(self.token, "material-groups", transport=self.transport)["materialgroups"])
+
+    @is_login
+    def iter_materialgroups(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the materialgroups: they are parsed one by one while the response is read, in constant memory (not cached).
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: iter({...})
+            :return: The materialgroups
+        """
+        entities = stream_get(self.token, "material-groups", "materialgroups", transport=self.transport, chunk_size=chunk_size)
+        return self._to_models("materialgroups", entities)
 
     @is_login
-    @supported_parameters(["name", "comment", "materials", "buildings", "picture", "picture_link"])
+    @invalidates("materialgroups")
+    @updates_store("materialgroups")
+    @supported_parameters(MATERIALGROUP_SCHEMA)
     def add_materialgroup(self, **kwargs):
         kwargs["token"] = self.token
-        materialgroup = default_post(kwargs, "material-groups/add")["materialgroup"]
-        getLogger().info(f"Material Group {materialgroup['name']} created!")
+        materialgroup = default_post(kwargs, "material-groups/add", transport=self.transport)["materialgroup"]
+        getLogger().info("Material Group %s created!", materialgroup["name"])
         return materialgroup
 
     @is_login
+    @invalidates("materialgroups")
+    @updates_store("materialgroups", remove=True)
     def delete_materialgroup(self, code):
         default_post({
             "token": self.token,
             "materialgroup_code": code
-        }, "material-groups/remove")
-        getLogger().info(f"User {code} deleted!")
+        }, "material-groups/remove", transport=self.transport)
+        getLogger().info("User %s deleted!", code)
 
     # Buildings
+    @cached("buildings")
     @is_login
     def get_buildings(self):
         """
@@ -153,10 +377,24 @@ class SPApi():
             :rtype: [{...}]
             :return: The list of buildings
         """
-        return default_get(self.token, "buildings")["buildings"]
+        return self._to_models("buildings", default_get(self.token, "buildings", transport=self.transport)["buildings"])
+
+    @is_login
+    def iter_buildings(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the buildings: they are parsed one by one while the response is read, in constant memory (not cached).
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: iter({...})
+            :return: The buildings
+        """
+        entities = stream_get(self.token, "buildings", "buildings", transport=self.transport, chunk_size=chunk_size)
+        return self._to_models("buildings", entities)
 
     # Media
 
+    @cached("medias")
     @is_login
     def get_medias(self):
         """
@@ -166,200 +404,214 @@ class SPApi():
             :rtype: [{...}]
             :return: The list of medias
         """
-        return default_get(self.token, "medias")["medias"]
+        return self._to_models("medias", default_get(self.token, "medias", transport=self.transport)["medias"])
 
     @is_login
-    @supported_parameters(["category", "name", "comment", "tags", "force_fullscreen", "lock", "buildings", "material_groups", "materials",
-                           "format_details", "condition_start", "condition_end", "condition_weather", "condition_time", "frequency",
-                           "print_min", "print_max", "animation_start", "animation_end", "hidden_details", "male", "female", "both", "age_zero_fifteen",
-                           "age_sixteen_twenty_eight", "age_twenty_nine_thirty_six", "age_thirty_seven_fifty", "age_fifty_one_ninty_nine",
-                           "interests", "pcs_farmer", "pcs_worker", "pcs_retirees", "pcs_intermediate_professions", "pcs_employee",
-                           "pcs_student", "pcs_unemployed", "pcs_craftsmen", "pcs_managment_nd_profession", "vistor_type_new",
-                           "vistor_type_frequent", "vistor_type_occasional", "vistor_type_everybody", "specific_duration", "keep_audio",
-                           "url", "file", "post_accounts", "webview_details", "webviewtemplate", "rss_post_accounts", "twitter_post_accounts", "instagram_post_accounts",
-                           "facebook_post_accounts", "instagram_post_accounts", "banner_texts_details", "font", "font_size", "color", "bg_color", "bg_opacity", "speed",
-                           "position", "position_unset", "margin"])
-    def add_media(self, category, **kwargs):
-        # If file is given -> Double request: 1st Media File Upload -> 2nd add media
-        if "file" in kwargs:
-            file_input = None
-            with open(kwargs["file"], "rb") as f:
-                file_input = default_post({
-                    "token": self.token
-                }, "medias/upload", files={"file": f})["file"]["code"]
-            if not file_input:
-                getLogger().error(f"SPApi.add_media: Error from file upload\nFile after upload:{file_input}")
-                raise APIError(f"Failure on file upload")
-            # Field convertion "file" -> "file_input"
-            kwargs["file_input"] = file_input
+    def iter_medias(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the medias: they are parsed one by one while the response is read, in constant memory (not cached).
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: iter({...})
+            :return: The medias
+        """
+        entities = stream_get(self.token, "medias", "medias", transport=self.transport, chunk_size=chunk_size)
+        return self._to_models("medias", entities)
+
+    def _upload(self, file, resource, progress=None, use_cache=True):
+        """
+            Upload a file, streamed by chunks, or reuse the file already uploaded with the same content (if upload_cache is set)
+
+            :param file str: The path of the file to upload
+            :param resource str: The upload resource (e.g: "medias/upload")
+            :param progress callable/None: Called while sending with (bytes_sent, total_bytes)
+            :param use_cache bool: If False, always upload the file (the cache is updated)
+            :raise APIError: On any error
+            :rtype: ({...}, bool)
+            :return: The file returned by the server & True if it comes from the cache
+        """
+        key = None
+        if self.upload_cache:
+            key = UploadCache.hash_file(file)
+            uploaded = self.upload_cache.get(self.api_public_key, resource, key) if use_cache else None
+            if uploaded:
+                getLogger().debug("SPApi: %s already uploaded, reuse %s", file, uploaded)
+                return uploaded, True
+        uploaded = upload_file({
+            "token": self.token
+        }, resource, file, transport=self.transport, progress=progress)["file"]
+        if key and uploaded:
+            self.upload_cache.set(self.api_public_key, resource, key, uploaded)
+        return uploaded, False
+
+    def _upload_media_file(self, file, caller, progress=None, use_cache=True):
+        """
+            Upload a media file (1st request of add_media/edit_media with a file)
+
+            :param file str: The path of the file to upload
+            :param caller str: The name of the calling method (for the logs)
+            :param progress callable/None: Called while sending with (bytes_sent, total_bytes)
+            :param use_cache bool: If False, always upload the file
+            :raise APIError: On any error
+            :rtype: (str, bool)
+            :return: The file_input code to use in the media call & True if it comes from the upload cache
+        """
+        uploaded, from_cache = self._upload(file, "medias/upload", progress=progress, use_cache=use_cache)
+        file_input = uploaded.get("code") if uploaded else None
+        if not file_input:
+            getLogger().error("SPApi.%s: Error from file upload\nFile after upload:%s", caller, file_input)
+            raise APIError(f"Failure on file upload")
+        return file_input, from_cache
+
+    @is_login
+    @supported_parameters(ADD_MEDIA_SCHEMA)
+    def _upload_media_item(self, **kwargs):
+        """
+            Upload stage of add_medias(): upload the file of an item (the invalid items fail before their upload)
+
+            :param kwargs {...}: The parameters of add_media
+            :raise APIError: On any error
+            :rtype: {...}
+            :return: The parameters for add_media, with the "file_input" of the uploaded file instead of "file"
+                     (unchanged if there is no file, or if it is in the upload cache: add_media handles a stale cached file)
+        """
+        if not kwargs.get("file"):
+            return kwargs
+        kwargs = dict(kwargs)
+        file_input, from_cache = self._upload_media_file(kwargs["file"], "add_medias", progress=kwargs.pop("upload_progress", None))
+        if not from_cache:
             del kwargs["file"]
-        # Field convertion "post_accounts" -> "post_accounts_text"
-        if "post_accounts" in kwargs:
-            kwargs["post_accounts_text"] = ",".join(kwargs["post_accounts"])
-            del kwargs["post_accounts"]
-        # Field convertion "rss_post_accounts" -> "rss_post_accounts_text"
-        if "rss_post_accounts" in kwargs:
-            kwargs["rss_post_accounts_text"] = ",".join(kwargs["rss_post_accounts"])
-            del kwargs["rss_post_accounts"]
-        # Field convertion "twitter_post_accounts" -> "twitter_post_accounts_text"
-        if "twitter_post_accounts" in kwargs:
-            kwargs["twitter_post_accounts_text"] = ",".join(kwargs["twitter_post_accounts"])
-            del kwargs["twitter_post_accounts"]
-        # Field convertion "instagram_post_accounts" -> "instagram_post_accounts_text"
-        if "instagram_post_accounts" in kwargs:
-            kwargs["instagram_post_accounts_text"] = ",".join(kwargs["instagram_post_accounts"])
-            del kwargs["instagram_post_accounts"]
-        # Field convertion "facebook_post_accounts" -> "facebook_post_accounts_text"
-        if "facebook_post_accounts" in kwargs:
-            kwargs["facebook_post_accounts_text"] = ",".join(kwargs["facebook_post_accounts"])
-            del kwargs["facebook_post_accounts"]
-        # Field convertion "instagram_post_accounts" -> "instagram_post_accounts_text"
-        if "instagram_post_accounts" in kwargs:
-            kwargs["instagram_post_accounts_text"] = ",".join(kwargs["instagram_post_accounts"])
-            del kwargs["instagram_post_accounts"]
-        # Field convertion "banner_texts_details" -> "banner_texts_details"
-        if "banner_texts_details" in kwargs:
-            kwargs["banner_texts_details"] = ",".join(kwargs["banner_texts_details"])
-        # Field convertion "tags" -> "tags_text"
-        if "tags" in kwargs:
-            kwargs["tags_text"] = ",".join(kwargs["tags"])
-            del kwargs["tags"]
-        # Field convertion "interests" -> "interests_text"
-        if "interests" in kwargs:
-            kwargs["interests_text"] = ",".join(kwargs["interests"])
-            del kwargs["interests"]
+            kwargs["file_input"] = file_input
+        return kwargs
+
+    def _post_media(self, kwargs, resource, caller):
+        """
+            Perform a media call (add/edit): upload the file if given, convert the fields & post the media
+
+            :param kwargs {...}: The parameters of the call
+            :param resource str: The media resource (e.g: "medias/add/file")
+            :param caller str: The name of the calling method (for the logs)
+            :raise APIError: On any error
+            :rtype: {...}
+            :return: The media
+        """
+        # If file is given -> Double request: 1st Media File Upload -> 2nd add/edit media
+        upload_progress = kwargs.pop("upload_progress", None)
+        file = kwargs.pop("file", None)
+        from_cache = False
+        if file:
+            # Field convertion "file" -> "file_input"
+            kwargs["file_input"], from_cache = self._upload_media_file(file, caller, progress=upload_progress)
+        convert_media_parameters(kwargs)
         kwargs["token"] = self.token
-        media = default_post(kwargs, f"medias/add/{category}")["media"]
-        getLogger().info(f"Media {media['name']} created!")
+        # An edit can be sent again safely, not an add (it would create the media twice)
+        idempotent = resource.startswith("medias/edit/")
+        try:
+            return default_post(kwargs, resource, transport=self.transport, idempotent=idempotent)["media"]
+        except AuthenticationError:
+            raise  # Handled by @is_login
+        except APIError as e:
+            # Only a rejection by the server can come from a stale file_input: after a network error or a 5XX, the call may have been
+            # applied (an add sent again would create the media twice)
+            if not from_cache or not is_rejected(e):
+                raise
+            # The server can reject a stale file_input from the upload cache: upload the file again (once)
+            getLogger().warning("SPApi.%s: Cached file_input rejected (%s), upload %s again", caller, e, file)
+            self.upload_cache.invalidate(self.api_public_key, "medias/upload", UploadCache.hash_file(file))
+            kwargs["file_input"], _ = self._upload_media_file(file, caller, progress=upload_progress, use_cache=False)
+            return default_post(kwargs, resource, transport=self.transport, idempotent=idempotent)["media"]
+
+    @is_login
+    @invalidates("medias")
+    @updates_store("medias")
+    @supported_parameters(ADD_MEDIA_SCHEMA)
+    def add_media(self, category, **kwargs):
+        media = self._post_media(kwargs, f"medias/add/{category}", "add_media")
+        getLogger().info("Media %s created!", media["name"])
         return media
 
     @is_login
-    @supported_parameters(["code", "name", "comment", "tags", "force_fullscreen", "lock", "buildings", "material_groups", "materials",
-                           "format_details", "condition_start", "condition_end", "condition_weather", "condition_time", "frequency",
-                           "print_min", "print_max", "animation_start", "animation_end", "hidden_details", "male", "female", "both", "age_zero_fifteen",
-                           "age_sixteen_twenty_eight", "age_twenty_nine_thirty_six", "age_thirty_seven_fifty", "age_fifty_one_ninty_nine",
-                           "interests", "pcs_farmer", "pcs_worker", "pcs_retirees", "pcs_intermediate_professions", "pcs_employee",
-                           "pcs_student", "pcs_unemployed", "pcs_craftsmen", "pcs_managment_nd_profession", "vistor_type_new",
-                           "vistor_type_frequent", "vistor_type_occasional", "vistor_type_everybody", "specific_duration", "keep_audio",
-                           "url", "file", "post_accounts", "webview_details", "webviewtemplate", "rss_post_accounts", "twitter_post_accounts", "instagram_post_accounts",
-                           "facebook_post_accounts", "instagram_post_accounts", "banner_texts_details", "font", "font_size", "color", "bg_color", "bg_opacity", "speed",
-                           "position", "position_unset", "margin"])
+    @invalidates("medias")
+    @updates_store("medias")
+    @supported_parameters(EDIT_MEDIA_SCHEMA)
     def edit_media(self, code, **kwargs):
-        # If file is given -> Double request: 1st Media File Upload -> 2nd add media
-        if "file" in kwargs:
-            file_input = None
-            with open(kwargs["file"], "rb") as f:
-                file_input = default_post({
-                    "token": self.token
-                }, "medias/upload", files={"file": f})["file"]["code"]
-            if not file_input:
-                getLogger().error(f"SPApi.edit_media: Error from file upload\nFile after upload:{file_input}")
-                raise APIError(f"Failure on file upload")
-            # Field convertion "file" -> "file_input"
-            kwargs["file_input"] = file_input
-            del kwargs["file"]
-        # Field convertion "post_accounts" -> "post_accounts_text"
-        if "post_accounts" in kwargs:
-            kwargs["post_accounts_text"] = ",".join(kwargs["post_accounts"])
-            del kwargs["post_accounts"]
-        # Field convertion "rss_post_accounts" -> "rss_post_accounts_text"
-        if "rss_post_accounts" in kwargs:
-            kwargs["rss_post_accounts_text"] = ",".join(kwargs["rss_post_accounts"])
-            del kwargs["rss_post_accounts"]
-        # Field convertion "twitter_post_accounts" -> "twitter_post_accounts_text"
-        if "twitter_post_accounts" in kwargs:
-            kwargs["twitter_post_accounts_text"] = ",".join(kwargs["twitter_post_accounts"])
-            del kwargs["twitter_post_accounts"]
-        # Field convertion "instagram_post_accounts" -> "instagram_post_accounts_text"
-        if "instagram_post_accounts" in kwargs:
-            kwargs["instagram_post_accounts_text"] = ",".join(kwargs["instagram_post_accounts"])
-            del kwargs["instagram_post_accounts"]
-        # Field convertion "facebook_post_accounts" -> "facebook_post_accounts_text"
-        if "facebook_post_accounts" in kwargs:
-            kwargs["facebook_post_accounts_text"] = ",".join(kwargs["facebook_post_accounts"])
-            del kwargs["facebook_post_accounts"]
-        # Field convertion "instagram_post_accounts" -> "instagram_post_accounts_text"
-        if "instagram_post_accounts" in kwargs:
-            kwargs["instagram_post_accounts_text"] = ",".join(kwargs["instagram_post_accounts"])
-            del kwargs["instagram_post_accounts"]
-        # Field convertion "banner_texts_details" -> "banner_texts_details"
-        if "banner_texts_details" in kwargs:
-            kwargs["banner_texts_details"] = ",".join(kwargs["banner_texts_details"])
-        # Field convertion "tags" -> "tags_text"
-        if "tags" in kwargs:
-            kwargs["tags_text"] = ",".join(kwargs["tags"])
-            del kwargs["tags"]
-        # Field convertion "interests" -> "interests_text"
-        if "interests" in kwargs:
-            kwargs["interests_text"] = ",".join(kwargs["interests"])
-            del kwargs["interests"]
-        kwargs["token"] = self.token
-        media = default_post(kwargs, f"medias/edit/{code}")["media"]
-        getLogger().info(f"Media {media['name']} edited!")
+        media = self._post_media(kwargs, f"medias/edit/{code}", "edit_media")
+        getLogger().info("Media %s edited!", media["name"])
         return media
 
     @is_login
-    def upload_media_template_file(self, file):
-        with open(file, "rb") as f:
-            return default_post({
-                "token": self.token
-            }, "medias/upload/template", files={"file": f})["file"]
-        raise APIError(f"Failure on template file upload, maybe the file is not found or not readable")
+    def upload_media_file(self, file, progress=None):
+        return self._upload_media_file(file, "upload_media_file", progress=progress)[0]
 
     @is_login
-    def download_final_media(self, media_code, material_code, filename=None):
+    def upload_media_template_file(self, file, progress=None):
+        return self._upload(file, "medias/upload/template", progress=progress)[0]
+
+    @is_login
+    def download_final_media(self, media_code, material_code, filename=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
         return post_to_download({
             "token": self.token,
             "media_code": media_code,
             "material_code": material_code,
-        }, "medias/download/final", filename=filename)
+        }, "medias/download/final", filename=filename, transport=self.transport,
+                                chunk_size=chunk_size, progress=progress)
 
-    def download_converted_media(self, media_code, filename=None):
+    @is_login
+    def download_converted_media(self, media_code, filename=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
         return post_to_download({
             "token": self.token,
             "media_code": media_code
-        }, "medias/download/convert", filename=filename)
+        }, "medias/download/convert", filename=filename, transport=self.transport,
+                                chunk_size=chunk_size, progress=progress)
 
-    def download_src_media(self, media_code, filename=None):
+    @is_login
+    def download_src_media(self, media_code, filename=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
         return post_to_download({
             "token": self.token,
             "media_code": media_code
-        }, "medias/download/src", filename=filename)
+        }, "medias/download/src", filename=filename, transport=self.transport,
+                                chunk_size=chunk_size, progress=progress)
 
     @is_login
+    @invalidates("medias")
     def disable_media(self, media_code):
         status = default_post({
             "token": self.token,
             "media_code": media_code
-        }, "medias/disable")["status"]
+        }, "medias/disable", transport=self.transport, idempotent=True)["status"]
         if status:
-            getLogger().info(f"Media {media_code} has been disable!")
+            getLogger().info("Media %s has been disable!", media_code)
         else:
-            getLogger().warning(f"Media {media_code} cannot be disable!")
+            getLogger().warning("Media %s cannot be disable!", media_code)
         return status
 
     @is_login
+    @invalidates("medias")
     def enable_media(self, media_code):
         status = default_post({
             "token": self.token,
             "media_code": media_code
-        }, "medias/enable")["status"]
+        }, "medias/enable", transport=self.transport, idempotent=True)["status"]
         if status:
-            getLogger().info(f"Media {media_code} has been enable!")
+            getLogger().info("Media %s has been enable!", media_code)
         else:
-            getLogger().warning(f"Media {media_code} cannot be enable!")
+            getLogger().warning("Media %s cannot be enable!", media_code)
         return status
 
     @is_login
+    @invalidates("medias")
+    @updates_store("medias", remove=True)
     def delete_media(self, code):
         default_post({
             "token": self.token,
             "media_code": code
-        }, "medias/remove")
-        getLogger().info(f"Media {code} deleted!")
+        }, "medias/remove", transport=self.transport)
+        getLogger().info("Media %s deleted!", code)
 
     # WebviewTemplate
 
+    @cached("webviewtemplates")
     @is_login
     def get_webviewtemplates(self):
         """
@@ -369,12 +621,28 @@ class SPApi():
             :rtype: [{...}]
             :return: The list of webviewtemplates
         """
-        return default_get(self.token, "webviewtemplates")["webviewtemplates"]
+        return self._to_models("webviewtemplates", default_get(self.token, "webviewtemplates", transport=self.transport)["webviewtemplates"])
+
+    @is_login
+    def iter_webviewtemplates(self, chunk_size=STREAM_CHUNK_SIZE):
+        """
+            Stream all the webviewtemplates: they are parsed one by one while the response is read, in constant memory (not cached).
+
+            :param chunk_size int: The size of the chunks read from the response (bytes)
+            :raise APIError: On any error
+            :rtype: iter({...})
+            :return: The webviewtemplates
+        """
+        entities = stream_get(self.token, "webviewtemplates", "webviewtemplates", transport=self.transport, chunk_size=chunk_size)
+        return self._to_models("webviewtemplates", entities)
 
     @is_login
+    @invalidates("webviewtemplates")
+    @updates_store("webviewtemplates")
     def update_requirements_webviewtemplates(self, code, requirements):
         webviewtemplate = default_post({
             "token": self.token,
-            "requirements": requirements}, f"webviewtemplates/edit/{code}")["webviewtemplate"]
-        getLogger().info(f"Webviewtemplate {webviewtemplate['name']} edited!")
+            "requirements": requirements}, f"webviewtemplates/edit/{code}", transport=self.transport,
+            idempotent=True)["webviewtemplate"]
+        getLogger().info("Webviewtemplate %s edited!", webviewtemplate["name"])
         return webviewtemplate
@@ -1,21 +1,39 @@
+import copy
 import functools
+import inspect
+import time
 from .log import getLogger
-from .exceptions import APIError
+from .exceptions import APIError, AuthenticationError
+from .metrics import notify
+from .parameters import Schema
 
 
 def network_try_except(function):
     """
-        Wrap a function with a try/except and log on error
+        Wrap a function with a try/except and log on error (the function can be a coroutine function)
     """
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrap(*args, **kwargs):
+            try:
+                return await function(*args, **kwargs)
+            except APIError as e:
+                getLogger().error("Error from API call: %s", e)
+                raise e
+            except Exception as e:
+                getLogger().error("Error from API call: %s", e)
+                raise APIError(f"Error in the call for {function.__name__}: {e}")
+        return async_wrap
+
     @functools.wraps(function)
     def wrap(*args, **kwargs):
         try:
             return function(*args, **kwargs)
         except APIError as e:
-            getLogger().error(f"Error from API call: {e}")
+            getLogger().error("Error from API call: %s", e)
             raise e
         except Exception as e:
-            getLogger().error(f"Error from API call: {e}")
+            getLogger().error("Error from API call: %s", e)
             raise APIError(f"Error in the call for {function.__name__}: {e}")
     return wrap
 
@@ -23,37 +41,197 @@ def network_try_except(function):
 def is_login(function):
     """
         Check if the instance has a token (=is_login), if not, attempt to login.
+        If the server rejects the token (AuthenticationError, e.g: expired), the token is forgotten (instance & token store),
+        then the user is logged in again and the call is replayed once.
+        Works with the SPApi methods & the AsyncSPApi coroutine methods (the login is single-flight, See login()).
     """
+    def login_error(e):
+        getLogger().error("Failure to login the user: %s", e)
+        return APIError(f"The user must be logged")
+
+    def observe_login(instance, started_at):
+        # The wait for the login (performed by this call or another one), given to the observers of the transport
+        observers = instance.transport.observers if instance.transport else None
+        if observers:
+            notify(observers, "on_login", time.perf_counter() - started_at)
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrap(*args, **kwargs):
+            if not args[0]:
+                getLogger().critical("The decorator @is_login must get AsyncSPApi instance to be executed")
+                raise APIError("Invalid call for @is_login")
+            for attempt in range(2):
+                try:
+                    if not args[0].token:
+                        started_at = time.perf_counter()
+                        await args[0].login()
+                        observe_login(args[0], started_at)
+                except Exception as e:
+                    raise login_error(e)
+                token = args[0].token
+                try:
+                    return await function(*args, **kwargs)
+                except AuthenticationError:
+                    await args[0]._forget_token(token)
+                    if attempt:
+                        raise
+                    getLogger().warning("AsyncSPApi.%s: Token rejected, login again and replay the call", function.__name__)
+        return async_wrap
+
     @functools.wraps(function)
     def wrap(*args, **kwargs):
         if not args[0]:
-            getLogger().critical(f"The decorator @is_login must get SPApi instance to be executed")
+            getLogger().critical("The decorator @is_login must get SPApi instance to be executed")
             raise APIError("Invalid call for @is_login")
-        try:
-            if not args[0].token:
-                args[0].login()
-        except Exception as e:
-            getLogger().error(f"Failure to login the user")
-            raise APIError(f"The user must be logged")
-        return function(*args, **kwargs)
+        for attempt in range(2):
+            try:
+                if not args[0].token:
+                    started_at = time.perf_counter()
+                    args[0].login()
+                    observe_login(args[0], started_at)
+            except Exception as e:
+                raise login_error(e)
+            token = args[0].token
+            try:
+                return function(*args, **kwargs)
+            except AuthenticationError:
+                args[0]._forget_token(token)
+                if attempt:
+                    raise
+                getLogger().warning("SPApi.%s: Token rejected, login again and replay the call", function.__name__)
     return wrap
 
 
 def supported_parameters(parameters):
     """
-        Check if the given parameters are all supported
+        Check if the given parameters are all supported (the decorated function can be a coroutine function)
 
-        :param parameters [str]: List of str, which represents the supported parameters
+        :param parameters Schema/[str]: The schema of the call (See parameters.Schema), or the list of the supported parameters
     """
+    # Compiled once, when the function is decorated
+    schema = parameters if isinstance(parameters, Schema) else Schema(parameters)
+
+    def check_parameters(function, kwargs):
+        invalid_keys = schema.invalid_parameters(kwargs)
+        if invalid_keys:
+            for key in sorted(invalid_keys):
+                getLogger().error("Invalid parameter %s, not supported for %s", key, function.__name__)
+            raise APIError(f"Cancel call for {function.__name__}")
+
     def _supported_parameters(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrap(*args, **kwargs):
+                check_parameters(function, kwargs)
+                return await function(*args, **kwargs)
+            return async_wrap
+
+        @functools.wraps(function)
         def wrap(*args, **kwargs):
-            invalid_keys = False
-            for key, value in kwargs.items():
-                if key not in parameters:
-                    invalid_keys = True
-                    getLogger().error(f"Invalid parameter {key}, not supported for {function.__name__}")
-            if invalid_keys:
-                raise APIError(f"Cancel call for {function.__name__}")
+            check_parameters(function, kwargs)
             return function(*args, **kwargs)
         return wrap
     return _supported_parameters
+
+
+def cached(collection):
+    """
+        Read-through cache of a collection getter, if the instance has a cache (instance.cache), the cached value is returned until it expires
+        The entries are keyed by (collection, api_public_key, models), so a cache can be shared by several instances (with or without models)
+        Note: Put it above @is_login, so a cached value is returned without any login
+
+        :param collection str: The name of the collection (e.g: "medias")
+    """
+    def _cached(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrap(self, *args, **kwargs):
+                if self.cache is None:
+                    return await function(self, *args, **kwargs)
+                key = (collection, self.api_public_key, self.models)
+                found, value = self.cache.get(key)
+                if not found:
+                    value = await function(self, *args, **kwargs)
+                    self.cache.set(key, value)
+                return copy.copy(value)
+            return async_wrap
+
+        @functools.wraps(function)
+        def wrap(self, *args, **kwargs):
+            if self.cache is None:
+                return function(self, *args, **kwargs)
+            key = (collection, self.api_public_key, self.models)
+            found, value = self.cache.get(key)
+            if not found:
+                value = function(self, *args, **kwargs)
+                self.cache.set(key, value)
+            # Shallow copy: the caller can add/remove items without altering the cache
+            return copy.copy(value)
+        return wrap
+    return _cached
+
+
+def invalidates(*collections):
+    """
+        Invalidate the cached collections modified by a call (after the call, even on failure: the server may have applied it)
+        The entries of the api_public_key are removed, with & without models (See cached())
+
+        :param collections str: The names of the collections (e.g: "medias")
+    """
+    def _invalidates(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrap(self, *args, **kwargs):
+                try:
+                    return await function(self, *args, **kwargs)
+                finally:
+                    if self.cache is not None:
+                        for collection in collections:
+                            self.cache.invalidate((collection, self.api_public_key))
+            return async_wrap
+
+        @functools.wraps(function)
+        def wrap(self, *args, **kwargs):
+            try:
+                return function(self, *args, **kwargs)
+            finally:
+                if self.cache is not None:
+                    for collection in collections:
+                        self.cache.invalidate((collection, self.api_public_key))
+        return wrap
+    return _invalidates
+
+
+def updates_store(collection, remove=False):
+    """
+        Keep the entity store of the instance (instance.entity_store, if loaded) in sync with a call:
+        the entity returned by the call is added/replaced, or the entity of the code given as 1st argument is removed
+
+        :param collection str: The name of the collection (e.g: "medias")
+        :param remove bool: If True, the call deletes the entity of the code given as 1st argument
+    """
+    def sync_store(self, result, args, kwargs):
+        if self.entity_store is None:
+            return
+        if remove:
+            self.entity_store.remove(collection, args[0] if args else kwargs.get("code"))
+        else:
+            self.entity_store.upsert(collection, result)
+
+    def _updates_store(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrap(self, *args, **kwargs):
+                result = await function(self, *args, **kwargs)
+                sync_store(self, result, args, kwargs)
+                return result
+            return async_wrap
+
+        @functools.wraps(function)
+        def wrap(self, *args, **kwargs):
+            result = function(self, *args, **kwargs)
+            sync_store(self, result, args, kwargs)
+            return result
+        return wrap
+    return _updates_store
@@ -0,0 +1,98 @@
+import os
+
+from .batch import DEFAULT_MAX_WORKERS
+from .exceptions import APIError
+from .log import getLogger
+
+
+class DownloadManager:
+    """
+    Download the final medias of many (media, material) pairs in parallel, into the layout: {directory}/{material_code}/{media_code}.{ext}
+    Note: Create the SPApi with pool_maxsize >= max_workers so every worker keeps its connection alive.
+
+    Usage:
+        manager = DownloadManager(sp_api, "/data/store-42", max_workers=16)
+        manifest = manager.download_materialgroup(materialgroup_code)
+
+    :param SPApi sp_api: The client to use
+    :param str directory: The root directory of the downloaded files
+    :param int max_workers: The number of downloads in parallel
+    """
+
+    def __init__(self, sp_api, directory, max_workers=DEFAULT_MAX_WORKERS):
+        self.sp_api = sp_api
+        self.directory = directory
+        self.max_workers = max_workers
+
+    def get_filename(self, media_code, material_code):
+        """
+            :rtype: str
+            :return: The filename (no extension) of the final media of a pair
+        """
+        return os.path.join(self.directory, str(material_code), str(media_code))
+
+    def download(self, pairs, progress=None):
+        """
+            Download the final media of every (media_code, material_code) pair (the duplicated pairs are downloaded once)
+
+            :param pairs iter((str, str)): The (media_code, material_code) pairs
+            :param progress callable/None: Called after every download with (done, total)
+            :rtype: {"files": [{...}], "failures": [{...}]}
+            :return: The manifest: the files created {"media", "material", "path"} & the failures {"media", "material", "error"}
+        """
+        targets = list(dict.fromkeys((media_code, material_code) for media_code, material_code in pairs))
+        manifest = {"files": [], "failures": []}
+        results = self.sp_api.batch("download_final_media",
+                                    ({"media_code": media_code, "material_code": material_code,
+                                      "filename": self.get_filename(media_code, material_code)} for media_code, material_code in targets),
+                                    max_workers=self.max_workers)
+        for done, result in enumerate(results, start=1):
+            media_code, material_code = targets[result.index]
+            if result.success and result.result:
+                manifest["files"].append({"media": media_code, "material": material_code, "path": result.result})
+            else:
+                error = result.error or APIError("Invalid file response")
+                getLogger().warning("DownloadManager: Failure for media %s on material %s: %s", media_code, material_code, error)
+                manifest["failures"].append({"media": media_code, "material": material_code, "error": str(error)})
+            if progress:
+                progress(done, len(targets))
+        getLogger().info("DownloadManager: %d file(s) downloaded, %d failure(s)", len(manifest["files"]), len(manifest["failures"]))
+        return manifest
+
+    def download_materialgroup(self, materialgroup_code, media_codes=None, progress=None):
+        """
+            Download the final medias for every material of a materialgroup
+
+            :param materialgroup_code str: The code of the materialgroup
+            :param media_codes [str]/None: The medias to download on every material of the group, if None: the medias targeting the
+                                           group (material_groups field) on all its materials & the medias targeting some of its
+                                           materials (materials field) on these materials
+            :param progress callable/None: Called after every download with (done, total)
+            :raise APIError: If the materialgroup is not found
+            :rtype: {"files": [{...}], "failures": [{...}]}
+            :return: The manifest (See download())
+        """
+        materialgroup = next((m for m in self.sp_api.get_materialgroups() if m["code"] == materialgroup_code), None)
+        if not materialgroup:
+            raise APIError(f"Materialgroup {materialgroup_code} not found")
+        material_codes = get_codes(materialgroup.get("materials"))
+        if media_codes is not None:
+            return self.download(((media_code, material_code) for material_code in material_codes for media_code in media_codes),
+                                 progress=progress)
+        pairs = []
+        for media in self.sp_api.get_medias():
+            if materialgroup_code in get_codes(media.get("material_groups")):
+                pairs.extend((media["code"], material_code) for material_code in material_codes)
+            else:
+                targets = set(get_codes(media.get("materials")))
+                pairs.extend((media["code"], material_code) for material_code in material_codes if material_code in targets)
+        return self.download(pairs, progress=progress)
+
+
+def get_codes(values):
+    """
+        :param values [str/{...}]/None: A list of entities or of codes (e.g: the "materials" of a materialgroup)
+        :rtype: [str]
+        :return: The codes
+    """
+    return [value["code"] if isinstance(value, dict) else value for value in values or ()]
@@ -3,12 +3,14 @@ class APIError(RuntimeError):
     Exception for a API error, can be converted into an error
 
     :param string msg: The msg
+    :param int status_code: The HTTP status code of the response rejecting the request (None for the other errors, e.g: network)
     """
     status = 400
 
-    def __init__(self, msg):
+    def __init__(self, msg, status_code=None):
         super(APIError, self).__init__(msg)
         self.msg = msg
+        self.status_code = status_code
 
     def __str__(self):
         """
@@ -18,3 +20,12 @@ class APIError(RuntimeError):
         :rtype: string
         """
         return f"APIError: {self.msg}"
+
+
+class AuthenticationError(APIError):
+    """
+    Exception for a request rejected because of its token (401: expired, revoked or invalid)
+
+    :param string msg: The msg
+    """
+    status = 401
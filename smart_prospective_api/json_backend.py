@@ -0,0 +1,170 @@
+import codecs
+import json
+
+# The JSON parsers by preference, the first one installed is used (python3 -m pip install smart-prospective-api[speedups])
+BACKENDS = ("orjson", "ujson", "json")
+
+
+def get_loads(backend):
+    """
+        :param backend str: The name of the parser: "orjson", "ujson" or "json" (stdlib)
+        :raise ImportError: If the parser is not installed
+        :rtype: callable
+        :return: The loads function of the parser, which parses a JSON document from bytes (or str)
+    """
+    if backend == "orjson":
+        import orjson
+        return orjson.loads
+    if backend == "ujson":
+        import ujson
+        return ujson.loads
+    return json.loads
+
+
+def _select_backend():
+    """
+        :rtype: (str, callable)
+        :return: The name & loads function of the fastest parser installed
+    """
+    for backend in BACKENDS:
+        try:
+            return backend, get_loads(backend)
+        except ImportError:
+            continue
+
+
+# Chosen once, at import time
+BACKEND, loads = _select_backend()
+
+
+class JSONArrayParser:
+    """
+    Incremental parser of the array of a key in a JSON object (e.g: {"medias": [...]}), fed by chunks of bytes:
+    the entities are returned one by one as soon as they are complete, so the whole document is never in memory.
+    Only the top level object is scanned, the other keys are skipped.
+
+    Usage:
+        parser = JSONArrayParser("medias")
+        for chunk in chunks:
+            for media in parser.feed(chunk):
+                ...
+        parser.feed(b"", final=True)
+
+    :param str key: The key of the array
+    """
+    _INCOMPLETE = object()
+
+    def __init__(self, key):
+        self.key = key
+        self.found = False
+        self._buffer = ""
+        self._pos = 0
+        self._state = "object"
+        self._member = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json_decoder = json.JSONDecoder()
+
+    @property
+    def done(self):
+        """
+            True once the array is complete (the rest of the document can be ignored)
+        """
+        return self._state == "done"
+
+    def feed(self, chunk, final=False):
+        """
+            :param chunk bytes: The next chunk of the document
+            :param final bool: True for the last call (the end of the document)
+            :raise ValueError: If the document is invalid, incomplete (final) or has no array for the key
+            :rtype: [...]
+            :return: The entities completed by this chunk
+        """
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(chunk, final)
+        self._pos = 0
+        items = []
+        while self._step(items, final):
+            pass
+        if final and self._state != "done":
+            raise ValueError(f"Incomplete JSON document (no complete '{self.key}' array)")
+        return items
+
+    def _next_char(self):
+        """
+            :return: The next non whitespace character (the position is moved to it), None if the buffer is exhausted
+        """
+        buffer, pos = self._buffer, self._pos
+        length = len(buffer)
+        while pos < length and buffer[pos] in " \t\n\r":
+            pos += 1
+        self._pos = pos
+        return buffer[pos] if pos < length else None
+
+    def _value(self, final):
+        """
+            :return: The JSON value at the position (moved after it), _INCOMPLETE if more data is needed
+        """
+        try:
+            value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise
+            return self._INCOMPLETE
+        if end == len(self._buffer) and not final:
+            # e.g: a number can continue in the next chunk
+            return self._INCOMPLETE
+        self._pos = end
+        return value
+
+    def _step(self, items, final):
+        """
+            Parse the next token of the buffer
+
+            :return: True if the parsing can continue, False if more data is needed (or the array is complete)
+        """
+        char = self._next_char()
+        if char is None or self._state == "done":
+            return False
+        if self._state == "object":
+            if char != "{":
+                raise ValueError("Invalid JSON document, an object is expected")
+            self._pos += 1
+            self._state = "member"
+        elif self._state == "member":
+            if char == "}":
+                raise ValueError(f"No '{self.key}' array in the JSON document")
+            if char == ",":
+                self._pos += 1
+                return True
+            member = self._value(final)
+            if member is self._INCOMPLETE:
+                return False
+            self._member = member
+            self._state = "colon"
+        elif self._state == "colon":
+            if char != ":":
+                raise ValueError("Invalid JSON document, ':' is expected")
+            self._pos += 1
+            self._state = "array" if self._member == self.key else "skip"
+        elif self._state == "skip":
+            if self._value(final) is self._INCOMPLETE:
+                return False
+            self._state = "member"
+        elif self._state == "array":
+            if char != "[":
+                raise ValueError(f"'{self.key}' is not an array in the JSON document")
+            self._pos += 1
+            self.found = True
+            self._state = "item"
+        elif self._state == "item":
+            if char == "]":
+                self._pos += 1
+                self._state = "done"
+                return False
+            if char == ",":
+                self._pos += 1
+                return True
+            item = self._value(final)
+            if item is self._INCOMPLETE:
+                return False
+            items.append(item)
+        return True
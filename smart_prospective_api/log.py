@@ -1,82 +1,166 @@
-from .string import str_to_ascii
+import json
+import logging
+import os
+import re
+import time
+
+LOGGER_NAME = "smart-prospective-api"
+# The max length of a logged message (e.g: a response body), the rest is cut
+MAX_MESSAGE_LENGTH = 2000
+# The min length of the random part of an API key (See REDACTED_PATTERNS)
+KEY_MIN_LENGTH = 16
+# The secrets removed from the logged messages: the tokens (e.g: "?token=..."), the secret & public keys
+# (a key is "pub_" or "sec_" followed by at least KEY_MIN_LENGTH letters & digits, so "pub_date" is not a key)
+REDACTED_PATTERNS = (
+    (re.compile(r"(token=)[^&\s'\"]+"), r"\1***"),
+    (re.compile(r"""(["']?(?:token|api_secret_key|api_public_key|password)["']?\s*[:=]\s*["']?)[^"'&\s,}]+""", re.IGNORECASE),
+     r"\1***"),
+    (re.compile(r"\b(sec|pub)_[A-Za-z0-9]{%d,}\b" % KEY_MIN_LENGTH), r"\1_***"),
+)
+
+# The JSON mode: every message is logged as a JSON object (See set_json_logs())
+json_logs = os.environ.get("SMART_PROSPECTIVE_JSON_LOGS", "").lower() in ("1", "true", "yes")
+_loggers = {}
+
+
+def set_json_logs(enabled=True):
+    """
+    Enable the structured log mode: every message is logged as a JSON object {"time", "level", "logger", "event", "args"},
+    "event" is the message template (not formatted, so the high-volume runs can group the messages without parsing them).
+    Also enabled by the environment variable SMART_PROSPECTIVE_JSON_LOGS=1.
+
+    :param bool enabled: True for the JSON mode, False for the text mode
+    """
+    global json_logs
+    json_logs = enabled
+
+
+def redact(text):
+    """
+    Remove the secrets (tokens & keys) from a text and cut it to MAX_MESSAGE_LENGTH.
+
+    :param string text: The text to log
+    :rtype: str
+    """
+    if len(text) > MAX_MESSAGE_LENGTH:
+        text = f"{text[:MAX_MESSAGE_LENGTH]}... ({len(text)} chars)"
+    for pattern, replacement in REDACTED_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class LogMessage:
+    """
+    A message formatted only when a handler emits it (logging calls str() on the message):
+    the arguments are %-formatted then redacted, or dumped as a JSON object in the JSON mode.
+
+    :param string msg: The message, with %-style placeholders if args are given
+    :param tuple args: The arguments of the message
+    :param int level: The level of the message
+    :param string logger_name: The name of the logger
+    """
+    __slots__ = ("msg", "args", "level", "logger_name", "created_at")
+
+    def __init__(self, msg, args, level, logger_name):
+        self.msg = msg
+        self.args = args
+        self.level = level
+        self.logger_name = logger_name
+        self.created_at = time.time()
+
+    def __str__(self):
+        if json_logs:
+            return json.dumps({
+                "time": self.created_at,
+                "level": logging.getLevelName(self.level),
+                "logger": self.logger_name,
+                "event": redact(f"{self.msg}"),
+                "args": [redact(f"{arg}") for arg in self.args],
+            })
+        msg = f"{self.msg}"
+        if self.args:
+            msg = msg % self.args
+        return redact(msg)
 
 
 class Log:
     """
-    This class override logging system to fix encoding problem.
+    This class override logging system.
+    The messages are formatted lazily (%-style args, only if the level is enabled) and redacted (See redact()).
 
     :param string logger_name: The logger name, define in settings.
     """
     logger = None
 
     def __init__(self, logger_name):
-        import logging
         self.logger_name = logger_name
         self.logger = logging.getLogger(logger_name)
 
-    def debug(self, msg):
+    def isEnabledFor(self, level):
+        """
+        :param int level: The level (e.g: logging.DEBUG)
+        :rtype: bool
+        :return: True if a message of this level would be logged (to skip building costly messages)
+        """
+        return self.logger.isEnabledFor(level)
+
+    def _log(self, level, msg, args):
+        if not self.logger.isEnabledFor(level):
+            return
+        # Formatted by the handlers (See LogMessage), their formatting & encoding errors are reported by logging.Handler.handleError()
+        self.logger.log(level, LogMessage(msg, args, level, self.logger_name))
+
+    def debug(self, msg, *args):
         """
         Add a log message level 'debug'.
 
-        :param string msg: Message to log
+        :param string msg: Message to log (with %-style placeholders if args are given)
+        :param args: The arguments of the message
         """
-        try:
-            self.logger.debug(f"{msg}")
-        except:
-            self.logger.warning("Error logging format!")
-            self.logger.debug(str_to_ascii(f"{msg}"))
+        self._log(logging.DEBUG, msg, args)
 
-    def info(self, msg):
+    def info(self, msg, *args):
         """
         Add a log message level 'info'.
 
-        :param string msg: Message to log
+        :param string msg: Message to log (with %-style placeholders if args are given)
+        :param args: The arguments of the message
         """
-        try:
-            self.logger.info(f"{msg}")
-        except:
-            self.logger.warning("Error logging format!")
-            self.logger.info(str_to_ascii(f"{msg}"))
+        self._log(logging.INFO, msg, args)
 
-    def warning(self, msg):
+    def warning(self, msg, *args):
         """
         Add a log message level 'warning'.
 
-        :param string msg: Message to log
+        :param string msg: Message to log (with %-style placeholders if args are given)
+        :param args: The arguments of the message
         """
-        try:
-            self.logger.warning(f"{msg}")
-        except:
-            self.logger.warning("Error logging format!")
-            self.logger.warning(str_to_ascii(f"{msg}"))
+        self._log(logging.WARNING, msg, args)
 
-    def error(self, msg):
+    def error(self, msg, *args):
         """
         Add a log message level 'error'.
 
-        :param string msg: Message to log
+        :param string msg: Message to log (with %-style placeholders if args are given)
+        :param args: The arguments of the message
         """
-        try:
-            self.logger.error(f"{msg}")
-        except:
-            self.logger.warning("Error logging format!")
-            self.logger.error(str_to_ascii(f"{msg}"))
+        self._log(logging.ERROR, msg, args)
 
-    def critical(self, msg):
+    def critical(self, msg, *args):
         """
         Add a log message level 'critical'.
 
-        :param string msg: Message to log
+        :param string msg: Message to log (with %-style placeholders if args are given)
+        :param args: The arguments of the message
         """
-        try:
-            self.logger.critical(f"{msg}")
-        except:
-            self.logger.warning("Error logging format!")
-            self.logger.critical(str_to_ascii(f"{msg}"))
+        self._log(logging.CRITICAL, msg, args)
 
 
-def getLogger():
+def getLogger(logger_name=LOGGER_NAME):
     """
-    This function generate a Log object
+    This function return the Log object of the logger (created once)
     """
-    return Log("smart-prospective-api")
+    log = _loggers.get(logger_name)
+    if log is None:
+        log = _loggers.setdefault(logger_name, Log(logger_name))
+    return log
@@ -0,0 +1,285 @@
+from bisect import bisect_left
+import threading
+import time
+
+from .log import getLogger
+
+# The upper bounds of the latency histograms (seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# The timing phases of a request: connect (new connection only), time to first byte, body transfer
+PHASES = ("connect", "ttfb", "transfer")
+# The resources ending with a variable segment (code, category): prefix -> route, so the metrics are kept per route, not per entity
+PARAMETERIZED_RESOURCES = (
+    ("medias/add/", "medias/add/{category}"),
+    ("medias/edit/", "medias/edit/{code}"),
+    ("webviewtemplates/edit/", "webviewtemplates/edit/{code}"),
+)
+
+
+def get_route(resource):
+    """
+        :param resource str: The resource of a request (e.g: "medias/edit/med_xxx")
+        :rtype: str
+        :return: The route of the resource, the variable segment replaced by its name (e.g: "medias/edit/{code}")
+    """
+    resource = resource.partition("?")[0]
+    for prefix, route in PARAMETERIZED_RESOURCES:
+        if resource.startswith(prefix):
+            return route
+    return resource
+
+
+class RequestEvent:
+    """
+    An attempt of a request, given to the observers on start (status, bytes & phases not set yet) and on end.
+
+    :param str method: The HTTP method
+    :param str resource: The resource of the request (e.g: "medias/edit/med_xxx"), its route is set in route (See get_route())
+    :param str family: The family of the request (See ratelimit.get_family())
+    :param int attempt: The number of the attempt (0 for the first one, > 0 for a retried or hedged request)
+    """
+    __slots__ = ("method", "resource", "route", "family", "attempt", "started_at", "status_code", "bytes_sent", "bytes_received", "phases",
+                 "duration", "error")
+
+    def __init__(self, method, resource, family, attempt=0):
+        self.method = method
+        self.resource = resource
+        self.route = get_route(resource)
+        self.family = family
+        self.attempt = attempt
+        self.started_at = time.time()
+        self.status_code = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.phases = {"connect": 0.0, "ttfb": 0.0, "transfer": 0.0}
+        self.duration = None
+        self.error = None
+
+    def __repr__(self):
+        return f"RequestEvent({self.method} {self.resource} attempt={self.attempt} status={self.status_code} duration={self.duration})"
+
+
+class Observer:
+    """
+    Base class of the observers of the network layer (SPApi(..., observers=[...])), override the hooks to use.
+    The hooks are called from the threads (or the event loop) performing the requests, they must be fast & thread-safe.
+    An exception raised by a hook is logged and ignored.
+    """
+
+    def on_request_start(self, event):
+        """
+            Called before sending an attempt of a request
+
+            :param event RequestEvent: The attempt
+        """
+
+    def on_request_end(self, event):
+        """
+            Called when the response of an attempt is received (body included, except for the streamed responses), or on network error
+
+            :param event RequestEvent: The attempt (status_code, bytes, phases & duration set, or error)
+        """
+
+    def on_response_parsed(self, resource, seconds, size):
+        """
+            Called after the JSON body of a response is parsed
+
+            :param resource str: The resource of the request
+            :param seconds float: The parse duration
+            :param size int: The size of the body (bytes)
+        """
+
+    def on_login(self, seconds):
+        """
+            Called when a call had to wait for a login (@is_login), including the wait for a login performed by another thread
+
+            :param seconds float: The wait duration
+        """
+
+
+def notify(observers, hook, *args):
+    """
+        Call a hook of every observer (the errors of the observers are logged, never raised)
+
+        :param observers [Observer]: The observers
+        :param hook str: The name of the hook (e.g: "on_request_end")
+        :param args: The arguments of the hook
+    """
+    for observer in observers:
+        try:
+            getattr(observer, hook)(*args)
+        except Exception as e:
+            getLogger().warning("SPApi.metrics: The observer %r failed on %s: %s", observer, hook, e)
+
+
+class Histogram:
+    """
+    Cumulative histogram of values (Prometheus style: the count of every bucket includes the lower buckets)
+
+    :param tuple buckets: The sorted upper bounds of the buckets
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """
+            :rtype: {"buckets": {float: int}, "sum": float, "count": int}
+            :return: The cumulative count per upper bound ("+Inf" included), the sum & the count of the values
+        """
+        buckets = {}
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            buckets[bound] = total
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class MetricsCollector(Observer):
+    """
+    Observer aggregating the metrics of the requests per route (See get_route(), e.g: all the edits of medias are in "medias/edit/{code}",
+    so the number of metrics is bounded whatever the number of entities): latency histogram, time per phase, status codes, bytes,
+    attempts (retried & hedged), network errors & JSON parse time, and the login waits.
+    The metrics are exported as a dict (snapshot()) or in the Prometheus text format (to_prometheus()).
+
+    Usage: collector = MetricsCollector(); sp_api = SPApi(pub, sec, observers=[collector]); ...; print(collector.snapshot())
+
+    :param tuple buckets: The upper bounds of the latency histograms (seconds)
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._resources = {}
+        self._login = Histogram(self.buckets)
+        self._lock = threading.Lock()
+
+    def _resource(self, resource):
+        metrics = self._resources.get(resource)
+        if metrics is None:
+            metrics = self._resources[resource] = {
+                "requests": 0,
+                "retries": 0,
+                "errors": {},
+                "statuses": {},
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "phases": dict.fromkeys(PHASES + ("parse",), 0.0),
+                "latency": Histogram(self.buckets),
+                "parse": Histogram(self.buckets),
+            }
+        return metrics
+
+    def on_request_end(self, event):
+        with self._lock:
+            metrics = self._resource(event.route)
+            metrics["requests"] += 1
+            if event.attempt:
+                metrics["retries"] += 1
+            if event.error is not None:
+                name = type(event.error).__name__
+                metrics["errors"][name] = metrics["errors"].get(name, 0) + 1
+            else:
+                metrics["statuses"][event.status_code] = metrics["statuses"].get(event.status_code, 0) + 1
+            metrics["bytes_sent"] += event.bytes_sent
+            metrics["bytes_received"] += event.bytes_received
+            for phase, seconds in event.phases.items():
+                metrics["phases"][phase] += seconds
+            metrics["latency"].observe(event.duration)
+
+    def on_response_parsed(self, resource, seconds, size):
+        with self._lock:
+            metrics = self._resource(get_route(resource))
+            metrics["phases"]["parse"] += seconds
+            metrics["parse"].observe(seconds)
+
+    def on_login(self, seconds):
+        with self._lock:
+            self._login.observe(seconds)
+
+    def reset(self):
+        """
+            Remove all the collected metrics
+        """
+        with self._lock:
+            self._resources = {}
+            self._login = Histogram(self.buckets)
+
+    def snapshot(self):
+        """
+            :rtype: {"resources": {str: {...}}, "login_wait": {...}}
+            :return: A copy of the metrics per route (the histograms as returned by Histogram.snapshot()) & the login waits
+        """
+        with self._lock:
+            resources = {}
+            for resource, metrics in self._resources.items():
+                resources[resource] = {
+                    "requests": metrics["requests"],
+                    "retries": metrics["retries"],
+                    "errors": dict(metrics["errors"]),
+                    "statuses": dict(metrics["statuses"]),
+                    "bytes_sent": metrics["bytes_sent"],
+                    "bytes_received": metrics["bytes_received"],
+                    "phases": dict(metrics["phases"]),
+                    "latency": metrics["latency"].snapshot(),
+                    "parse": metrics["parse"].snapshot(),
+                }
+            return {"resources": resources, "login_wait": self._login.snapshot()}
+
+    def to_prometheus(self, prefix="smart_prospective"):
+        """
+            :param prefix str: The prefix of the metric names
+            :rtype: str
+            :return: The metrics in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        resources = snapshot["resources"]
+        lines = []
+
+        def header(name, kind, description):
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        def histogram(name, labels, values):
+            for bound, count in values["buckets"].items():
+                lines.append(f'{prefix}_{name}_bucket{{{labels}le="{bound}"}} {count}')
+            labels = f"{{{labels.rstrip(',')}}}" if labels else ""
+            lines.append(f"{prefix}_{name}_sum{labels} {values['sum']}")
+            lines.append(f"{prefix}_{name}_count{labels} {values['count']}")
+
+        header("requests_total", "counter", "Attempts of requests per resource & status code")
+        for resource, metrics in resources.items():
+            for status_code, count in metrics["statuses"].items():
+                lines.append(f'{prefix}_requests_total{{resource="{resource}",status="{status_code}"}} {count}')
+        header("request_errors_total", "counter", "Attempts of requests failed with a network error")
+        for resource, metrics in resources.items():
+            for error, count in metrics["errors"].items():
+                lines.append(f'{prefix}_request_errors_total{{resource="{resource}",error="{error}"}} {count}')
+        header("request_retries_total", "counter", "Retried & hedged attempts of requests")
+        for resource, metrics in resources.items():
+            lines.append(f'{prefix}_request_retries_total{{resource="{resource}"}} {metrics["retries"]}')
+        for direction in ("sent", "received"):
+            header(f"bytes_{direction}_total", "counter", f"Bytes {direction} (bodies)")
+            for resource, metrics in resources.items():
+                lines.append(f'{prefix}_bytes_{direction}_total{{resource="{resource}"}} {metrics["bytes_" + direction]}')
+        header("request_phase_seconds_total", "counter", "Time spent per phase of the requests (connect, ttfb, transfer, parse)")
+        for resource, metrics in resources.items():
+            for phase, seconds in metrics["phases"].items():
+                lines.append(f'{prefix}_request_phase_seconds_total{{resource="{resource}",phase="{phase}"}} {seconds}')
+        header("request_duration_seconds", "histogram", "Latency of the attempts of requests")
+        for resource, metrics in resources.items():
+            histogram("request_duration_seconds", f'resource="{resource}",', metrics["latency"])
+        header("json_parse_seconds", "histogram", "Parse time of the JSON responses")
+        for resource, metrics in resources.items():
+            histogram("json_parse_seconds", f'resource="{resource}",', metrics["parse"])
+        header("login_wait_seconds", "histogram", "Time waited by the calls for a login")
+        histogram("login_wait_seconds", "", snapshot["login_wait"])
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,210 @@
+"""
+    Compact entity models (opt-in: SPApi(..., models=True)), a lighter alternative to the dicts returned by the API:
+    the known fields are stored in __slots__ (no dict per entity), the unknown ones in a dict created only if needed.
+    The models keep the read access of a dict (entity["name"], entity.get("tags"), "code" in entity), so the dict based code keeps working.
+"""
+from .json_backend import loads
+from .parameters import USER_PARAMETERS, MATERIAL_PARAMETERS, MATERIALGROUP_PARAMETERS, _MEDIA_PARAMETERS
+
+# The fields returned for every entity
+COMMON_FIELDS = ("code", "name", "created_at", "updated_at")
+# The fields parsed from JSON on first access (entity.hidden_details), entity["hidden_details"] keeps the raw value
+LAZY_JSON_FIELDS = ("hidden_details", "webview_details")
+
+
+class LazyJSONField:
+    """
+    Descriptor of a JSON text field, parsed on first access only (the raw value is kept for the dict access & to_dict())
+
+    :param str name: The name of the field
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.raw_slot = f"_raw_{name}"
+        self.parsed_slot = f"_{name}"
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            return getattr(instance, self.parsed_slot)
+        except AttributeError:
+            pass
+        value = getattr(instance, self.raw_slot)
+        if isinstance(value, (str, bytes)) and value:
+            try:
+                value = loads(value)
+            except ValueError:
+                pass  # Not a JSON text: keep the raw value
+        setattr(instance, self.parsed_slot, value)
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.raw_slot, value)
+        try:
+            delattr(instance, self.parsed_slot)
+        except AttributeError:
+            pass
+
+
+class Entity:
+    """
+    Base class of the models: an entity of the API stored in __slots__ with the dict interface (get, items, [] read & write)
+    (the fields missing from the response are missing from the entity, like in the dict)
+
+    :param dict data: The entity returned by the API
+    """
+    __slots__ = ("_extra",)
+    # field -> slot, set by the model factory
+    _slot_names = {}
+
+    def __init__(self, data):
+        extra = None
+        slot_names = self._slot_names
+        for key, value in data.items():
+            slot = slot_names.get(key)
+            if slot is None:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+            else:
+                setattr(self, slot, value)
+        self._extra = extra
+
+    def __getattr__(self, name):
+        # Only called for the fields not in the slots (or not set)
+        if not name.startswith("_") and self._extra and name in self._extra:
+            return self._extra[name]
+        raise AttributeError(f"{type(self).__name__} has no field {name}")
+
+    def __getitem__(self, key):
+        slot = self._slot_names.get(key)
+        if slot is None:
+            if self._extra and key in self._extra:
+                return self._extra[key]
+            raise KeyError(key)
+        try:
+            return getattr(self, slot)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        slot = self._slot_names.get(key)
+        if slot is None:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        elif key in LAZY_JSON_FIELDS:
+            setattr(self, key, value)
+        else:
+            setattr(self, slot, value)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def keys(self):
+        """
+            :rtype: [str]
+            :return: The fields of the entity
+        """
+        keys = [field for field in self._slot_names if field in self]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def to_dict(self):
+        """
+            :rtype: {...}
+            :return: The entity as returned by the API (the lazy fields are not parsed)
+        """
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (Entity, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def make_model(name, fields):
+    """
+        Create a model class with a slot per field (+ a lazy descriptor for the LAZY_JSON_FIELDS)
+
+        :param name str: The name of the class
+        :param fields [str]: The known fields of the entity
+        :rtype: type
+    """
+    fields = list(dict.fromkeys(COMMON_FIELDS + tuple(fields)))
+    slot_names = {field: f"_raw_{field}" if field in LAZY_JSON_FIELDS else field for field in fields}
+    namespace = {
+        "__slots__": tuple(slot_names.values()) + tuple(f"_{field}" for field in fields if field in LAZY_JSON_FIELDS),
+        "_slot_names": slot_names,
+        "__doc__": f"Compact model of a {name} (See Entity)",
+    }
+    for field in fields:
+        if field in LAZY_JSON_FIELDS:
+            namespace[field] = LazyJSONField(field)
+    return type(name, (Entity,), namespace)
+
+
+User = make_model("User", USER_PARAMETERS)
+Material = make_model("Material", MATERIAL_PARAMETERS + ["status", "enable", "last_connection"])
+MaterialGroup = make_model("MaterialGroup", MATERIALGROUP_PARAMETERS)
+Building = make_model("Building", ["address", "city", "zip_code", "country", "picture", "picture_link"])
+Media = make_model("Media", _MEDIA_PARAMETERS + ["category", "enable", "creator", "duration", "file_input", "tags_text",
+                                                 "materials_text", "buildings_text", "material_groups_text", "post_accounts_text",
+                                                 "rss_post_accounts_text", "twitter_post_accounts_text", "instagram_post_accounts_text",
+                                                 "facebook_post_accounts_text"])
+WebviewTemplate = make_model("WebviewTemplate", ["comment", "requirements", "html", "picture"])
+
+MODELS = {
+    "users": User,
+    "materials": Material,
+    "materialgroups": MaterialGroup,
+    "buildings": Building,
+    "medias": Media,
+    "webviewtemplates": WebviewTemplate,
+}
+
+
+async def _iter_models_async(model, entities):
+    async for entity in entities:
+        yield model(entity)
+
+
+def to_models(collection, entities):
+    """
+        Convert the entities of a collection into models
+
+        :param collection str: The collection (e.g: "medias")
+        :param entities [{...}]/iter({...})/async iter({...}): The entities (a list, an iterator or an async iterator)
+        :return: The models (a list, an iterator or an async iterator, like the entities)
+    """
+    model = MODELS[collection]
+    if isinstance(entities, list):
+        return [model(entity) for entity in entities]
+    if hasattr(entities, "__aiter__"):
+        return _iter_models_async(model, entities)
+    return (model(entity) for entity in entities)
@@ -1,11 +1,335 @@
-from requests import get, post
+from requests import Session, RequestException
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout, ChunkedEncodingError
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+import base64
+import copy
+import hashlib
+import itertools
 import json
 import os
 import re
+import threading
+import time
 
-from .exceptions import APIError
+from .exceptions import APIError, AuthenticationError
+from .json_backend import loads, JSONArrayParser
 from .decorators import network_try_except
 from .log import getLogger
+from .metrics import RequestEvent, notify
+from .ratelimit import get_family
+from .retry import RetryPolicy
+from .upload import MultipartEncoder, UPLOAD_CHUNK_SIZE
+
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# The size of the chunks read from a streamed JSON response (See stream_get())
+STREAM_CHUNK_SIZE = 64 * 1024
+# The max number of results kept by a ValidatorCache
+DEFAULT_VALIDATOR_CACHE_MAXSIZE = 64
+# The max number of characters of a response body written in the error logs
+LOG_BODY_LENGTH = 1000
+# The network errors retried by the RetryPolicy
+RETRYABLE_EXCEPTIONS = (ConnectionError, Timeout, ChunkedEncodingError)
+# The time spent opening connections by the current thread (See TimedHTTPConnection)
+_connect_time = threading.local()
+
+
+class TimedHTTPConnection(HTTPConnection):
+    """
+    HTTP connection measuring its connect time (TCP), for the "connect" phase of the observed requests
+    """
+
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            super(TimedHTTPConnection, self).connect()
+        finally:
+            _connect_time.seconds = getattr(_connect_time, "seconds", 0.0) + time.perf_counter() - started_at
+
+
+class TimedHTTPSConnection(HTTPSConnection):
+    """
+    HTTPS connection measuring its connect time (TCP & TLS handshake), for the "connect" phase of the observed requests
+    """
+
+    def connect(self):
+        started_at = time.perf_counter()
+        try:
+            super(TimedHTTPSConnection, self).connect()
+        finally:
+            _connect_time.seconds = getattr(_connect_time, "seconds", 0.0) + time.perf_counter() - started_at
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class ValidatorCache:
+    """
+    Remember the validators (ETag, Last-Modified), the hash of the body & the parsed result of the GET requests per (resource, token),
+    in order to send conditional requests and reuse the parsed result on '304 Not Modified'.
+    Without validators, the hash of the body is used, so an unchanged body is not parsed again.
+    Note: The result is reused, only its first level is copied (the entities are shared between the calls, as with @cached)
+
+    :param int maxsize: The max number of results kept, the least recently used one is evicted when full
+    """
+
+    def __init__(self, maxsize=DEFAULT_VALIDATOR_CACHE_MAXSIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def request_headers(self, resource, token):
+        """
+            :rtype: {...}
+            :return: The conditional headers to send for the resource (empty if nothing is known)
+        """
+        entry = self._entries.get((resource, token))
+        headers = {}
+        if entry:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def lookup(self, resource, token, status_code, headers, body):
+        """
+            Find the previous result of a response which is not modified (304 or same body),
+            on a same body, the validators of the response replace the previous ones
+
+            :param resource str: The resource of the request
+            :param token str: The token of the request
+            :param status_code int: The status code of the response
+            :param headers {...}: The headers of the response
+            :param body bytes: The body of the response
+            :rtype: (bool, {...})
+            :return: (True, result) if the response is not modified, (False, None) otherwise
+        """
+        key = (resource, token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if status_code == 200 and hashlib.blake2b(body).digest() == entry["digest"]:
+                entry["etag"] = headers.get("etag")
+                entry["last_modified"] = headers.get("last-modified")
+            elif status_code != 304:
+                return False, None
+            self._entries.move_to_end(key)
+            result = entry["result"]
+        return True, copy_result(result)
+
+    def store(self, resource, token, headers, body, result):
+        """
+            Save the validators, the hash of the body & the parsed result of a '200 OK' response,
+            replace the ones of the previous response (& of the previous tokens)
+
+            :param resource str: The resource of the request
+            :param token str: The token of the request
+            :param headers {...}: The headers of the response
+            :param body bytes: The body of the response
+            :param result {...}: The parsed result
+            :rtype: {...}
+            :return: A copy of the result (See copy_result())
+        """
+        entry = {
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "digest": hashlib.blake2b(body).digest(),
+            "result": result
+        }
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == resource]:
+                del self._entries[key]
+            self._entries[(resource, token)] = entry
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return copy_result(result)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def copy_result(result):
+    """
+        :return: A copy of the first level of a JSON result (dict of lists), the entities are not copied
+    """
+    if isinstance(result, dict):
+        return {key: copy.copy(value) for key, value in result.items()}
+    return copy.copy(result)
+
+
+class Transport:
+    """
+    Pooled HTTP transport, keep the connections alive between the calls (no new TCP/TLS handshake on every request).
+    The connection pool is shared by all the threads, every thread uses its own requests.Session mounted on this pool,
+    so the transport can be used from many threads at once.
+
+    :param int pool_connections: The number of host pools to keep
+    :param int pool_maxsize: The max number of connections kept alive per host
+    :param bool pool_block: If True, wait for a free connection when the pool of a host is full (instead of opening a non pooled one)
+    :param RetryPolicy retry_policy: The retry policy of the requests (default: RetryPolicy())
+    :param RateLimiter rate_limiter: The rate limiter of the requests, optional (no limit if None)
+    :param list observers: The observers of the requests (See metrics.Observer), no overhead if empty
+    :param bool conditional_requests: If True, the GET requests are conditional & their parsed results are kept (See ValidatorCache)
+    """
+
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE, pool_block=False, retry_policy=None,
+                 rate_limiter=None, observers=None, conditional_requests=True):
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block)
+        # The pools open timed connections (the connect phase of the observed requests), a copy: the default dict is shared
+        self.adapter.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+        self.validators = ValidatorCache() if conditional_requests else None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.observers = list(observers or ())
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """
+            The requests.Session of the current thread (created on first use), mounted on the shared pool
+
+            :rtype: requests.Session
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = Session()
+            session.mount("https://", self.adapter)
+            session.mount("http://", self.adapter)
+            self._local.session = session
+        return session
+
+    def request(self, method, url, resource=None, idempotent=False, hedge=False, retry=True, attempts=None, **kwargs):
+        """
+            Perform a request through the pool, retried according to the retry policy
+
+            :param method str: The HTTP method
+            :param url str: The url of the request
+            :param resource str/None: The resource of the request (for the retry logs & stats, the url if None)
+            :param idempotent bool: If True, the request is retried on network errors & 5XX (429 is always retried)
+            :param hedge bool: If True, a hedged request can be sent when the response is slow (See RetryPolicy.hedge())
+            :param retry bool: If False, the request is sent once (e.g: a streamed body cannot be sent twice)
+            :param attempts itertools.count/None: The counter of the attempts given to the observers, to share with the
+                                                  requests retrying the same call (e.g: a resumed download), a new one if None
+            :rtype: requests.Response
+        """
+        policy = self.retry_policy
+        limiter = self.rate_limiter
+        resource = resource or url
+        family = get_family(method, resource)
+        attempts = attempts or itertools.count()
+
+        def send_once():
+            # Every attempt (retried or hedged) takes a token
+            if limiter:
+                limiter.acquire(family)
+            if self.observers:
+                response = self._observed_request(RequestEvent(method, resource, family, next(attempts)), url, kwargs)
+            else:
+                response = self.session.request(method, url, **kwargs)
+            if limiter:
+                limiter.feedback(family, response.status_code)
+            return response
+
+        def send():
+            response = send_once()
+            return policy.check(response.status_code, response.headers, response)
+
+        if not retry:
+            return send_once()
+
+        if hedge:
+            return policy.run(lambda: policy.hedge(send, resource), resource, idempotent=True, exceptions=RETRYABLE_EXCEPTIONS)
+        return policy.run(send, resource, idempotent=idempotent, exceptions=RETRYABLE_EXCEPTIONS)
+
+    def _observed_request(self, event, url, kwargs):
+        """
+            Perform an attempt of a request, measured & given to the observers (See metrics.Observer)
+
+            :param event RequestEvent: The attempt
+            :param url str: The url of the request
+            :param kwargs {...}: The arguments of requests.Session.request()
+            :rtype: requests.Response
+        """
+        observers = self.observers
+        notify(observers, "on_request_start", event)
+        _connect_time.seconds = 0.0
+        started_at = time.perf_counter()
+        try:
+            response = self.session.request(event.method, url, **kwargs)
+        except Exception as e:
+            event.duration = time.perf_counter() - started_at
+            event.phases["connect"] = _connect_time.seconds
+            event.error = e
+            notify(observers, "on_request_end", event)
+            raise
+        event.duration = time.perf_counter() - started_at
+        # elapsed: from sending the request to parsing the headers (connection included)
+        headers_received = min(response.elapsed.total_seconds(), event.duration)
+        event.phases["connect"] = _connect_time.seconds
+        event.phases["ttfb"] = max(0.0, headers_received - _connect_time.seconds)
+        event.status_code = response.status_code
+        event.bytes_sent = int(response.request.headers.get("Content-Length") or 0)
+        if kwargs.get("stream"):
+            # The body is read later by the caller
+            event.bytes_received = int(response.headers.get("Content-Length") or 0)
+        else:
+            event.phases["transfer"] = event.duration - headers_received
+            event.bytes_received = len(response.content)
+        notify(observers, "on_request_end", event)
+        return response
+
+    def get(self, url, resource=None, hedge=False, **kwargs):
+        """
+            Perform a GET request through the pool (always idempotent)
+
+            :rtype: requests.Response
+        """
+        return self.request("GET", url, resource=resource, idempotent=True, hedge=hedge, **kwargs)
+
+    def post(self, url, resource=None, idempotent=False, retry=True, **kwargs):
+        """
+            Perform a POST request through the pool
+
+            :rtype: requests.Response
+        """
+        return self.request("POST", url, resource=resource, idempotent=idempotent, retry=retry, **kwargs)
+
+    def close(self):
+        """
+            Close all the pooled connections
+        """
+        self.adapter.close()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport():
+    """
+        Return the transport used when no transport is given to the network functions (created on first use)
+
+        :rtype: Transport
+    """
+    global _default_transport
+    if _default_transport is None:
+        with _default_transport_lock:
+            if _default_transport is None:
+                _default_transport = Transport()
+    return _default_transport
 
 
 def get_server(subpath):
@@ -24,108 +348,635 @@ def get_server(subpath):
     return f"{server_url}/api{subpath}"
 
 
-def treat_response(response):
+def treat_json_body(status_code, url, body, observers=None, resource=None):
     """
-        Treat a request.Response from a get() or a post() by parsing in json the response and checking the status code of the request.
+        Parse in json the body of a response and check the status code of the request (shared by the sync & async network layers)
+        The body is parsed from bytes (no decoding into str) by the fastest parser installed (See json_backend)
 
-        :param response request.Response: The response to treat
+        :param status_code int: The HTTP status code of the response
+        :param url str: The url of the request (for the logs)
+        :param body str/bytes: The body of the response
+        :param observers [Observer]/None: The observers of the transport, the parse time is given to them (See metrics.Observer)
+        :param resource str/None: The resource of the request (for the observers)
         :rtype: {...}/None
+        :raise AuthenticationError: If status code is 401 (the token is rejected)
         :raise APIError: If status code is 4XX or 5XX
         :return: The JSON response. None otherwise (invalid JSON)
     """
+    started_at = time.perf_counter() if observers else None
     try:
-        json_response = json.loads(response.text)
+        json_response = loads(body)
     except Exception as err:
-        getLogger().error(f"SPApi.network: Invalid json response: {response.text}")
+        getLogger().error("SPApi.network: Invalid json response: %r", body[:LOG_BODY_LENGTH])
         json_response = None
-    if int(response.status_code / 100) in [4, 5]:
+    if observers:
+        notify(observers, "on_response_parsed", resource or url, time.perf_counter() - started_at, len(body))
+    if int(status_code / 100) in [4, 5]:
         # Error
-        getLogger().error(f"SPApi.network: Error from request:\nUrl:{response.url}\nResponse:{json_response}")
-        raise APIError(f"Invalid status code response: {response.status_code}")
+        getLogger().error("SPApi.network: Error from request:\nUrl:%s\nResponse:%.*s", url, LOG_BODY_LENGTH, json_response)
+        raise_status_error(status_code)
     return json_response
 
 
-def treat_file_response(response, filename=None):
+def raise_status_error(status_code):
+    """
+        :param status_code int: The 4XX/5XX status code of a response
+        :raise AuthenticationError: If status code is 401
+        :raise APIError: Otherwise
     """
-        Treat a request.Response with a file given from a get() or a post() by using response.content
+    if status_code == 401:
+        raise AuthenticationError(f"Invalid status code response: {status_code}", status_code=status_code)
+    raise APIError(f"Invalid status code response: {status_code}", status_code=status_code)
+
+
+def is_rejected(error):
+    """
+        :param error APIError: The error of a request
+        :rtype: bool
+        :return: True if the server rejected the request (4XX, except 429): it was not applied and it will be rejected again as is
+    """
+    return error.status_code is not None and 400 <= error.status_code < 500 and error.status_code != 429
+
+
+def treat_response(response, observers=None, resource=None):
+    """
+        Treat a request.Response from a get() or a post() by parsing in json the response and checking the status code of the request.
+
+        :param response request.Response: The response to treat
+        :param observers [Observer]/None: See treat_json_body()
+        :param resource str/None: See treat_json_body()
+        :rtype: {...}/None
+        :raise APIError: If status code is 4XX or 5XX
+        :return: The JSON response. None otherwise (invalid JSON)
+    """
+    # The raw bytes: response.text would decode the whole body first (and guess its charset if not given)
+    return treat_json_body(response.status_code, response.url, response.content, observers=observers, resource=resource)
+
+
+def get_response_filename(headers, filename=None):
+    """
+        Complete or set the filename of a file response, using its 'content-disposition' header
+        And create the folder of the filename if needed.
+
+        :param headers {...}: The headers of the response
+        :param filename str/None: The filename (no extension) to use, can include the path (absolute or relative)
+        :rtype: str
+        :raise OSError: If the folder cannot be created
+        :return: The filename to write (with extension)
+    """
+    try:
+        request_filename = re.findall("filename=(.+)", headers['content-disposition'])[0]
+        if not filename:
+            # If filename not given, use the one from the request
+            filename = request_filename
+        else:
+            # If filename given, only contact file extension
+            filename += "." + request_filename.split(".")[-1]
+    except Exception as e:
+        getLogger().warning("SPApi.network: Cannot find the filename in the request: %s, use default filename 'unknown'", headers)
+        filename = "unknown"
+    # Check folder from filename (create if if needed)
+    folder = os.path.dirname(filename)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)  # exist_ok: parallel downloads can create the same folder
+    return filename
+
+
+class DownloadWriter:
+    """
+    Write a downloaded file by chunks into a partial file (in the same folder), renamed atomically into the filename once complete and verified.
+    So the memory stays flat whatever the size of the file, and the filename never contains a partial file.
+    Usage: with DownloadWriter(filename, partial_filename) as writer: writer.write(chunk)
+
+    :param str filename: The final filename
+    :param str partial_filename: The partial file to write into
+    :param int offset: The number of bytes of the partial file to keep (resume), the file is written from scratch if 0
+    :param int total: The expected size of the complete file (None if unknown), checked on commit & given to the progress callback
+    :param tuple checksum: The (hashlib algorithm, digest) of the complete file to check on commit, optional
+    :param callable progress: Called after every chunk with (bytes_written, total), optional
+    :param bool keep_partial: If True, the partial file is kept on error (to resume it), removed otherwise
+    :param str validator: The validator of the file (See get_response_validator()), saved next to the kept partial file
+    """
+
+    def __init__(self, filename, partial_filename, offset=0, total=None, checksum=None, progress=None, keep_partial=False, validator=None):
+        self.filename = filename
+        self.partial_filename = partial_filename
+        self.total = total
+        self.checksum = checksum
+        self.progress = progress
+        self.keep_partial = keep_partial and bool(validator)
+        # The partial file is resumed only if the server confirms it is the same file (If-Range), so its validator is kept with it
+        if self.keep_partial:
+            with open(get_validator_filename(partial_filename), "w") as f:
+                f.write(validator)
+        else:
+            remove_file(get_validator_filename(partial_filename))
+        if offset:
+            self.file = open(partial_filename, "r+b")
+            self.file.seek(offset)
+            self.file.truncate()
+        else:
+            self.file = open(partial_filename, "wb")
+        self.bytes_written = offset
+
+    def write(self, chunk):
+        """
+            Write a chunk into the partial file
+
+            :param chunk bytes: The chunk
+        """
+        if not chunk:
+            return
+        self.file.write(chunk)
+        self.advance(len(chunk))
+
+    def advance(self, size):
+        """
+            Count the bytes of a chunk written into the partial file (the async client writes its chunks in a thread, then counts them
+            in the event loop, so the progress callback is always called from the event loop)
+
+            :param size int: The size of the chunk (bytes)
+        """
+        self.bytes_written += size
+        if self.progress:
+            self.progress(self.bytes_written, self.total)
+
+    def commit(self):
+        """
+            Close the partial file, verify it (size & checksum) and rename it into the final filename (atomic)
+
+            :raise APIError: If the file is not complete or corrupted (the partial file is removed)
+        """
+        self.file.close()
+        if self.total is not None and self.bytes_written != self.total:
+            self.remove_partial()
+            raise APIError(f"Incomplete download for {self.filename}: {self.bytes_written} bytes instead of {self.total}")
+        if self.checksum and hash_file(self.partial_filename, self.checksum[0]) != self.checksum[1]:
+            self.remove_partial()
+            raise APIError(f"Corrupted download for {self.filename}: {self.checksum[0]} checksum mismatch")
+        os.replace(self.partial_filename, self.filename)
+        remove_file(get_validator_filename(self.partial_filename))
+
+    def abort(self):
+        """
+            Close the partial file, and remove it if it cannot be resumed
+        """
+        self.file.close()
+        if not self.keep_partial:
+            self.remove_partial()
+
+    def remove_partial(self):
+        """
+            Remove the partial file & its validator (if any)
+        """
+        remove_file(self.partial_filename)
+        remove_file(get_validator_filename(self.partial_filename))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+def remove_file(filename):
+    """
+        Remove a file if it exists
+
+        :param filename str: The file to remove
+    """
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def get_validator_filename(partial_filename):
+    """
+        :param partial_filename str: The partial file of a download
+        :rtype: str
+        :return: The file holding the validator of the partial file (See get_response_validator())
+    """
+    return partial_filename + ".validator"
+
+
+def get_response_validator(headers):
+    """
+        :param headers {...}: The headers of a file response
+        :rtype: str/None
+        :return: The validator to send as 'If-Range' to resume the file: its strong ETag, or its 'Last-Modified' date (None if no one)
+    """
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("last-modified")
+
+
+def get_content_length(headers):
+    """
+        :param headers {...}: The headers of the response
+        :rtype: int/None
+        :return: The Content-Length of the response, None if not given
+    """
+    try:
+        return int(headers["content-length"])
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def get_content_range(headers):
+    """
+        :param headers {...}: The headers of a 206 response
+        :rtype: (int, int/None)/None
+        :return: The (first byte, complete size or None) of the 'Content-Range' header, None if invalid
+    """
+    match = re.match(r"bytes\s+(\d+)-\d+/(\d+|\*)", headers.get("content-range", ""))
+    if not match:
+        return None
+    return int(match.group(1)), None if match.group(2) == "*" else int(match.group(2))
+
+
+# Digest names (RFC 3230 & RFC 9530) -> hashlib algorithm
+DIGEST_ALGORITHMS = {"md5": "md5", "sha": "sha1", "sha-256": "sha256", "sha-512": "sha512"}
+
+
+def get_response_checksum(status_code, headers):
+    """
+        Find a checksum of the complete file in the headers of a file response:
+        'Repr-Digest' / 'Digest' (complete representation), 'Content-MD5' (only if the whole file is sent) or an ETag which is a MD5
+
+        :param status_code int: The status code of the response (200 or 206)
+        :param headers {...}: The headers of the response
+        :rtype: (str, bytes)/None
+        :return: The (hashlib algorithm, digest), None if the headers have no usable checksum
+    """
+    for header in ("repr-digest", "digest"):
+        for value in headers.get(header, "").split(","):
+            name, _, digest = value.strip().partition("=")
+            if name.lower() in DIGEST_ALGORITHMS and digest:
+                try:
+                    return DIGEST_ALGORITHMS[name.lower()], base64.b64decode(digest.strip(":"))
+                except ValueError:
+                    continue
+    if status_code == 200 and headers.get("content-md5"):
+        try:
+            return "md5", base64.b64decode(headers["content-md5"])
+        except ValueError:
+            pass
+    etag = headers.get("etag", "")
+    if re.fullmatch(r'"?[0-9a-fA-F]{32}"?', etag):
+        return "md5", bytes.fromhex(etag.strip('"'))
+    return None
+
+
+def hash_file(filename, algorithm):
+    """
+        Hash a file by chunks
+
+        :param filename str: The file to hash
+        :param algorithm str: The hashlib algorithm
+        :rtype: bytes
+        :return: The digest
+    """
+    file_hash = hashlib.new(algorithm)
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.digest()
+
+
+class RestartDownload(Exception):
+    """
+    Raised when a resumed download cannot continue the partial file (it is removed), the request must be sent again without Range
+    """
+
+
+class DownloadInterrupted(Exception):
+    """
+    Raised when the transfer of a file response is interrupted by a network error (the partial file is kept if it can be resumed)
+    """
+
+
+class Download:
+    """
+    A resumable download: the partial file is named after the request, so a failed download can be resumed by the next identical call
+    with a 'Range' request (if the server supports it, a full download otherwise).
+
+    :param {...} parameters: The data of the POST request (the token is ignored to name the partial file)
+    :param str resource: The resource of the request
+    :param str filename: The filename (no extension) to create, can include the path (See get_response_filename())
+    :param int chunk_size: The size of the chunks read from the response (bytes)
+    :param callable progress: Called after every chunk with (bytes_written, total_bytes or None)
+    """
+
+    def __init__(self, parameters, resource, filename=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.progress = progress
+        key = json.dumps([resource, sorted((k, str(v)) for k, v in (parameters or {}).items() if k != "token")])
+        folder, basename = os.path.split(filename or "")
+        self.partial_filename = os.path.join(folder, f".{basename or 'download'}.{hashlib.sha1(key.encode()).hexdigest()[:16]}.part")
+        self.offset = os.path.getsize(self.partial_filename) if os.path.isfile(self.partial_filename) else 0
+        self.validator = None
+        if self.offset:
+            try:
+                with open(get_validator_filename(self.partial_filename)) as f:
+                    self.validator = f.read().strip() or None
+            except OSError:
+                pass
+            if not self.validator:
+                # Nothing proves that the server still has the same file: download from scratch
+                getLogger().info("SPApi.network: No validator for %s, restart the download", self.partial_filename)
+                remove_file(self.partial_filename)
+                self.offset = 0
+
+    @property
+    def headers(self):
+        """
+            :rtype: {...}
+            :return: The headers of the request (Range & If-Range to resume the partial file: the server sends the whole file if it changed)
+        """
+        return {"Range": f"bytes={self.offset}-", "If-Range": self.validator} if self.offset else {}
+
+    def restart(self, reason):
+        """
+            Remove the partial file and ask for a new request from scratch
+
+            :raise RestartDownload: Always
+        """
+        getLogger().warning("SPApi.network: Cannot resume %s (%s), restart the download", self.partial_filename, reason)
+        remove_file(self.partial_filename)
+        remove_file(get_validator_filename(self.partial_filename))
+        self.offset = 0
+        self.validator = None
+        raise RestartDownload(reason)
+
+    def start(self, status_code, headers):
+        """
+            Check the response headers and prepare the writer of the file
+
+            :param status_code int: The status code of the response
+            :param headers {...}: The headers of the response
+            :raise RestartDownload: If the partial file cannot be resumed with this response
+            :raise OSError: If the folder cannot be created
+            :rtype: DownloadWriter/None
+            :return: The writer to use, None if an identical file is already downloaded (skip the transfer)
+        """
+        offset = 0
+        total = get_content_length(headers)
+        validator = get_response_validator(headers)
+        if status_code == 416 and self.offset:
+            self.restart("range not satisfiable")
+        if status_code == 206:
+            content_range = get_content_range(headers)
+            if not content_range or content_range[0] != self.offset or (content_range[1] is not None and content_range[1] < self.offset):
+                self.restart(f"invalid Content-Range: {headers.get('content-range')}")
+            if self.offset and validator and validator != self.validator:
+                self.restart(f"the file changed: {validator}")
+            offset, total = content_range
+            validator = validator or self.validator
+        elif self.offset:
+            # The file changed (If-Range) or the server does not support Range: the partial file is written from scratch
+            getLogger().info("SPApi.network: Full download instead of resuming %s (file changed or Range not supported)",
+                             self.partial_filename)
+        checksum = get_response_checksum(status_code, headers)
+        self.filename = get_response_filename(headers, self.filename)
+        if is_identical_file(self.filename, total, checksum, headers.get("last-modified")):
+            getLogger().info("SPApi.network: %s is already downloaded, skip the transfer", self.filename)
+            return None
+        keep_partial = status_code == 206 or headers.get("accept-ranges", "").lower() == "bytes"
+        return DownloadWriter(self.filename, self.partial_filename, offset=offset, total=total, checksum=checksum, progress=self.progress,
+                              keep_partial=keep_partial, validator=validator)
+
+
+def is_identical_file(filename, total, checksum=None, last_modified=None):
+    """
+        Check if a local file is identical to the file of a response: same size & same checksum
+        (or not older than the 'Last-Modified' header if no checksum is given)
+
+        :param filename str: The local file
+        :param total int/None: The size of the file of the response
+        :param checksum (str, bytes)/None: The (hashlib algorithm, digest) of the file of the response
+        :param last_modified str/None: The 'Last-Modified' header of the response
+        :rtype: bool
+    """
+    if total is None or not os.path.isfile(filename) or os.path.getsize(filename) != total:
+        return False
+    if checksum:
+        return hash_file(filename, checksum[0]) == checksum[1]
+    if last_modified:
+        try:
+            return parsedate_to_datetime(last_modified).timestamp() <= os.path.getmtime(filename)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def treat_file_response(response, filename=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None, download=None):
+    """
+        Treat a request.Response (stream=True) with a file given from a get() or a post() by writing its content by chunks
 
         :param response request.Response: The response to treat
         :param filename str/None: The filename (no extension) to create, can include the path (absolute or relative) (will be created if doesn't exist)
+        :param chunk_size int: The size of the chunks read from the response (bytes)
+        :param progress callable/None: Called after every chunk with (bytes_written, total_bytes or None)
+        :param download Download/None: The resumable download of the response (a new one if None, filename/chunk_size/progress are ignored if given)
         :rtype: str/None
-        :raise APIError: If status code is 4XX or 5XX / Folder cannot be created
+        :raise APIError: If status code is 4XX or 5XX / Folder cannot be created / The downloaded file is incomplete or corrupted
+        :raise RestartDownload: If the partial file of the download cannot be resumed with this response
+        :raise DownloadInterrupted: If the transfer is interrupted by a network error
         :return: The filepath created. None otherwise (invalid response)
     """
-    if int(response.status_code / 100) in [4, 5]:
-        # Error
-        getLogger().error(f"SPApi.network: Error from request:\nUrl:{response.url}\nResponse Status:{response.text}")
-        raise APIError(f"Invalid status code response: {response.status_code}")
-    try:
-        # Complete or Set filename
+    download = download or Download({"url": response.url}, "", filename=filename, chunk_size=chunk_size, progress=progress)
+    with response:
+        if int(response.status_code / 100) in [4, 5] and not (response.status_code == 416 and download.offset):
+            # Error
+            getLogger().error("SPApi.network: Error from request:\nUrl:%s\nResponse Status:%.*s", response.url, LOG_BODY_LENGTH, response.text)
+            raise_status_error(response.status_code)
         try:
-            request_filename = re.findall("filename=(.+)", response.headers['content-disposition'])[0]
-            if not filename:
-                # If filename not given, use the one from the request
-                filename = request_filename
-            else:
-                # If filename given, only contact file extension
-                filename += "." + request_filename.split(".")[-1]
-        except Exception as e:
-            getLogger().warning(f"SPApi.network: Cannot find the filename in the request: {response.headers}, use default filename 'unknown'")
-            filename = "unknown"
-        # Check folder from filename (create if if needed)
-        folder = os.path.dirname(filename)
-        if folder and not os.path.isdir(folder):
-            os.makedirs(folder)
-        with open(filename, "wb") as f:
-            # Write the file from the request content
-            f.write(response.content)
-    except Exception as err:
-        getLogger().error(f"SPApi.network: Invalid file response: {err}")
-        filename = None
+            writer = download.start(response.status_code, response.headers)
+            if writer:
+                with writer:
+                    # Write the file from the request content
+                    for chunk in response.iter_content(chunk_size=download.chunk_size):
+                        writer.write(chunk)
+                getLogger().info("SPApi.network: %d bytes written into %s", writer.bytes_written, download.filename)
+            filename = download.filename
+        except (APIError, RestartDownload):
+            raise
+        except RequestException as err:
+            raise DownloadInterrupted(f"Download of {download.filename} interrupted: {err}") from err
+        except Exception as err:
+            getLogger().error("SPApi.network: Invalid file response: %s", err)
+            filename = None
     return filename
 
 
 @network_try_except
-def default_get(token, resource):
+def default_get(token, resource, transport=None):
     """
         Perform a GET request, insert the token as GET parameter and finally treat the response (JSON)
+        The request is conditional (ETag/Last-Modified of the previous response), an unchanged response is not parsed again
 
         :param token str: The token (set in GET parameters)
         :param resource str: The resource to build the url (https://server_url/api/{resource})
+        :param transport Transport/None: The transport to use (default one if None)
         :rtype: {...}/None
         :raise APIError: See treat_response()
         :return: See treat_response()
     """
+    transport = transport or get_default_transport()
     url = get_server(f"/{resource}") + f"?token={token}"
-    return treat_response(get(url))
+    validators = transport.validators
+    headers = validators.request_headers(resource, token) if validators is not None else None
+    response = transport.get(url, resource=resource, hedge=True, headers=headers)
+    if validators is None:
+        return treat_response(response, transport.observers, resource)
+    not_modified, result = validators.lookup(resource, token, response.status_code, response.headers, response.content)
+    if not_modified:
+        getLogger().debug("SPApi.network: %s not modified", resource)
+        return result
+    if response.status_code == 304:
+        # The previous result was dropped meanwhile (e.g: replaced by the one of another token), request the whole response
+        getLogger().debug("SPApi.network: %s not modified but unknown, request it again", resource)
+        response = transport.get(url, resource=resource, hedge=True)
+    result = treat_response(response, transport.observers, resource)
+    if response.status_code != 200:
+        return result
+    return validators.store(resource, token, response.headers, response.content, result)
+
+
+def iter_response_items(response, key, chunk_size=STREAM_CHUNK_SIZE):
+    """
+        Parse the array of a key in a streamed JSON response (stream=True) and yield its items one by one (See JSONArrayParser)
+
+        :param response requests.Response: The response (status already checked)
+        :param key str: The key of the array (e.g: "medias")
+        :param chunk_size int: The size of the chunks read from the response (bytes)
+        :raise APIError: If the response is invalid or the connection is lost
+        :rtype: iter(...)
+    """
+    parser = JSONArrayParser(key)
+    with response:
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                yield from parser.feed(chunk)
+                if parser.done:
+                    return
+            yield from parser.feed(b"", final=True)
+        except (ValueError, RequestException) as e:
+            getLogger().error("SPApi.network: Invalid streamed response for %s: %s", key, e)
+            raise APIError(f"Invalid streamed response for {key}: {e}")
 
 
 @network_try_except
-def default_post(parameters, resource, files=None):
+def stream_get(token, resource, key, transport=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+        Perform a GET request, insert the token as GET parameter and return an iterator over the array of a key of the response,
+        parsed incrementally while the response is read (the memory stays flat whatever the size of the response)
+        Note: The API has no pagination, the whole collection is streamed in a single response
+
+        :param token str: The token (set in GET parameters)
+        :param resource str: The resource to build the url (https://server_url/api/{resource})
+        :param key str: The key of the array in the response (e.g: "medias")
+        :param transport Transport/None: The transport to use (default one if None)
+        :param chunk_size int: The size of the chunks read from the response (bytes)
+        :rtype: iter(...)
+        :raise APIError: See treat_response() (the status is checked before returning the iterator)
+        :return: See iter_response_items()
+    """
+    transport = transport or get_default_transport()
+    response = transport.get(get_server(f"/{resource}") + f"?token={token}", resource=resource, stream=True)
+    if int(response.status_code / 100) in [4, 5]:
+        with response:
+            treat_response(response)
+    return iter_response_items(response, key, chunk_size=chunk_size)
+
+
+@network_try_except
+def default_post(parameters, resource, files=None, transport=None, idempotent=False):
     """
         Perform a POST request and finally treat the response (JSON)
 
         :param parameters {...}: The data to use in the POST request
         :param resource str: The resource to build the url (https://server_url/api/{resource})
         :param files {...}: The files to insert
+        :param transport Transport/None: The transport to use (default one if None)
+        :param idempotent bool: If True, the request can be sent again safely, so it is retried on network errors & 5XX
         :rtype: {...}/None
         :raise APIError: See treat_response()
         :return: See treat_response()
     """
-    return treat_response(post(get_server(f"/{resource}"), data=parameters, files=files))
+    transport = transport or get_default_transport()
+    # The opened files cannot be sent twice, so a request with files is never retried
+    response = transport.post(get_server(f"/{resource}"), resource=resource, idempotent=idempotent, retry=not files, data=parameters, files=files)
+    return treat_response(response, transport.observers, resource)
 
 
 @network_try_except
-def post_to_download(parameters, resource, files=None, filename=None):
+def upload_file(parameters, resource, file, field="file", transport=None, chunk_size=UPLOAD_CHUNK_SIZE, progress=None):
     """
-        Perform a POST request and finally treat the file response (filepath)
+        Perform a multipart POST request with a file, streamed by chunks (never fully loaded in memory), and finally treat the response (JSON)
+
+        :param parameters {...}: The data to use in the POST request
+        :param resource str: The resource to build the url (https://server_url/api/{resource})
+        :param file str: The path of the file to upload
+        :param field str: The form field of the file
+        :param transport Transport/None: The transport to use (default one if None)
+        :param chunk_size int: The size of the chunks read from the file (bytes)
+        :param progress callable/None: Called while sending with (bytes_sent, total_bytes)
+        :rtype: {...}/None
+        :raise APIError: See treat_response() / The file cannot be read
+        :return: See treat_response()
+    """
+    transport = transport or get_default_transport()
+    encoder = MultipartEncoder(parameters, {field: file}, chunk_size=chunk_size, progress=progress)
+    # Never retried: the encoder cannot be sent twice
+    response = transport.post(get_server(f"/{resource}"), resource=resource, retry=False, data=encoder,
+                              headers={"Content-Type": encoder.content_type})
+    stats = encoder.stats
+    getLogger().info("SPApi.network: %d bytes uploaded in %.2fs (%.2f MB/s)", stats["bytes"], stats["seconds"],
+                     stats["bytes_per_second"] / 1024 / 1024)
+    return treat_response(response, transport.observers, resource)
+
+
+@network_try_except
+def post_to_download(parameters, resource, files=None, filename=None, transport=None, chunk_size=DOWNLOAD_CHUNK_SIZE, progress=None):
+    """
+        Perform a POST request and finally treat the file response (filepath), the file is streamed to the disk by chunks
+        A previous failed download of the same file is resumed (Range request), an identical local file is not downloaded again
+        and the downloaded file is verified (Content-Length & checksum headers)
+        A download interrupted by a network error is retried (and resumed) according to the retry policy of the transport
 
         :param parameters {...}: The data to use in the POST request
         :param resource str: The resource to build the url (https://server_url/api/{resource})
         :param files {...}: The files to insert
         :param filename str/None: The filename to create (See treat_file_response())
+        :param transport Transport/None: The transport to use (default one if None)
+        :param chunk_size int: The size of the chunks written to the disk (bytes)
+        :param progress callable/None: Called after every chunk with (bytes_written, total_bytes or None)
         :rtype: str/None
         :raise APIError: See treat_file_response()
         :return: See treat_file_response()
     """
-    return treat_file_response(post(get_server(f"/{resource}"), data=parameters, files=files), filename=filename)
+    transport = transport or get_default_transport()
+    # Shared by all the requests of the download, so the resumed transfers are observed as retries
+    attempts = itertools.count()
+
+    def download_once():
+        download = Download(parameters, resource, filename=filename, chunk_size=chunk_size, progress=progress)
+        try:
+            response = transport.post(get_server(f"/{resource}"), resource=resource, idempotent=True, retry=not files, attempts=attempts,
+                                      data=parameters, files=files, stream=True, headers=download.headers)
+            return treat_file_response(response, download=download)
+        except RestartDownload:
+            # The partial file has been removed, download from scratch
+            response = transport.post(get_server(f"/{resource}"), resource=resource, idempotent=True, retry=not files, attempts=attempts,
+                                      data=parameters, files=files, stream=True)
+            return treat_file_response(response, download=download)
+
+    # The requests are already retried by the transport, only retry (resume) the interrupted transfers here
+    return transport.retry_policy.run(download_once, resource, idempotent=True, exceptions=(DownloadInterrupted,))
@@ -0,0 +1,100 @@
+"""
+    Parameters supported by the API calls (shared by SPApi & AsyncSPApi)
+"""
+
+USER_PARAMETERS = ["first_name", "last_name", "email", "phone", "position", "password", "right_groups", "rights", "picture", "picture_link",
+                   "buildings", "materialgroups", "materials"]
+
+MATERIAL_PARAMETERS = ["name", "building", "link_code", "picture", "picture_link", "default_media", "time_to_invalid",
+                       "users", "division", "rotation", "bg_color", "width", "height", "player_config"]
+
+MATERIALGROUP_PARAMETERS = ["name", "comment", "materials", "buildings", "picture", "picture_link"]
+
+_MEDIA_PARAMETERS = ["name", "comment", "tags", "force_fullscreen", "lock", "buildings", "material_groups", "materials",
+                     "format_details", "condition_start", "condition_end", "condition_weather", "condition_time", "frequency",
+                     "print_min", "print_max", "animation_start", "animation_end", "hidden_details", "male", "female", "both", "age_zero_fifteen",
+                     "age_sixteen_twenty_eight", "age_twenty_nine_thirty_six", "age_thirty_seven_fifty", "age_fifty_one_ninty_nine",
+                     "interests", "pcs_farmer", "pcs_worker", "pcs_retirees", "pcs_intermediate_professions", "pcs_employee",
+                     "pcs_student", "pcs_unemployed", "pcs_craftsmen", "pcs_managment_nd_profession", "vistor_type_new",
+                     "vistor_type_frequent", "vistor_type_occasional", "vistor_type_everybody", "specific_duration", "keep_audio",
+                     "url", "file", "post_accounts", "webview_details", "webviewtemplate", "rss_post_accounts", "twitter_post_accounts",
+                     "instagram_post_accounts", "facebook_post_accounts", "banner_texts_details", "font", "font_size", "color", "bg_color",
+                     "bg_opacity", "speed", "position", "position_unset", "margin"]
+
+# "upload_progress" is used by the client only (progress callback of the file upload), not sent to the API
+# "file_input" is the code of a file already uploaded (See upload_media_file()), instead of "file"
+ADD_MEDIA_PARAMETERS = ["category", "upload_progress", "file_input"] + _MEDIA_PARAMETERS
+
+EDIT_MEDIA_PARAMETERS = ["code", "upload_progress", "file_input"] + _MEDIA_PARAMETERS
+
+
+# The list parameters of the media calls sent as text fields (values joined with ","): parameter -> field of the API
+MEDIA_TEXT_FIELDS = {
+    "post_accounts": "post_accounts_text",
+    "rss_post_accounts": "rss_post_accounts_text",
+    "twitter_post_accounts": "twitter_post_accounts_text",
+    "instagram_post_accounts": "instagram_post_accounts_text",
+    "facebook_post_accounts": "facebook_post_accounts_text",
+    "banner_texts_details": "banner_texts_details",
+    "tags": "tags_text",
+    "interests": "interests_text",
+}
+
+
+class Schema:
+    """
+    The parameters of an API call, compiled once: a frozenset for the validation & a table for the conversion of the list parameters
+    (See supported_parameters() & convert()), so the cost of a call depends on the number of given parameters only
+
+    :param list parameters: The supported parameters
+    :param dict text_fields: The list parameters sent as text fields {parameter: field of the API}
+    """
+    __slots__ = ("parameters", "text_fields")
+
+    def __init__(self, parameters, text_fields=None):
+        self.parameters = frozenset(parameters)
+        self.text_fields = dict(text_fields or {})
+
+    def invalid_parameters(self, kwargs):
+        """
+            :param kwargs {...}: The parameters of a call
+            :rtype: set
+            :return: The parameters not supported (empty if all are)
+        """
+        return kwargs.keys() - self.parameters
+
+    def convert(self, kwargs):
+        """
+            Convert the list parameters into the text fields expected by the API (e.g: "tags" -> "tags_text"), in one pass
+
+            :param kwargs {...}: The parameters of the call (updated in place)
+            :rtype: {...}
+            :return: The converted parameters
+        """
+        text_fields = self.text_fields
+        for key in [key for key in kwargs if key in text_fields]:
+            kwargs[text_fields[key]] = ",".join(kwargs.pop(key))
+        return kwargs
+
+
+USER_SCHEMA = Schema(USER_PARAMETERS)
+
+MATERIAL_SCHEMA = Schema(MATERIAL_PARAMETERS)
+
+MATERIALGROUP_SCHEMA = Schema(MATERIALGROUP_PARAMETERS)
+
+ADD_MEDIA_SCHEMA = Schema(ADD_MEDIA_PARAMETERS, MEDIA_TEXT_FIELDS)
+
+EDIT_MEDIA_SCHEMA = Schema(EDIT_MEDIA_PARAMETERS, MEDIA_TEXT_FIELDS)
+
+
+def convert_media_parameters(kwargs):
+    """
+        Convert the list fields of a media call into the text fields expected by the API (e.g: "tags" -> "tags_text")
+        Note: The "file" field must already be converted into "file_input" (upload)
+
+        :param kwargs {...}: The parameters of the call (updated in place)
+        :rtype: {...}
+        :return: The converted parameters
+    """
+    return ADD_MEDIA_SCHEMA.convert(kwargs)
@@ -0,0 +1,69 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .batch import _call
+
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_CREATE_WORKERS = 8
+
+
+def run_upload_pipeline(upload, create, iterable_of_kwargs, upload_workers=DEFAULT_UPLOAD_WORKERS, create_workers=DEFAULT_CREATE_WORKERS,
+                        queue_size=None):
+    """
+        Run a 2 stages pipeline over the items: the upload stage (upload_workers threads) prepares the items, and the create stage
+        (create_workers threads) calls the API with the prepared items, both stages run at the same time (the files are uploaded
+        while the items already uploaded are created). The results are yielded in completion order.
+        Backpressure: no new upload is started while queue_size uploaded items wait for the create stage, and the iterable is
+        consumed lazily, so it can be a generator of any size.
+
+        :param upload callable: The upload stage, called with the kwargs of an item (**kwargs), return the kwargs for the create stage
+        :param create callable: The create stage, called with the kwargs returned by the upload stage (**kwargs)
+        :param iterable_of_kwargs iter({...}): The items
+        :param upload_workers int: The number of threads of the upload stage
+        :param create_workers int: The number of threads of the create stage
+        :param queue_size int/None: The max number of items uploaded & waiting for the create stage (default: 2 * create_workers)
+        :rtype: iter(BatchResult)
+        :return: The result of every item: the result of the create stage, or the error of the failed stage (the kwargs of the
+                 result are the ones of the failed stage: an item failed on create is retried without uploading its file again)
+    """
+    items = enumerate(iterable_of_kwargs)
+    queue_size = queue_size or 2 * max(1, create_workers)
+    upload_executor = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix="sp-upload")
+    create_executor = ThreadPoolExecutor(max_workers=create_workers, thread_name_prefix="sp-create")
+    uploads = set()
+    creates = set()
+    # The uploaded items waiting for a free thread of the create stage: (index, kwargs)
+    ready = deque()
+    exhausted = False
+    try:
+        while True:
+            # Start the uploads, while a thread is free & the create stage is not overloaded
+            while not exhausted and len(uploads) < upload_workers and len(uploads) + len(ready) < queue_size:
+                try:
+                    index, kwargs = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                uploads.add(upload_executor.submit(_call, upload, index, kwargs))
+            while ready and len(creates) < create_workers:
+                index, kwargs = ready.popleft()
+                creates.add(create_executor.submit(_call, create, index, kwargs))
+            if not uploads and not creates:
+                return
+            done, _ = wait(uploads | creates, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch_result = future.result()
+                if future in uploads:
+                    uploads.remove(future)
+                    if batch_result.success:
+                        ready.append((batch_result.index, batch_result.result))
+                        continue
+                else:
+                    # On failure, the kwargs are the ones of the create stage (e.g: with the uploaded file) for the retry
+                    creates.remove(future)
+                yield batch_result
+    finally:
+        for future in uploads | creates:
+            future.cancel()
+        upload_executor.shutdown(wait=True)
+        create_executor.shutdown(wait=True)
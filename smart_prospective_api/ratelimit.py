@@ -0,0 +1,219 @@
+from contextlib import contextmanager
+import asyncio
+import json
+import os
+import threading
+import time
+
+from .exceptions import APIError
+from .log import getLogger
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows: only the in-process limiter can be used
+    fcntl = None
+
+FAMILIES = ("reads", "writes", "uploads", "downloads")
+# The requests per second of every family (the API limits are not published, tune them for your account)
+DEFAULT_RATES = {"reads": 20, "writes": 10, "uploads": 2, "downloads": 4}
+# The status codes meaning the server is throttling the client
+THROTTLE_STATUSES = (429, 503)
+DECREASE_FACTOR = 0.5
+INCREASE_STEPS = 20
+
+
+def get_family(method, resource):
+    """
+        :param method str: The HTTP method of the request
+        :param resource str: The resource of the request (e.g: "medias/upload")
+        :rtype: str
+        :return: The family of the request: "reads", "writes", "uploads" or "downloads"
+    """
+    if resource.startswith("medias/upload"):
+        return "uploads"
+    if resource.startswith("medias/download"):
+        return "downloads"
+    return "reads" if method == "GET" else "writes"
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: the tokens are refilled at `rate` per second up to `capacity` (the max burst).
+    A request takes a token, or waits until the bucket can give one (the tokens are reserved, so the waiters are served in order).
+    The rate is adaptive (AIMD): divided on throttling, then increased again step by step on success, up to the initial rate.
+
+    :param float rate: The number of requests per second
+    :param float capacity: The max number of requests sent at once (default: 1 second of requests)
+    :param float min_rate: The min rate on throttling (default: rate / 10)
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=None):
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 10
+        self.capacity = capacity or max(1, rate)
+        self.rate = rate
+        self.tokens = self.capacity
+        self.updated_at = time.time()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        """
+            Lock the state of the bucket (rate, tokens, updated_at) while it is read & modified
+        """
+        with self._lock:
+            yield
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + max(0, now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, tokens=1):
+        """
+            Take the tokens of a request, the bucket can be in debt (the next requests wait longer)
+
+            :param tokens float: The number of tokens to take
+            :rtype: float
+            :return: The delay to wait before sending the request (seconds)
+        """
+        with self._state():
+            self._refill()
+            self.tokens -= tokens
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def throttled(self):
+        """
+            Slow down the rate, the server is throttling the client (the bucket is emptied)
+        """
+        with self._state():
+            self._refill()
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            self.tokens = min(self.tokens, 0)
+        getLogger().warning("SPApi.ratelimit: Throttled by the server, rate decreased to %.2f/s", self.rate)
+
+    def succeeded(self):
+        """
+            Speed up the rate after a successful request (up to the initial rate)
+        """
+        if self.rate >= self.max_rate:
+            return
+        with self._state():
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate / INCREASE_STEPS)
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket shared between processes: its state is saved into a file, locked (fcntl.flock) while read & modified.
+    Every process using the same file shares the same budget (e.g: parallel jobs on the same machine).
+    Note: The state is read from the file on every reserve(), so a success at the max rate is not written (no file access)
+
+    :param str path: The file of the bucket (created if needed)
+    :param float rate: See TokenBucket
+    :param float capacity: See TokenBucket
+    :param float min_rate: See TokenBucket
+    """
+
+    def __init__(self, path, rate, capacity=None, min_rate=None):
+        if fcntl is None:
+            raise APIError("The shared rate limiter requires fcntl (not available on this platform)")
+        super(FileTokenBucket, self).__init__(rate, capacity=capacity, min_rate=min_rate)
+        self.path = path
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    @contextmanager
+    def _state(self):
+        with self._lock, open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                    self.rate, self.tokens, self.updated_at = state["rate"], state["tokens"], state["updated_at"]
+                except (ValueError, KeyError):
+                    pass  # New file: keep the initial state
+                yield
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"rate": self.rate, "tokens": self.tokens, "updated_at": self.updated_at}))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter of the requests, with a token bucket per family of requests (reads, writes, uploads & downloads).
+    An instance can be shared by many clients & threads, and by many processes if a directory is given.
+    When adaptive, the rate of a family is decreased when the server answers 429/503 and recovers on success.
+
+    Usage: sp_api = SPApi(pub, sec, rate_limiter=RateLimiter(rates={"writes": 5}, directory="/tmp/sp-ratelimit"))
+
+    :param dict rates: The requests per second per family (merged with DEFAULT_RATES), e.g: {"writes": 5}
+    :param dict capacities: The max burst per family (default: 1 second of requests)
+    :param str directory: If set, the buckets are saved into this directory and shared between processes (See FileTokenBucket)
+    :param bool adaptive: If True, the rates adapt to the throttling of the server
+    """
+
+    def __init__(self, rates=None, capacities=None, directory=None, adaptive=True):
+        rates = dict(DEFAULT_RATES, **(rates or {}))
+        capacities = capacities or {}
+        self.adaptive = adaptive
+        # The buckets saved into files wait for a lock held by other processes, not on the event loop (See acquire_async())
+        self.shared = bool(directory)
+        self.buckets = {}
+        for family in FAMILIES:
+            if directory:
+                self.buckets[family] = FileTokenBucket(os.path.join(directory, f"{family}.bucket"), rates[family],
+                                                       capacity=capacities.get(family))
+            else:
+                self.buckets[family] = TokenBucket(rates[family], capacity=capacities.get(family))
+
+    def acquire(self, family):
+        """
+            Wait until a request of the family can be sent
+
+            :param family str: The family of the request (See get_family())
+        """
+        delay = self.buckets[family].reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, family):
+        """
+            Coroutine version of acquire() (the event loop is not blocked while waiting, nor by the lock of a shared bucket)
+        """
+        if self.shared:
+            delay = await asyncio.get_running_loop().run_in_executor(None, self.buckets[family].reserve)
+        else:
+            delay = self.buckets[family].reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def feedback(self, family, status_code):
+        """
+            Adapt the rate of the family to the status code of a response
+
+            :param family str: The family of the request
+            :param status_code int: The status code of the response
+        """
+        if not self.adaptive:
+            return
+        if status_code in THROTTLE_STATUSES:
+            self.buckets[family].throttled()
+        elif status_code < 400:
+            self.buckets[family].succeeded()
+
+    async def feedback_async(self, family, status_code):
+        """
+            Coroutine version of feedback() (the lock of a shared bucket is taken in the default executor)
+        """
+        bucket = self.buckets[family]
+        # A success at the max rate does not access the file (See FileTokenBucket)
+        if self.shared and self.adaptive and (status_code in THROTTLE_STATUSES or bucket.rate < bucket.max_rate):
+            await asyncio.get_running_loop().run_in_executor(None, self.feedback, family, status_code)
+        else:
+            self.feedback(family, status_code)
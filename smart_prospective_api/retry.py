@@ -0,0 +1,279 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from email.utils import parsedate_to_datetime
+import asyncio
+import random
+import threading
+import time
+
+from .log import getLogger
+
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30
+DEFAULT_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# The status codes meaning the request has not been processed (can be retried even if not idempotent)
+REJECTED_STATUSES = (429,)
+HEDGE_SAMPLES = 100
+HEDGE_MIN_SAMPLES = 20
+
+
+class RetryableResponse(Exception):
+    """
+    Raised for a response with a retryable status code, carry the result to return if the retries are exhausted
+
+    :param int status_code: The status code of the response
+    :param dict headers: The headers of the response (for Retry-After)
+    :param result: The value to return if no retry is performed (e.g: the requests.Response), or the exception to raise
+    """
+
+    def __init__(self, status_code, headers, result):
+        super(RetryableResponse, self).__init__(f"Retryable status code: {status_code}")
+        self.status_code = status_code
+        self.headers = headers
+        self.result = result
+
+
+class RetryPolicy:
+    """
+    Retry policy of the network layer: exponential backoff with full jitter, Retry-After support,
+    retry only the requests safe to retry (GET, downloads & POST marked as idempotent, or rejected with 429),
+    and optional hedged reads (a duplicated GET is sent when the first one is slower than a percentile of the previous ones).
+
+    :param int max_retries: The max number of retries of a request (0 to disable the retries)
+    :param float backoff: The base delay (seconds), the delay of the retry n is random between 0 and backoff * 2^n
+    :param float max_backoff: The max delay between 2 attempts (seconds), also the max Retry-After honoured
+    :param tuple retry_statuses: The status codes to retry
+    :param float hedge_percentile: The latency percentile (e.g: 95) after which a duplicated GET is sent, None to disable the hedged reads
+    :param int hedge_workers: The number of threads used by the hedged reads (sync client)
+    """
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF,
+                 retry_statuses=DEFAULT_RETRY_STATUSES, hedge_percentile=None, hedge_workers=8):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        self.hedge_percentile = hedge_percentile
+        self.hedge_workers = hedge_workers
+        self.stats = {"retries": 0, "gave_up": 0, "hedged": 0, "hedge_wins": 0, "retries_by_resource": {}}
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def check(self, status_code, headers, result):
+        """
+            :raise RetryableResponse: If the status code must be retried
+            :return: The result (if the status code is not retryable)
+        """
+        if status_code in self.retry_statuses:
+            raise RetryableResponse(status_code, headers, result)
+        return result
+
+    def get_delay(self, attempt, headers=None):
+        """
+            :param attempt int: The number of the attempt which failed (0 for the first one)
+            :param headers {...}/None: The headers of the failed response (Retry-After)
+            :rtype: float
+            :return: The delay before the next attempt (seconds)
+        """
+        retry_after = (headers or {}).get("retry-after")
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return min(max(delay, 0), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _should_retry(self, attempt, idempotent, status_code=None):
+        """
+            :return: True if a new attempt can be performed
+        """
+        if attempt >= self.max_retries:
+            return False
+        return idempotent or status_code in REJECTED_STATUSES
+
+    def _count_retry(self, resource, attempt, delay, reason):
+        with self._lock:
+            self.stats["retries"] += 1
+            self.stats["retries_by_resource"][resource] = self.stats["retries_by_resource"].get(resource, 0) + 1
+        getLogger().warning("SPApi.retry: Retry %d/%d of %s in %.2fs (%s)", attempt + 1, self.max_retries, resource, delay, reason)
+
+    def _count_give_up(self):
+        with self._lock:
+            self.stats["gave_up"] += 1
+
+    def run(self, function, resource, idempotent=False, exceptions=()):
+        """
+            Call the function and retry it according to the policy
+
+            :param function callable: The function performing the request, raise RetryableResponse for a retryable status (See check())
+            :param resource str: The resource of the request (for the logs & stats)
+            :param idempotent bool: If True, the request can be sent again safely
+            :param exceptions tuple: The network exceptions to retry (e.g: connection errors)
+            :return: The result of the function (the result of the last RetryableResponse if the retries are exhausted, raised if an exception)
+        """
+        attempt = 0
+        while True:
+            try:
+                return function()
+            except RetryableResponse as e:
+                if not self._should_retry(attempt, idempotent, e.status_code):
+                    if attempt:
+                        self._count_give_up()
+                    if isinstance(e.result, Exception):
+                        raise e.result
+                    return e.result
+                delay = self.get_delay(attempt, e.headers)
+                close = getattr(e.result, "close", None)
+                if close:
+                    close()
+                self._count_retry(resource, attempt, delay, f"status {e.status_code}")
+            except exceptions as e:
+                if not self._should_retry(attempt, idempotent):
+                    if attempt:
+                        self._count_give_up()
+                    raise
+                delay = self.get_delay(attempt)
+                self._count_retry(resource, attempt, delay, f"{type(e).__name__}: {e}")
+            time.sleep(delay)
+            attempt += 1
+
+    async def run_async(self, function, resource, idempotent=False, exceptions=()):
+        """
+            Coroutine version of run(), the function must return a coroutine
+        """
+        attempt = 0
+        while True:
+            try:
+                return await function()
+            except RetryableResponse as e:
+                if not self._should_retry(attempt, idempotent, e.status_code):
+                    if attempt:
+                        self._count_give_up()
+                    if isinstance(e.result, Exception):
+                        raise e.result
+                    return e.result
+                delay = self.get_delay(attempt, e.headers)
+                self._count_retry(resource, attempt, delay, f"status {e.status_code}")
+            except exceptions as e:
+                if not self._should_retry(attempt, idempotent):
+                    if attempt:
+                        self._count_give_up()
+                    raise
+                delay = self.get_delay(attempt)
+                self._count_retry(resource, attempt, delay, f"{type(e).__name__}: {e}")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    # Hedged reads
+
+    def record_latency(self, resource, seconds):
+        """
+            Save the latency of a read (used to compute the hedge delay)
+        """
+        with self._lock:
+            self._latencies.setdefault(resource, deque(maxlen=HEDGE_SAMPLES)).append(seconds)
+
+    def get_hedge_delay(self, resource):
+        """
+            :rtype: float/None
+            :return: The delay after which a duplicated read is sent (the percentile of the previous latencies), None if no hedge
+        """
+        if self.hedge_percentile is None:
+            return None
+        with self._lock:
+            latencies = sorted(self._latencies.get(resource, ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))]
+
+    def _timed(self, resource, function):
+        started_at = time.monotonic()
+        result = function()
+        self.record_latency(resource, time.monotonic() - started_at)
+        return result
+
+    def hedge(self, function, resource):
+        """
+            Call a read function, and send a duplicated call if the first one is slower than the hedge delay (the first result wins)
+
+            :param function callable: The read function (must be safe to call twice)
+            :param resource str: The resource of the read
+            :return: The result of the fastest call
+        """
+        delay = self.get_hedge_delay(resource)
+        if delay is None:
+            return self._timed(resource, function)
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers)
+        first = self._executor.submit(self._timed, resource, function)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+        with self._lock:
+            self.stats["hedged"] += 1
+        getLogger().debug("SPApi.retry: %s slower than %.3fs, send a hedged request", resource, delay)
+        second = self._executor.submit(self._timed, resource, function)
+        done, pending = wait([first, second], return_when=FIRST_COMPLETED)
+        winner = done.pop()
+        if winner.exception() is not None and pending:
+            # The fastest one failed, wait for the other one
+            winner = pending.pop()
+            winner.exception()
+        loser = second if winner is first else first
+        loser.add_done_callback(_close_result)
+        if winner is second:
+            with self._lock:
+                self.stats["hedge_wins"] += 1
+        return winner.result()
+
+    async def hedge_async(self, function, resource):
+        """
+            Coroutine version of hedge(), the function must return a coroutine (the slowest call is cancelled)
+        """
+        delay = self.get_hedge_delay(resource)
+        started_at = time.monotonic()
+        first = asyncio.ensure_future(function())
+        if delay is not None:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if not done:
+                with self._lock:
+                    self.stats["hedged"] += 1
+                getLogger().debug("SPApi.retry: %s slower than %.3fs, send a hedged request", resource, delay)
+                second = asyncio.ensure_future(function())
+                done, pending = await asyncio.wait({first, second}, return_when=asyncio.FIRST_COMPLETED)
+                winner = done.pop()
+                if winner.exception() is not None and pending:
+                    # The fastest one failed, wait for the other one
+                    winner = pending.pop()
+                    await asyncio.wait({winner})
+                for task in (first, second):
+                    if task is not winner:
+                        task.cancel()
+                if winner is second:
+                    with self._lock:
+                        self.stats["hedge_wins"] += 1
+                result = winner.result()
+                self.record_latency(resource, time.monotonic() - started_at)
+                return result
+        result = await first
+        self.record_latency(resource, time.monotonic() - started_at)
+        return result
+
+
+def _close_result(future):
+    """
+        Close the response of a hedged call which lost the race
+    """
+    if future.exception() is None:
+        close = getattr(future.result(), "close", None)
+        if close:
+            close()
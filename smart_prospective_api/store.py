@@ -0,0 +1,184 @@
+import threading
+
+from .models import Entity
+
+
+def _code(value):
+    """
+        :return: The code of a reference, which can be the code itself or the entity (dict)
+    """
+    return value.get("code") if isinstance(value, dict) else value
+
+
+def _tag(value):
+    """
+        :return: The name of a tag, which can be the name itself or the tag (dict)
+    """
+    return value.get("name", value.get("code")) if isinstance(value, dict) else value
+
+
+def _codes(values):
+    """
+        :return: The set of codes of a list of references (None/empty if not a list)
+    """
+    if isinstance(values, str):
+        values = values.split(",")
+    return {_code(value) for value in values or [] if _code(value)}
+
+
+class EntityStore:
+    """
+    Indexed in-memory copy of the collections, to find the entities in constant time:
+    by code & by name (every collection), the materials by building, the materials <-> materialgroups membership and the medias by tag.
+    The store is kept in sync by the client calls (add/edit/delete) once loaded by SPApi.store().
+
+    Usage:
+        store = sp_api.store()
+        store.get("materials", code)
+        store.materials_in_building(building_code)
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        """
+            Remove all the entities & indexes
+        """
+        self.entities = {}
+        self._by_name = {}
+        self._materials_by_building = {}
+        self._materials_by_group = {}
+        self._groups_by_material = {}
+        self._medias_by_tag = {}
+
+    def load(self, collections):
+        """
+            Replace the content of the store
+
+            :param collections {str: [{...}]}: The entities per collection (e.g: {"medias": sp_api.get_medias(), ...})
+        """
+        with self._lock:
+            self._clear()
+            for collection, entities in collections.items():
+                self.entities.setdefault(collection, {})
+                for entity in entities:
+                    self.upsert(collection, entity)
+
+    @staticmethod
+    def _add_to(index, key, code):
+        index.setdefault(key, set()).add(code)
+
+    @staticmethod
+    def _remove_from(index, key, code):
+        codes = index.get(key)
+        if codes is not None:
+            codes.discard(code)
+            if not codes:
+                del index[key]
+
+    def _index(self, collection, entity, add):
+        """
+            Add (or remove) an entity from the indexes
+        """
+        update = self._add_to if add else self._remove_from
+        code = entity.get("code")
+        if entity.get("name") is not None:
+            update(self._by_name.setdefault(collection, {}), entity["name"], code)
+        if collection == "materials" and _code(entity.get("building")):
+            update(self._materials_by_building, _code(entity["building"]), code)
+        elif collection == "materialgroups":
+            for material_code in _codes(entity.get("materials")):
+                update(self._materials_by_group, code, material_code)
+                update(self._groups_by_material, material_code, code)
+        elif collection == "medias":
+            tags = entity.get("tags")
+            if tags is None and entity.get("tags_text"):
+                tags = entity["tags_text"].split(",")
+            for tag in tags or []:
+                update(self._medias_by_tag, _tag(tag), code)
+
+    def upsert(self, collection, entity):
+        """
+            Add or replace an entity (e.g: returned by add_media/edit_media)
+
+            :param collection str: The collection (e.g: "medias")
+            :param entity {...}/Entity: The entity (dict or model), must have a "code"
+        """
+        if not isinstance(entity, (dict, Entity)) or not entity.get("code"):
+            return
+        with self._lock:
+            entities = self.entities.setdefault(collection, {})
+            previous = entities.get(entity["code"])
+            if previous is not None:
+                self._index(collection, previous, add=False)
+            entities[entity["code"]] = entity
+            self._index(collection, entity, add=True)
+
+    def remove(self, collection, code):
+        """
+            Remove an entity (e.g: deleted by delete_media)
+
+            :param collection str: The collection (e.g: "medias")
+            :param code str: The code of the entity
+        """
+        with self._lock:
+            entity = self.entities.get(collection, {}).pop(code, None)
+            if entity is not None:
+                self._index(collection, entity, add=False)
+
+    def get(self, collection, code):
+        """
+            :rtype: {...}/None
+            :return: The entity of the collection with this code, None if not found
+        """
+        return self.entities.get(collection, {}).get(code)
+
+    def all(self, collection):
+        """
+            :rtype: [{...}]
+            :return: All the entities of the collection
+        """
+        with self._lock:
+            return list(self.entities.get(collection, {}).values())
+
+    def _get_all(self, collection, codes):
+        with self._lock:
+            entities = self.entities.get(collection, {})
+            return [entities[code] for code in codes or () if code in entities]
+
+    def find_by_name(self, collection, name):
+        """
+            :rtype: [{...}]
+            :return: The entities of the collection with this name
+        """
+        return self._get_all(collection, self._by_name.get(collection, {}).get(name))
+
+    def materials_in_building(self, building_code):
+        """
+            :rtype: [{...}]
+            :return: The materials of the building
+        """
+        return self._get_all("materials", self._materials_by_building.get(building_code))
+
+    def materials_in_group(self, materialgroup_code):
+        """
+            :rtype: [{...}]
+            :return: The materials of the materialgroup
+        """
+        return self._get_all("materials", self._materials_by_group.get(materialgroup_code))
+
+    def groups_of_material(self, material_code):
+        """
+            :rtype: [{...}]
+            :return: The materialgroups containing the material
+        """
+        return self._get_all("materialgroups", self._groups_by_material.get(material_code))
+
+    def medias_with_tag(self, tag):
+        """
+            :rtype: [{...}]
+            :return: The medias tagged with this tag
+        """
+        return self._get_all("medias", self._medias_by_tag.get(tag))
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+
+from .cache import COLLECTIONS
+from .exceptions import APIError
+from .log import getLogger
+from .models import Entity
+
+
+def hash_entity(entity):
+    """
+        :param entity {...}/Entity: The entity (dict or model)
+        :rtype: str
+        :return: The hash of the content of the entity (independent of the keys order)
+    """
+    if isinstance(entity, Entity):
+        entity = entity.to_dict()
+    return hashlib.blake2b(json.dumps(entity, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8"),
+                           digest_size=16).hexdigest()
+
+
+class SyncEngine:
+    """
+    Compute the changes of the collections since the last run: the added, changed & removed entities (by code), in linear time.
+    The snapshot (hash of every entity per collection) is saved in a JSON file between the runs.
+
+    Usage:
+        engine = SyncEngine(sp_api, "/var/lib/cms/sp-snapshot.json", on_added=create, on_changed=update, on_removed=delete)
+        engine.run()
+
+    :param SPApi sp_api: The client to use
+    :param str snapshot_filename: The file of the snapshot (created on the first run)
+    :param list collections: The collections to synchronize (default: all, e.g: ["medias", "materials"])
+    :param callable on_added: Called with (collection, entity) for every new entity, optional
+    :param callable on_changed: Called with (collection, entity) for every modified entity, optional
+    :param callable on_removed: Called with (collection, code) for every removed entity, optional
+    """
+
+    def __init__(self, sp_api, snapshot_filename, collections=COLLECTIONS, on_added=None, on_changed=None, on_removed=None):
+        self.sp_api = sp_api
+        self.snapshot_filename = snapshot_filename
+        self.collections = list(collections)
+        self.on_added = on_added
+        self.on_changed = on_changed
+        self.on_removed = on_removed
+        for collection in self.collections:
+            if collection not in COLLECTIONS:
+                raise APIError(f"Invalid collection to synchronize: {collection}")
+
+    def load_snapshot(self):
+        """
+            :rtype: {str: {str: str}}
+            :return: The snapshot of the last run {collection: {code: hash}} (empty on the first run)
+        """
+        if not os.path.isfile(self.snapshot_filename):
+            return {}
+        with open(self.snapshot_filename, "r") as f:
+            return json.load(f)
+
+    def save_snapshot(self, snapshot):
+        """
+            Save the snapshot (atomic: written into a temporary file renamed once complete)
+
+            :param snapshot {str: {str: str}}: The snapshot {collection: {code: hash}}
+        """
+        folder = os.path.dirname(self.snapshot_filename)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        temporary_filename = f"{self.snapshot_filename}.tmp"
+        with open(temporary_filename, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(temporary_filename, self.snapshot_filename)
+
+    def diff(self, collection, entities, previous):
+        """
+            Compute the changes of a collection
+
+            :param collection str: The collection
+            :param entities [{...}]: The current entities
+            :param previous {str: str}: The previous snapshot of the collection {code: hash}
+            :rtype: ({"added": [{...}], "changed": [{...}], "removed": [str]}, {str: str})
+            :return: The changes & the new snapshot of the collection
+        """
+        changes = {"added": [], "changed": [], "removed": []}
+        current = {}
+        for entity in entities:
+            code = entity.get("code")
+            if code is None:
+                continue
+            current[code] = entity_hash = hash_entity(entity)
+            previous_hash = previous.get(code)
+            if previous_hash is None:
+                changes["added"].append(entity)
+            elif previous_hash != entity_hash:
+                changes["changed"].append(entity)
+        changes["removed"] = [code for code in previous if code not in current]
+        return changes, current
+
+    def run(self):
+        """
+            Get the collections, compute & emit their changes since the last run, and save the new snapshot
+            Note: The snapshot is saved once every collection is processed (a failing callback means the changes are emitted again next run)
+
+            :raise APIError: On any error of the client
+            :rtype: {str: {"added": [{...}], "changed": [{...}], "removed": [str]}}
+            :return: The changes per collection
+        """
+        snapshot = self.load_snapshot()
+        all_changes = {}
+        for collection in self.collections:
+            entities = getattr(self.sp_api, f"get_{collection}")()
+            changes, snapshot[collection] = self.diff(collection, entities, snapshot.get(collection, {}))
+            all_changes[collection] = changes
+            for entity in changes["added"]:
+                if self.on_added:
+                    self.on_added(collection, entity)
+            for entity in changes["changed"]:
+                if self.on_changed:
+                    self.on_changed(collection, entity)
+            for code in changes["removed"]:
+                if self.on_removed:
+                    self.on_removed(collection, code)
+            getLogger().info("SyncEngine: %s: %d added, %d changed, %d removed", collection, len(changes["added"]), len(changes["changed"]),
+                             len(changes["removed"]))
+        self.save_snapshot(snapshot)
+        return all_changes
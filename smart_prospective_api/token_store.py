@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+from .log import getLogger
+from .upload_cache import get_default_cache_directory
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows: the file is still replaced atomically, but not locked between processes
+    fcntl = None
+
+
+class TokenStore:
+    """
+    Storage of the API tokens by api_public_key, shared by the clients so they skip the login when a valid token is known.
+    Subclass it to use another storage (e.g: Redis, a secret manager), the default implementation keeps the tokens in memory.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def lock(self, api_public_key):
+        """
+            Lock the token of an account while it is checked & refreshed (so only one login is performed)
+
+            :param api_public_key str: The account
+        """
+        with self._lock:
+            yield
+
+    def get(self, api_public_key):
+        """
+            :param api_public_key str: The account
+            :rtype: str/None
+            :return: The stored token of the account, None if unknown
+        """
+        return self._tokens.get(api_public_key)
+
+    def set(self, api_public_key, token):
+        """
+            :param api_public_key str: The account
+            :param token str: The new token of the account
+        """
+        self._tokens[api_public_key] = token
+
+    def delete(self, api_public_key, token=None):
+        """
+            Remove the token of an account (e.g: logout, token rejected)
+
+            :param api_public_key str: The account
+            :param token str/None: Only remove the stored token if it is this one (another client can have stored a new one), any if None
+        """
+        with self._lock:
+            if token is None or self._tokens.get(api_public_key) == token:
+                self._tokens.pop(api_public_key, None)
+
+
+class FileTokenStore(TokenStore):
+    """
+    Token store saved into a JSON file (readable by the owner only), locked between processes (fcntl.flock),
+    so the short-lived processes (cron jobs, serverless functions) share one token instead of logging in every time.
+
+    Usage: sp_api = SPApi(pub, sec, token_store=FileTokenStore())
+
+    :param str path: The JSON file (default: {cache directory}/tokens.json)
+    :param float max_age: The max age of a stored token (seconds), older tokens are ignored, no limit if None
+    """
+
+    def __init__(self, path=None, max_age=None):
+        super(FileTokenStore, self).__init__()
+        self.path = path or os.path.join(get_default_cache_directory(), "tokens.json")
+        self.max_age = max_age
+        self._lock_file = None
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    @contextmanager
+    def lock(self, api_public_key):
+        with self._lock:
+            if self._lock_file is not None:
+                # Already locked by this thread (e.g: set() during a login)
+                yield
+                return
+            with open(f"{self.path}.lock", "a") as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                self._lock_file = f
+                try:
+                    yield
+                finally:
+                    self._lock_file = None
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self):
+        """
+            :rtype: {str: {"token": str, "created_at": float}}
+            :return: The content of the file (empty if missing or invalid)
+        """
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, tokens):
+        """
+            Replace the content of the file (atomic, readable by the owner only)
+        """
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(tokens, f)
+        os.replace(temporary_path, self.path)
+
+    def get(self, api_public_key):
+        entry = self._read().get(api_public_key)
+        if not entry:
+            return None
+        if self.max_age is not None and entry.get("created_at", 0) + self.max_age < time.time():
+            getLogger().debug("FileTokenStore: The token of %s is too old", api_public_key)
+            return None
+        return entry.get("token")
+
+    def set(self, api_public_key, token):
+        with self.lock(api_public_key):
+            tokens = self._read()
+            tokens[api_public_key] = {"token": token, "created_at": time.time()}
+            self._write(tokens)
+
+    def delete(self, api_public_key, token=None):
+        with self.lock(api_public_key):
+            tokens = self._read()
+            entry = tokens.get(api_public_key)
+            if entry and (token is None or entry.get("token") == token):
+                del tokens[api_public_key]
+                self._write(tokens)
+                getLogger().info("FileTokenStore: The token of %s is removed", api_public_key)
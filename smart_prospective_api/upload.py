@@ -0,0 +1,117 @@
+import mimetypes
+import os
+import time
+import uuid
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class MultipartEncoder:
+    """
+    Streaming multipart/form-data body: the files are read by chunks while the request is sent, the body is never built in memory.
+    It can be given as data of a requests POST (file-like object with a known length) or iterated by chunks.
+
+    :param dict fields: The form fields (same encoding as requests: list values are repeated, None values are skipped)
+    :param dict files: The files to send (field name -> file path)
+    :param int chunk_size: The size of the chunks read from the files (bytes)
+    :param callable progress: Called after every read with (bytes_sent, total), optional
+    """
+
+    def __init__(self, fields=None, files=None, chunk_size=UPLOAD_CHUNK_SIZE, progress=None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.bytes_sent = 0
+        self.started_at = None
+        self.finished_at = None
+        # Every part is either bytes or the path of a file to stream
+        self._parts = []
+        for key, value in (fields or {}).items():
+            for value in (value if isinstance(value, (list, tuple)) else [value]):
+                if value is None:
+                    continue
+                self._parts.append(self._part_header(key) + b"\r\n")
+                self._parts.append(value if isinstance(value, bytes) else str(value).encode("utf-8"))
+                self._parts.append(b"\r\n")
+        for key, path in (files or {}).items():
+            filename = os.path.basename(path)
+            file_content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            self._parts.append(self._part_header(key, filename) + f"Content-Type: {file_content_type}\r\n\r\n".encode("utf-8"))
+            self._parts.append(path)
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{self.boundary}--\r\n".encode("utf-8"))
+        self.len = sum(os.path.getsize(part) if isinstance(part, str) else len(part) for part in self._parts)
+        self._iterator = self._iter_parts()
+        self._chunk = b""
+        self._offset = 0
+
+    def _part_header(self, name, filename=None):
+        """
+            :rtype: bytes
+            :return: The boundary & Content-Disposition of a part
+        """
+        disposition = f'form-data; name="{name.replace(chr(34), "%22")}"'
+        if filename is not None:
+            disposition += f'; filename="{filename.replace(chr(34), "%22")}"'
+        return f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n".encode("utf-8")
+
+    def _iter_parts(self):
+        """
+            Yield the body by chunks (the files are read lazily)
+        """
+        for part in self._parts:
+            if isinstance(part, bytes):
+                yield part
+                continue
+            with open(part, "rb") as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                    yield chunk
+
+    def __len__(self):
+        return self.len
+
+    def read(self, size=-1):
+        """
+            Read the next bytes of the body
+
+            :param size int: The max number of bytes to read (all the remaining bytes if < 0)
+            :rtype: bytes
+        """
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        remaining = self.len if size is None or size < 0 else size
+        pieces = []
+        while remaining > 0:
+            if self._offset >= len(self._chunk):
+                self._chunk = next(self._iterator, b"")
+                self._offset = 0
+                if not self._chunk:
+                    break
+            piece = self._chunk[self._offset:self._offset + remaining]
+            self._offset += len(piece)
+            remaining -= len(piece)
+            pieces.append(piece)
+        data = b"".join(pieces)
+        self.bytes_sent += len(data)
+        if data and self.progress:
+            self.progress(self.bytes_sent, self.len)
+        if self.bytes_sent >= self.len and self.finished_at is None:
+            self.finished_at = time.monotonic()
+        return data
+
+    def __iter__(self):
+        for chunk in iter(lambda: self.read(self.chunk_size), b""):
+            yield chunk
+
+    @property
+    def stats(self):
+        """
+            The upload statistics of the body
+
+            :rtype: {"bytes": int, "seconds": float, "bytes_per_second": float}
+        """
+        if self.started_at is None:
+            return {"bytes": 0, "seconds": 0.0, "bytes_per_second": 0.0}
+        seconds = (self.finished_at or time.monotonic()) - self.started_at
+        return {"bytes": self.bytes_sent, "seconds": seconds, "bytes_per_second": self.bytes_sent / seconds if seconds else 0.0}
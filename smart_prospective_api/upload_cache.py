@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .log import getLogger
+from .upload import UPLOAD_CHUNK_SIZE
+
+
+def get_default_cache_directory():
+    """
+        :rtype: str
+        :return: The cache directory of the library ($XDG_CACHE_HOME/smart-prospective-api or ~/.cache/smart-prospective-api)
+    """
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "smart-prospective-api")
+
+
+class UploadCache:
+    """
+    Persistent index (SQLite) of the uploaded files: content hash & size -> file returned by the server (e.g: its file_input code)
+    So an identical file is not uploaded again. The entries are scoped by account (api_public_key) and upload resource.
+
+    :param str path: The SQLite database file (default: {cache directory}/uploads.sqlite)
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(get_default_cache_directory(), "uploads.sqlite")
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS uploads (account TEXT NOT NULL, resource TEXT NOT NULL, sha256 TEXT NOT NULL, "
+                               "size INTEGER NOT NULL, file TEXT NOT NULL, created_at REAL NOT NULL, "
+                               "PRIMARY KEY (account, resource, sha256, size))")
+
+    def _connect(self):
+        """
+            :rtype: sqlite3.Connection
+            :return: A new connection (the connections are not shared between threads)
+        """
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def hash_file(file):
+        """
+            Hash a file by chunks (the file is never fully loaded in memory)
+
+            :param file str: The path of the file
+            :rtype: (str, int)
+            :return: The (sha256 hex digest, size) of the file
+        """
+        file_hash = hashlib.sha256()
+        size = 0
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                file_hash.update(chunk)
+                size += len(chunk)
+        return file_hash.hexdigest(), size
+
+    def get(self, account, resource, key):
+        """
+            :param account str: The account (api_public_key)
+            :param resource str: The upload resource (e.g: "medias/upload")
+            :param key (str, int): The (sha256, size) of the file (See hash_file())
+            :rtype: {...}/None
+            :return: The file returned by the server for this content, None if not uploaded yet
+        """
+        with self._lock, self._connect() as connection:
+            row = connection.execute("SELECT file FROM uploads WHERE account = ? AND resource = ? AND sha256 = ? AND size = ?",
+                                     (account, resource, key[0], key[1])).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, account, resource, key, file):
+        """
+            Save the file returned by the server for this content
+
+            :param account str: The account (api_public_key)
+            :param resource str: The upload resource (e.g: "medias/upload")
+            :param key (str, int): The (sha256, size) of the file (See hash_file())
+            :param file {...}: The file returned by the server
+        """
+        with self._lock, self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO uploads (account, resource, sha256, size, file, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                               (account, resource, key[0], key[1], json.dumps(file), time.time()))
+
+    def invalidate(self, account, resource, key):
+        """
+            Remove the entry of a content (e.g: the server rejects its code)
+
+            :param account str: The account (api_public_key)
+            :param resource str: The upload resource (e.g: "medias/upload")
+            :param key (str, int): The (sha256, size) of the file (See hash_file())
+        """
+        getLogger().info("UploadCache: Invalidate %s %s for %s", resource, key[0], account)
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM uploads WHERE account = ? AND resource = ? AND sha256 = ? AND size = ?",
+                               (account, resource, key[0], key[1]))
+
+    def clear(self):
+        """
+            Remove all the entries
+        """
+        with self._lock, self._connect() as connection:
+            connection.execute("DELETE FROM uploads")